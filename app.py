@@ -1,27 +1,212 @@
-from flask import Flask, request, jsonify, session, render_template, send_from_directory
+import click
+from flask import (Blueprint, Flask, Response, request, jsonify, session, render_template,
+                   current_app, g, has_app_context, stream_with_context)
 import sqlite3
-import hashlib
+import csv
+import atexit
+import io
+import json
 import secrets
-from datetime import datetime
+import threading
+import time
 import os
 
-app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)  # Generate a random secret key
+import assets
+import catalog
+import deckcache
+import deckexport
+import deckformat
+import metrics as metrics_module
+import migrations
+import quiz
+import reviewlog
+import search
+import scheduler
+import sessions
+import shards
+import stats
+import db
+from db import ConnectionPool
+from passwords import PasswordHasher, HasherBusy
+
+# Every route, hook and command; registered on the app by create_app()
+bp = Blueprint('flashcards', __name__, cli_group=None)
 
 DATABASE = 'flashcards.db'
 
-def get_db():
-    """Create a database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+# Deck storage split over this many shard files next to DATABASE (0: a single
+# file); see shards.py. DATABASE then only holds users.
+SHARD_COUNT = 0
+
+# Page sizes for GET /api/flashcards/due
+DUE_PAGE_SIZE = 100
+DUE_PAGE_MAX = 500
+
+# Page sizes for GET /api/flashcards?after_id=&limit= and rows per NDJSON chunk
+CARDS_PAGE_SIZE = 500
+CARDS_PAGE_MAX = 5000
+STREAM_BATCH_SIZE = 500
+
+# Page sizes for GET /api/flashcards/search
+SEARCH_PAGE_SIZE = 50
+SEARCH_PAGE_MAX = 200
+
+# GET /api/quiz/multiple-choice: default and maximum number of questions
+QUIZ_SIZE = 10
+QUIZ_MAX = 50
+
+# POST /api/flashcards/bulk: rows per executemany and per-row errors reported
+BULK_CHUNK_SIZE = 500
+BULK_MAX_ERRORS = 100
+
+# POST /api/reviews/batch: maximum reviews per request
+REVIEW_BATCH_MAX = 500
+# Integer fields of a review stored as sent (one without answers)
+REVIEW_STATE_FIELDS = ('level', 'correctCount', 'incorrectCount', 'streak')
+
+# POST /api/flashcards/delete-batch: maximum ids per request
+DELETE_BATCH_MAX = 5000
+
+# DELETE /api/flashcards/clear: cards deleted per transaction, pause between them
+PURGE_CHUNK_SIZE = 1000
+PURGE_PAUSE_SECONDS = 0.005
+
+# GET /api/history: default and maximum number of days
+HISTORY_DAYS = 90
+HISTORY_MAX_DAYS = 3660
+
+# Largest shift accepted by the bulk scheduling endpoints
+SCHEDULE_MAX_SHIFT_DAYS = 3650
+
+# Password hashing: worker processes, queued hashes before answering 503, scrypt cost
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+PASSWORD_SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+
+password_hasher = PasswordHasher(workers=PASSWORD_HASH_WORKERS,
+                                 max_pending=PASSWORD_HASH_MAX_PENDING,
+                                 scrypt_n=PASSWORD_SCRYPT_N)
+
+# Request and SQL instrumentation, exported at /metrics (see metrics.py)
+metrics = metrics_module.Metrics()
+
+# Encoded full-deck payloads of recently active users (see deckcache.py)
+deck_cache = deckcache.DeckCache(int(os.environ.get('DECK_CACHE_MAX_BYTES', deckcache.MAX_BYTES)))
+metrics.add_collector(deck_cache.collect)
+
+# Long-lived connections checked out per request (see db.py), with every
+# statement timed
+db_pool = ConnectionPool(factory=metrics.connection_factory())
+
+# Connections used outside an app context (scripts, atexit), kept by their
+# thread until close_db_connections()
+thread_connections = threading.local()
+
+# (DATABASE, SHARD_COUNT) layouts this process has migrated (see ensure_schema)
+schema_ready = set()
+schema_lock = threading.Lock()
+
+def deck_paths():
+    """Files holding deck tables: every shard, or DATABASE when unsharded"""
+    return shards.shard_paths(DATABASE, SHARD_COUNT) if SHARD_COUNT else [DATABASE]
+
+def get_db(user_id=None):
+    """Return the current request's connection to user_id's deck database
+
+    Without user_id (or unsharded), the main database, which holds users.
+    """
+    if user_id is None or not SHARD_COUNT:
+        path = DATABASE
+    else:
+        path = shards.shard_path(DATABASE, shards.shard_index(user_id, SHARD_COUNT))
+    ensure_schema()
+    return checkout(path)
+
+def checkout(path):
+    """Connection to path held by the app context (or thread), from the pool"""
+    if has_app_context():
+        connections = g.setdefault('db_connections', {})
+    else:
+        connections = getattr(thread_connections, 'connections', None)
+        if connections is None:
+            connections = thread_connections.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = db_pool.get(path)
     return conn
 
+def deck_databases():
+    """Connections to every deck database (maintenance commands)"""
+    ensure_schema()
+    return [checkout(path) for path in deck_paths()]
+
+def release_db(exception):
+    """Return the request's connections to the pool"""
+    for conn in g.pop('db_connections', {}).values():
+        db_pool.release(conn)
+
+def release_process_resources():
+    """Close the database connections and stop the password hashing processes"""
+    close_db_connections()
+    password_hasher.shutdown()
+
+def close_db_connections():
+    """Close all pooled connections, e.g. before removing the database file"""
+    global thread_connections
+    flush_review_log()
+    db_pool.close_all()
+    # Drop the closed connections held by the app context and by threads
+    if has_app_context():
+        g.pop('db_connections', None)
+    thread_connections = threading.local()
+    # The files may be replaced: check their schema again on next use
+    schema_ready.clear()
+    # Revisions restart if the files are replaced
+    deck_cache.clear()
+
+# Answers waiting to be appended to review_log (see reviewlog.py)
+review_log = reviewlog.ReviewLogBuffer()
+
+def log_reviews(rows):
+    """Buffer review_log rows and write them out once a batch is due"""
+    if review_log.add(rows):
+        review_log.flush(get_db)
+
+@atexit.register
+def flush_review_log():
+    """Write out any buffered review_log rows"""
+    if len(review_log):
+        review_log.flush(get_db)
+
+def ensure_schema():
+    """Migrate the databases on their first use by this process"""
+    if (DATABASE, SHARD_COUNT) in schema_ready:
+        return
+    with schema_lock:
+        if (DATABASE, SHARD_COUNT) not in schema_ready:
+            init_db()
+
 def init_db():
-    """Initialize the database with tables"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Bring the users database and every deck database to the latest schema
+
+    Returns {path: [names of the migration steps applied]}.
+    """
+    conn = checkout(DATABASE)
+    applied = {DATABASE: migrations.run(conn, 'users', USERS_MIGRATIONS)}
+    check_shard_layout(conn.cursor())
+    conn.commit()
+
+    for path in deck_paths():
+        applied[path] = applied.get(path, []) + migrate_deck(checkout(path))
+    schema_ready.add((DATABASE, SHARD_COUNT))
+    return applied
 
-    # Create users table
+def migrate_deck(conn):
+    """Bring a deck database to the latest schema; returns the steps applied"""
+    return migrations.run(conn, 'decks', DECK_MIGRATIONS)
+
+def create_users_schema(cursor):
+    """Create the tables of the main database"""
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -31,49 +216,228 @@ def init_db():
         )
     ''')
 
-    # Create flashcards table
+    # Server-side sessions (see sessions.py)
+    sessions.create_schema(cursor)
+
+    # Deployment settings that must not change silently (e.g. shard count)
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS flashcards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+def check_shard_layout(cursor):
+    """Refuse to start with a shard count other than the one the data uses"""
+    cursor.execute("SELECT value FROM settings WHERE key = 'shard_count'")
+    row = cursor.fetchone()
+    if row is None:
+        # Databases from before sharding hold their decks in DATABASE
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM users)')
+        stored = 0 if cursor.fetchone()[0] else SHARD_COUNT
+        cursor.execute("INSERT INTO settings (key, value) VALUES ('shard_count', ?)", (str(stored),))
+    else:
+        stored = int(row[0])
+    if stored != SHARD_COUNT:
+        raise RuntimeError(f'Les cartes sont réparties sur {stored} fichier(s) mais SHARD_COUNT vaut '
+                           f'{SHARD_COUNT} : lancez « flask split-shards » ou corrigez la configuration')
+
+def create_deck_schema(cursor):
+    """Create the tables holding decks (in DATABASE, or in every shard)
+
+    Their indexes are built by later migration steps (see DECK_MIGRATIONS).
+    """
+    # Shared card catalog, per-user progress rows and the flashcards view
+    # joining them; converts a flashcards table from before the split
+    catalog.create_schema(cursor)
+
+    # Per-user deck revision, bumped by every write to the user's cards
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deck_revisions (
+            user_id INTEGER PRIMARY KEY,
+            rev INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Tombstones of deleted cards for the delta sync feed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deleted_flashcards (
+            card_id INTEGER PRIMARY KEY,
             user_id INTEGER NOT NULL,
-            character TEXT NOT NULL,
-            pinyin TEXT,
-            zhuyin TEXT,
-            meaning TEXT NOT NULL,
-            level INTEGER DEFAULT 0,
-            last_review TIMESTAMP,
-            next_review TIMESTAMP NOT NULL,
-            correct_count INTEGER DEFAULT 0,
-            incorrect_count INTEGER DEFAULT 0,
-            streak INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            deleted_rev INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     ''')
 
-    conn.commit()
-    conn.close()
+    # Materialized per-user totals, maintained by triggers (see stats.py)
+    stats.create_schema(cursor)
+
+    # Append-only answer history and its daily rollups
+    reviewlog.create_schema(cursor)
+
+    # Distractor buckets for multiple-choice quizzes (see quiz.py)
+    quiz.create_schema(cursor)
+
+    # Full-text index of every user's cards (see search.py)
+    search.create_schema(cursor)
+
+# Schema migrations, applied in order on first use or by `flask migrate` (see
+# migrations.py). Append new steps; never edit or reorder released ones.
+USERS_MIGRATIONS = [
+    (1, 'users, sessions and settings', create_users_schema),
+]
+
+DECK_MIGRATIONS = [
+    (1, 'deck tables', create_deck_schema),
+    # Delta sync: tombstones WHERE user_id = ? AND deleted_rev > ?
+    (2, 'idx_deleted_flashcards_user_rev',
+     migrations.create_index('idx_deleted_flashcards_user_rev', 'deleted_flashcards (user_id, deleted_rev)')),
+    # Delta sync: WHERE user_id = ? AND updated_rev > ?
+    (3, 'idx_user_cards_user_updated_rev',
+     migrations.create_index('idx_user_cards_user_updated_rev', 'user_cards (user_id, updated_rev)')),
+    # Whole-deck reads and keyset pagination: WHERE user_id = ? ORDER BY id
+    (4, 'idx_user_cards_user', migrations.create_index('idx_user_cards_user', 'user_cards (user_id)')),
+    # Due-card queue: WHERE user_id = ? ORDER BY next_review
+    (5, 'idx_user_cards_user_next_review',
+     migrations.create_index('idx_user_cards_user_next_review', 'user_cards (user_id, next_review)')),
+    # Due checks compare next_review as strings: one format, UTC (see scheduler.py)
+    (6, 'review timestamps in UTC', scheduler.migrate_times),
+    # Review history: review_log WHERE user_id = ? AND day >= ?
+    (7, 'idx_review_log_user_day', migrations.create_index('idx_review_log_user_day', 'review_log (user_id, day)')),
+]
 
 def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash a password with a salted, memory-hard KDF (see passwords.py)"""
+    return password_hasher.hash(password)
+
+@bp.app_errorhandler(HasherBusy)
+def password_hasher_busy(error):
+    response = jsonify({'error': 'Serveur occupé, veuillez réessayer dans un instant'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def bump_revision(cursor, user_id):
+    """Increment the user's deck revision inside the current transaction"""
+    deck_cache.invalidate(user_id)
+    cursor.execute('''
+        INSERT INTO deck_revisions (user_id, rev) VALUES (?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET rev = rev + 1
+    ''', (user_id,))
+    cursor.execute('SELECT rev FROM deck_revisions WHERE user_id = ?', (user_id,))
+    return cursor.fetchone()[0]
+
+def get_revision(cursor, user_id):
+    """Return the user's current deck revision (0 if never written)"""
+    cursor.execute('SELECT rev FROM deck_revisions WHERE user_id = ?', (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+CARD_COLUMNS = '''id, character, pinyin, zhuyin, meaning, level, last_review, next_review,
+               correct_count, incorrect_count, streak'''
+
+def card_to_dict(row):
+    """Convert a flashcards row to its JSON representation"""
+    return {
+        'id': row['id'],
+        'character': row['character'],
+        'pinyin': row['pinyin'],
+        'zhuyin': row['zhuyin'],
+        'meaning': row['meaning'],
+        'level': row['level'],
+        'lastReview': row['last_review'],
+        'nextReview': row['next_review'],
+        'correctCount': row['correct_count'],
+        'incorrectCount': row['incorrect_count'],
+        'streak': row['streak']
+    }
+
+def parse_limit(value, default, maximum):
+    """Parse a ?limit= query parameter clamped to [1, maximum], None if invalid"""
+    if value is None:
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except ValueError:
+        return None
+
+def validate_card(character, pinyin, zhuyin, meaning):
+    """Return an error message for invalid card content, or None"""
+    if not character or not meaning:
+        return 'Caractère et signification requis'
+    if not pinyin and not zhuyin:
+        return 'Pinyin ou zhuyin requis'
+    return None
+
+def is_zhuyin(text):
+    """True if text is written in bopomofo (zhuyin) rather than pinyin"""
+    return any('\u3100' <= ch <= '\u312f' for ch in text)
+
+def card_from_json(item):
+    """Extract (character, pinyin, zhuyin, meaning) from a JSON import item"""
+    if not isinstance(item, dict):
+        return 'Format de carte invalide'
+    return (item.get('character'), item.get('pinyin', ''),
+            item.get('zhuyin', ''), item.get('meaning'))
+
+def parse_csv(stream):
+    """Yield (line number, card tuple or error message) from a CSV byte stream
 
-# Initialize database on startup
-init_db()
+    Rows are either character,pinyin,meaning (pinyin may be zhuyin) or
+    character,pinyin,zhuyin,meaning.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    for line, parts in enumerate(csv.reader(text), 1):
+        parts = [p.strip() for p in parts]
+        if not any(parts):
+            continue
+        if len(parts) >= 4:
+            yield line, (parts[0], parts[1], parts[2], parts[3])
+        elif len(parts) == 3:
+            if is_zhuyin(parts[1]):
+                yield line, (parts[0], '', parts[1], parts[2])
+            else:
+                yield line, (parts[0], parts[1], '', parts[2])
+        else:
+            yield line, 'Ligne incomplète (au moins 3 colonnes attendues)'
 
-# Serve static files
-@app.route('/')
+# Instrumentation
+@bp.before_app_request
+def start_request_timer():
+    metrics.start_request()
+
+@bp.after_app_request
+def record_request_metrics(response):
+    # Label by URL rule, not path, so card ids do not create new series
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.end_request(request.method, endpoint, response.status_code)
+    return response
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Static files: pages and the scripts/stylesheets they reference, fingerprinted
+# and gzipped in memory (see assets.py); nothing else in the directory is served
+static_assets = assets.AssetStore(os.path.dirname(os.path.abspath(__file__)),
+                                  ['login.html', 'chinese_review.html'])
+
+@bp.route('/')
 def index():
-    if 'user_id' not in session:
-        return send_from_directory('.', 'login.html')
-    return send_from_directory('.', 'chinese_review.html')
+    page = static_assets.page('chinese_review.html' if 'user_id' in session else 'login.html')
+    response = assets.send_asset(page, 'private, ' + assets.REVALIDATE, request)
+    response.vary.add('Cookie')
+    return response
 
-@app.route('/<path:path>')
+@bp.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory('.', path)
+    asset, cache_control = static_assets.lookup('/' + path)
+    if asset is None:
+        return jsonify({'error': 'Fichier introuvable'}), 404
+    return assets.send_asset(asset, cache_control, request)
 
 # Authentication endpoints
-@app.route('/api/register', methods=['POST'])
+@bp.route('/api/register', methods=['POST'])
 def register():
     data = request.json
     name = data.get('name')
@@ -88,16 +452,18 @@ def register():
     # Check if user already exists
     cursor.execute('SELECT id FROM users WHERE name = ?', (name,))
     if cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Ce nom d\'utilisateur existe déjà'}), 400
 
     # Create user
     password_hash = hash_password(password)
-    cursor.execute('INSERT INTO users (name, password_hash) VALUES (?, ?)',
-                   (name, password_hash))
+    try:
+        cursor.execute('INSERT INTO users (name, password_hash) VALUES (?, ?)',
+                       (name, password_hash))
+    except sqlite3.IntegrityError:
+        # Registered concurrently while the password was being hashed
+        return jsonify({'error': 'Ce nom d\'utilisateur existe déjà'}), 400
     conn.commit()
     user_id = cursor.lastrowid
-    conn.close()
 
     # Log user in
     session['user_id'] = user_id
@@ -105,7 +471,7 @@ def register():
 
     return jsonify({'success': True, 'user_name': name})
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def login():
     data = request.json
     name = data.get('name')
@@ -117,66 +483,353 @@ def login():
     conn = get_db()
     cursor = conn.cursor()
 
-    password_hash = hash_password(password)
-    cursor.execute('SELECT id, name FROM users WHERE name = ? AND password_hash = ?',
-                   (name, password_hash))
+    cursor.execute('SELECT id, name, password_hash FROM users WHERE name = ?', (name,))
     user = cursor.fetchone()
-    conn.close()
 
-    if not user:
+    if not user or not password_hasher.verify(password, user['password_hash']):
         return jsonify({'error': 'Nom d\'utilisateur ou mot de passe incorrect'}), 401
 
+    # Upgrade legacy SHA-256 hashes (and outdated cost settings) transparently
+    if password_hasher.needs_rehash(user['password_hash']):
+        cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                       (hash_password(password), user['id']))
+        conn.commit()
+
     session['user_id'] = user['id']
     session['user_name'] = user['name']
 
     return jsonify({'success': True, 'user_name': user['name']})
 
-@app.route('/api/logout', methods=['POST'])
+@bp.route('/api/logout', methods=['POST'])
 def logout():
     session.clear()
     return jsonify({'success': True})
 
-@app.route('/api/check-auth', methods=['GET'])
+@bp.route('/api/check-auth', methods=['GET'])
 def check_auth():
     if 'user_id' in session:
         return jsonify({'authenticated': True, 'user_name': session.get('user_name')})
     return jsonify({'authenticated': False})
 
 # Flashcard endpoints
-@app.route('/api/flashcards', methods=['GET'])
+@bp.route('/api/flashcards', methods=['GET'])
 def get_flashcards():
     if 'user_id' not in session:
         return jsonify({'error': 'Non authentifié'}), 401
 
-    conn = get_db()
+    after_id = request.args.get('after_id', '0')
+    if not after_id.isdigit():
+        return jsonify({'error': 'Paramètre after_id invalide'}), 400
+    after_id = int(after_id)
+
+    paginated = 'limit' in request.args or 'after_id' in request.args
+    limit = parse_limit(request.args.get('limit'), CARDS_PAGE_SIZE, CARDS_PAGE_MAX)
+    if limit is None:
+        return jsonify({'error': 'Paramètre limit invalide'}), 400
+
+    ndjson = wants_ndjson()
+    fmt = deckformat.JSON if ndjson else deckformat.negotiate(request)
+    if fmt is None:
+        return jsonify({'error': 'Paramètre format invalide'}), 400
+    fields = deckformat.parse_fields(request.args.get('fields'))
+    if fields is None:
+        return jsonify({'error': 'Paramètre fields invalide'}), 400
+    variant = deckformat.variant(fmt, fields)
+
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, character, pinyin, zhuyin, meaning, level, last_review, next_review,
-               correct_count, incorrect_count, streak
+
+    # Unchanged deck: answer from the revision counter alone
+    rev = get_revision(cursor, session['user_id'])
+    etag = deck_etag(session['user_id'], rev, variant)
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(etag + '-gz'):
+        return with_deck_revision(Response(status=304), session['user_id'], rev, variant)
+
+    if ndjson:
+        return with_deck_revision(stream_flashcards(session['user_id'], after_id), session['user_id'], rev)
+
+    if not paginated:
+        payload = deck_cache.get(session['user_id'], rev, variant)
+        if payload is None:
+            cursor.execute(f'''
+                SELECT {deckformat.select_list(fields)}
+                FROM flashcards
+                WHERE user_id = ?
+                ORDER BY id
+            ''', (session['user_id'],))
+
+            flashcards = deckformat.cards(cursor.fetchall(), fields, fmt)
+            payload = deckformat.encode(flashcards, fmt, current_app.json.dumps)
+            deck_cache.put(session['user_id'], rev, payload, variant)
+
+        return with_deck_revision(send_deck(payload, fmt, session['user_id'], rev, variant),
+                                  session['user_id'], rev, variant)
+
+    # Keyset pagination: ?after_id=<last id of previous page>&limit=
+    # (id is selected last for the next cursor, whatever the fields)
+    cursor.execute(f'''
+        SELECT {deckformat.select_list(fields)}, id
+        FROM flashcards
+        WHERE user_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (session['user_id'], after_id, limit))
+
+    rows = cursor.fetchall()
+    next_after_id = rows[-1]['id'] if len(rows) == limit else None
+    payload = deckformat.encode({'cards': deckformat.cards(rows, fields, fmt), 'nextAfterId': next_after_id},
+                                fmt, current_app.json.dumps)
+
+    return with_deck_revision(send_deck(payload, fmt), session['user_id'], rev, variant)
+
+def send_deck(payload, fmt, user_id=None, rev=None, variant=''):
+    """Response for an encoded deck, gzipped if large enough and accepted
+
+    With user_id and rev, the gzipped body is cached next to the plain one.
+    """
+    response = Response(payload, mimetype=deckformat.MIMETYPES[fmt])
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] <= 0:
+        return response
+
+    gz_variant = variant + '-gz'
+    compressed = deck_cache.get(user_id, rev, gz_variant) if user_id is not None else None
+    if compressed is None:
+        compressed = deckformat.compress(payload)
+        if compressed is None:
+            return response
+        if user_id is not None:
+            deck_cache.put(user_id, rev, compressed, gz_variant)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def deck_etag(user_id, rev, variant=''):
+    """ETag of a user's deck at a given revision, in a representation (see deckformat.variant)"""
+    return f'deck-{user_id}-{rev}' + (f'-{variant}' if variant else '')
+
+def with_deck_revision(response, user_id, rev, variant=''):
+    """Attach the deck ETag and revision and make clients revalidate before reuse"""
+    gzipped = response.headers.get('Content-Encoding') == 'gzip'
+    response.set_etag(deck_etag(user_id, rev, variant) + ('-gz' if gzipped else ''))
+    response.headers['X-Deck-Revision'] = str(rev)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept')
+    return response
+
+def wants_ndjson():
+    """True if the client asked for a newline-delimited JSON stream"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def stream_flashcards(user_id, after_id):
+    """Stream a deck as NDJSON without holding it in memory"""
+    cursor = get_db(user_id).cursor()
+    cursor.execute(f'''
+        SELECT {CARD_COLUMNS}
+        FROM flashcards
+        WHERE user_id = ? AND id > ?
+        ORDER BY id
+    ''', (user_id, after_id))
+
+    def generate():
+        try:
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(card_to_dict(row), ensure_ascii=False) + '\n'
+                              for row in rows)
+        finally:
+            cursor.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/api/flashcards/due', methods=['GET'])
+def get_due_flashcards():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    limit = parse_limit(request.args.get('limit'), DUE_PAGE_SIZE, DUE_PAGE_MAX)
+    if limit is None:
+        return jsonify({'error': 'Paramètre limit invalide'}), 400
+
+    # The cursor is "<next_review>,<id>" of the last card of the previous page
+    params = [session['user_id'], scheduler.current_time()]
+    after = ''
+    cursor_param = request.args.get('cursor')
+    if cursor_param:
+        next_review, _, card_id = cursor_param.rpartition(',')
+        if not next_review or not card_id.isdigit():
+            return jsonify({'error': 'Paramètre cursor invalide'}), 400
+        after = 'AND (next_review > ? OR (next_review = ? AND id > ?))'
+        params += [next_review, next_review, int(card_id)]
+
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {CARD_COLUMNS}
+        FROM flashcards
+        WHERE user_id = ? AND next_review <= ? {after}
+        ORDER BY next_review, id
+        LIMIT ?
+    ''', params + [limit])
+
+    cards = [card_to_dict(row) for row in cursor.fetchall()]
+    next_cursor = None
+    if len(cards) == limit:
+        next_cursor = f"{cards[-1]['nextReview']},{cards[-1]['id']}"
+
+    return jsonify({'cards': cards, 'nextCursor': next_cursor})
+
+@bp.route('/api/flashcards/due/count', methods=['GET'])
+def count_due_flashcards():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+    # Answered from the (user_id, next_review) index alone
+    cursor.execute('SELECT COUNT(*) FROM user_cards WHERE user_id = ? AND next_review <= ?',
+                   (session['user_id'], scheduler.current_time()))
+
+    return jsonify({'due': cursor.fetchone()[0]})
+
+@bp.route('/api/flashcards/export', methods=['GET'])
+def export_flashcards():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    fmt = request.args.get('format', deckexport.CSV)
+    if fmt not in deckexport.FORMATS:
+        return jsonify({'error': 'Paramètre format invalide'}), 400
+    _, mimetype, filename = deckexport.FORMATS[fmt]
+
+    cursor = get_db(session['user_id']).cursor()
+    cursor.execute(f'''
+        SELECT {', '.join(deckexport.COLUMNS)}
         FROM flashcards
         WHERE user_id = ?
+        ORDER BY id
     ''', (session['user_id'],))
 
-    flashcards = []
-    for row in cursor.fetchall():
-        flashcards.append({
-            'id': row['id'],
-            'character': row['character'],
-            'pinyin': row['pinyin'],
-            'zhuyin': row['zhuyin'],
-            'meaning': row['meaning'],
-            'level': row['level'],
-            'lastReview': row['last_review'],
-            'nextReview': row['next_review'],
-            'correctCount': row['correct_count'],
-            'incorrectCount': row['incorrect_count'],
-            'streak': row['streak']
-        })
-
-    conn.close()
-    return jsonify(flashcards)
-
-@app.route('/api/flashcards', methods=['POST'])
+    def generate():
+        try:
+            yield from deckexport.generate(cursor, fmt, STREAM_BATCH_SIZE)
+        finally:
+            cursor.close()
+
+    body = generate()
+    gzipped = request.accept_encodings['gzip'] > 0
+    if gzipped:
+        body = deckexport.gzip_stream(body)
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.vary.add('Accept-Encoding')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@bp.route('/api/flashcards/search', methods=['GET'])
+def search_flashcards():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    query = search.match_query(session['user_id'], request.args.get('q', ''))
+    if query is None:
+        return jsonify({'error': 'Paramètre q requis'}), 400
+    limit = parse_limit(request.args.get('limit'), SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX)
+    if limit is None:
+        return jsonify({'error': 'Paramètre limit invalide'}), 400
+    offset = request.args.get('offset', '0')
+    if not offset.isdigit():
+        return jsonify({'error': 'Paramètre offset invalide'}), 400
+    offset = int(offset)
+
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+    # Best matches first; one extra row tells whether there is a next page
+    cursor.execute(f'''
+        SELECT {', '.join('f.' + column.strip() for column in CARD_COLUMNS.split(','))}
+        FROM (SELECT rowid, rank FROM flashcards_search
+              WHERE flashcards_search MATCH ?
+              ORDER BY rank
+              LIMIT ? OFFSET ?) s
+        JOIN flashcards f ON f.id = s.rowid
+        WHERE f.user_id = ?
+        ORDER BY s.rank
+    ''', (query, limit + 1, offset, session['user_id']))
+
+    cards = [card_to_dict(row) for row in cursor.fetchall()]
+    next_offset = offset + limit if len(cards) > limit else None
+
+    return jsonify({'cards': cards[:limit], 'nextOffset': next_offset})
+
+@bp.route('/api/quiz/multiple-choice', methods=['GET'])
+def get_multiple_choice_quiz():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    count = parse_limit(request.args.get('n'), QUIZ_SIZE, QUIZ_MAX)
+    if count is None:
+        return jsonify({'error': 'Paramètre n invalide'}), 400
+
+    user_id = session['user_id']
+    conn = get_db(user_id)
+    cursor = conn.cursor()
+    if stats.get(cursor, user_id)['totalCards'] < quiz.CHOICES:
+        return jsonify({'error': f'Au moins {quiz.CHOICES} cartes sont nécessaires pour ce jeu'}), 400
+
+    # Most overdue cards first, topped up with the next ones to come
+    cursor.execute(f'''
+        SELECT {CARD_COLUMNS}
+        FROM flashcards
+        WHERE user_id = ?
+        ORDER BY next_review, id
+        LIMIT ?
+    ''', (user_id, count))
+    cards = [card_to_dict(row) for row in cursor.fetchall()]
+
+    return jsonify({'questions': [quiz.question(cursor, user_id, card) for card in cards]})
+
+@bp.route('/api/flashcards/changes', methods=['GET'])
+def get_flashcard_changes():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    since = request.args.get('since', '')
+    if not since.isdigit():
+        return jsonify({'error': 'Paramètre since invalide'}), 400
+    since = int(since)
+
+    user_id = session['user_id']
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+
+    # Read the revision first: anything written meanwhile is simply sent again
+    rev = get_revision(cursor, user_id)
+    if since > rev:
+        return jsonify({'error': 'Révision inconnue'}), 409
+
+    cursor.execute(f'''
+        SELECT {CARD_COLUMNS}
+        FROM flashcards
+        WHERE user_id = ? AND updated_rev > ?
+        ORDER BY id
+    ''', (user_id, since))
+    upserted = [card_to_dict(row) for row in cursor.fetchall()]
+
+    cursor.execute('''
+        SELECT card_id FROM deleted_flashcards
+        WHERE user_id = ? AND deleted_rev > ?
+    ''', (user_id, since))
+    deleted = [row['card_id'] for row in cursor.fetchall()]
+
+    return jsonify({'rev': rev, 'upserted': upserted, 'deleted': deleted})
+
+@bp.route('/api/flashcards', methods=['POST'])
 def add_flashcard():
     if 'user_id' not in session:
         return jsonify({'error': 'Non authentifié'}), 401
@@ -187,24 +840,20 @@ def add_flashcard():
     zhuyin = data.get('zhuyin', '')
     meaning = data.get('meaning')
 
-    if not character or not meaning:
-        return jsonify({'error': 'Caractère et signification requis'}), 400
+    error = validate_card(character, pinyin, zhuyin, meaning)
+    if error:
+        return jsonify({'error': error}), 400
 
-    if not pinyin and not zhuyin:
-        return jsonify({'error': 'Pinyin ou zhuyin requis'}), 400
-
-    conn = get_db()
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
 
-    next_review = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO flashcards (user_id, character, pinyin, zhuyin, meaning, next_review)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (session['user_id'], character, pinyin if pinyin else None, zhuyin if zhuyin else None, meaning, next_review))
+    next_review = scheduler.current_time()
+    rev = bump_revision(cursor, session['user_id'])
+    card_id = catalog.add_card(cursor, session['user_id'],
+                               (character, pinyin if pinyin else None, zhuyin if zhuyin else None, meaning),
+                               next_review, rev)
 
     conn.commit()
-    card_id = cursor.lastrowid
-    conn.close()
 
     return jsonify({
         'id': card_id,
@@ -220,28 +869,128 @@ def add_flashcard():
         'streak': 0
     })
 
-@app.route('/api/flashcards/<int:card_id>', methods=['PUT'])
+@bp.route('/api/flashcards/bulk', methods=['POST'])
+def bulk_add_flashcards():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    if request.is_json:
+        data = request.json
+        if not isinstance(data, list):
+            return jsonify({'error': 'Un tableau de cartes est requis'}), 400
+        rows = ((i, card_from_json(item)) for i, item in enumerate(data, 1))
+    elif 'file' in request.files:
+        rows = parse_csv(request.files['file'].stream)
+    else:
+        rows = parse_csv(request.stream)
+
+    user_id = session['user_id']
+    next_review = scheduler.current_time()
+    inserted = 0
+    errors = []
+    error_count = 0
+    chunk = []
+
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+
+    def flush():
+        catalog.add_cards(cursor, user_id, chunk, next_review, rev)
+        chunk.clear()
+
+    # One transaction for the whole import, written in bounded chunks
+    try:
+        rev = bump_revision(cursor, user_id)
+        for line, card in rows:
+            if isinstance(card, str):
+                error = card
+            else:
+                error = validate_card(*card)
+            if error:
+                error_count += 1
+                if len(errors) < BULK_MAX_ERRORS:
+                    errors.append({'line': line, 'error': error})
+                continue
+
+            character, pinyin, zhuyin, meaning = card
+            chunk.append((character, pinyin or None, zhuyin or None, meaning))
+            inserted += 1
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                flush()
+        if chunk:
+            flush()
+        conn.commit()
+    except UnicodeDecodeError:
+        conn.rollback()
+        return jsonify({'error': 'Le fichier doit être encodé en UTF-8'}), 400
+    except csv.Error:
+        conn.rollback()
+        return jsonify({'error': 'Fichier CSV invalide (champ trop long ou caractère nul)'}), 400
+
+    return jsonify({'inserted': inserted, 'errorCount': error_count, 'errors': errors})
+
+@bp.route('/api/shared-decks', methods=['GET'])
+def list_shared_decks():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    return jsonify({'decks': catalog.shared_decks(get_db(session['user_id']).cursor())})
+
+@bp.route('/api/shared-decks/<name>/import', methods=['POST'])
+def import_shared_deck(name):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    user_id = session['user_id']
+    conn = get_db(user_id)
+    cursor = conn.cursor()
+
+    # One INSERT ... SELECT of catalog references, whatever the deck size
+    rev = bump_revision(cursor, user_id)
+    inserted = catalog.import_shared_deck(cursor, user_id, name, scheduler.current_time(), rev)
+    if not inserted:
+        conn.rollback()
+        if inserted is None:
+            return jsonify({'error': 'Deck partagé introuvable'}), 404
+    else:
+        conn.commit()
+
+    return jsonify({'inserted': inserted})
+
+@bp.route('/api/flashcards/<int:card_id>', methods=['PUT'])
 def update_flashcard(card_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Non authentifié'}), 401
 
     data = request.json
+    # {"correct": true} answers the card now, scheduled on the server
+    if isinstance(data, dict) and 'correct' in data:
+        data = {'answers': [{'reviewedAt': None, 'correct': data['correct']}]}
+    try:
+        data = review_times(data)
+    except ValueError:
+        return jsonify({'error': 'Date ou réponse de révision invalide'}), 400
 
-    conn = get_db()
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
 
     # Verify ownership
-    cursor.execute('SELECT id FROM flashcards WHERE id = ? AND user_id = ?',
-                   (card_id, session['user_id']))
-    if not cursor.fetchone():
-        conn.close()
+    cursor.execute('''
+        SELECT level, streak, correct_count, incorrect_count FROM user_cards
+        WHERE id = ? AND user_id = ?
+    ''', (card_id, session['user_id']))
+    card = cursor.fetchone()
+    if not card:
         return jsonify({'error': 'Carte non trouvée'}), 404
+    if data.get('answers'):
+        data = apply_answers(card, data['answers'])
 
     # Update card
+    rev = bump_revision(cursor, session['user_id'])
     cursor.execute('''
-        UPDATE flashcards
+        UPDATE user_cards
         SET level = ?, last_review = ?, next_review = ?,
-            correct_count = ?, incorrect_count = ?, streak = ?
+            correct_count = ?, incorrect_count = ?, streak = ?, updated_rev = ?
         WHERE id = ? AND user_id = ?
     ''', (
         data.get('level'),
@@ -250,45 +999,473 @@ def update_flashcard(card_id):
         data.get('correctCount'),
         data.get('incorrectCount'),
         data.get('streak'),
+        rev,
         card_id,
         session['user_id']
     ))
 
     conn.commit()
-    conn.close()
+    log_reviews(reviewlog.answer_rows(session['user_id'], card_id, data))
 
     return jsonify({'success': True})
 
-@app.route('/api/flashcards/<int:card_id>', methods=['DELETE'])
+def review_times(review):
+    """A review payload with lastReview, nextReview and answers in the stored format
+
+    Raises ValueError if a timestamp cannot be read.
+    """
+    if not isinstance(review, dict):
+        raise ValueError('Review payload must be an object')
+    review = {**review, 'lastReview': scheduler.normalize_time(review.get('lastReview')),
+              'nextReview': scheduler.normalize_time(review.get('nextReview'))}
+    answers = review.get('answers')
+    if answers is not None:
+        if not isinstance(answers, list) or not all(
+                isinstance(answer, dict) and isinstance(answer.get('correct'), bool) for answer in answers):
+            raise ValueError('Review answers must be a list of {reviewedAt, correct} objects')
+        review['answers'] = [{'reviewedAt': scheduler.normalize_time(answer.get('reviewedAt')),
+                              'correct': answer['correct']} for answer in answers]
+    return review
+
+def apply_answers(card, answers):
+    """The review fields of a card after answers, scheduled on the server
+
+    card holds the stored progress (level, streak, correct_count,
+    incorrect_count); answers are {reviewedAt, correct} events in order,
+    reviewedAt defaulting to, and capped at, the current time. The
+    returned answers also carry the level each one reached, for the
+    review log.
+    """
+    level, streak = card['level'] or 0, card['streak'] or 0
+    correct_count, incorrect_count = card['correct_count'] or 0, card['incorrect_count'] or 0
+    now = scheduler.current_time()
+    last_review = next_review = None
+    logged = []
+    for answer in answers:
+        reviewed_at = min(answer['reviewedAt'] or now, now)
+        level, streak, correct_count, incorrect_count, last_review, next_review = scheduler.answer(
+            level, streak, correct_count, incorrect_count, answer['correct'], scheduler.parse_time(reviewed_at))
+        logged.append({'reviewedAt': last_review, 'correct': answer['correct'], 'level': level})
+    return {'level': level, 'lastReview': last_review, 'nextReview': next_review,
+            'correctCount': correct_count, 'incorrectCount': incorrect_count, 'streak': streak,
+            'answers': logged}
+
+def delete_cards(cursor, user_id, card_ids):
+    """Delete a user's cards among card_ids, leaving tombstones; returns the ids deleted
+
+    The deck revision is bumped only if one of them is the user's.
+    """
+    placeholders = ','.join('?' * len(card_ids))
+    cursor.execute(f'SELECT id FROM user_cards WHERE user_id = ? AND id IN ({placeholders})',
+                   [user_id, *card_ids])
+    owned = [row[0] for row in cursor.fetchall()]
+    if owned:
+        rev = bump_revision(cursor, user_id)
+        placeholders = ','.join('?' * len(owned))
+        cursor.executemany('INSERT INTO deleted_flashcards (card_id, user_id, deleted_rev) VALUES (?, ?, ?)',
+                           [(card_id, user_id, rev) for card_id in owned])
+        cursor.execute(f'DELETE FROM user_cards WHERE id IN ({placeholders})', owned)
+    return owned
+
+@bp.route('/api/flashcards/<int:card_id>', methods=['DELETE'])
 def delete_flashcard(card_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Non authentifié'}), 401
 
-    conn = get_db()
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
 
-    cursor.execute('DELETE FROM flashcards WHERE id = ? AND user_id = ?',
-                   (card_id, session['user_id']))
-
-    conn.commit()
-    conn.close()
+    if delete_cards(cursor, session['user_id'], [card_id]):
+        conn.commit()
+    else:
+        conn.rollback()
 
     return jsonify({'success': True})
 
-@app.route('/api/flashcards/clear', methods=['DELETE'])
+@bp.route('/api/flashcards/delete-batch', methods=['POST'])
+def delete_flashcards_batch():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not all(type(card_id) is int for card_id in ids):
+        return jsonify({'error': "Liste d'identifiants requise"}), 400
+    if len(ids) > DELETE_BATCH_MAX:
+        return jsonify({'error': f'Au plus {DELETE_BATCH_MAX} cartes par requête'}), 400
+
+    user_id = session['user_id']
+    conn = get_db(user_id)
+    cursor = conn.cursor()
+
+    ids = list(dict.fromkeys(ids))
+    deleted = set(delete_cards(cursor, user_id, ids)) if ids else set()
+    if deleted:
+        conn.commit()
+    else:
+        conn.rollback()
+
+    return jsonify({
+        'deleted': len(deleted),
+        'missing': [card_id for card_id in ids if card_id not in deleted]
+    })
+
+@bp.route('/api/flashcards/clear', methods=['DELETE'])
 def clear_all_flashcards():
     if 'user_id' not in session:
         return jsonify({'error': 'Non authentifié'}), 401
 
+    user_id = session['user_id']
+    conn = get_db(user_id)
+    cursor = conn.cursor()
+
+    # One transaction per chunk, so other writers get the lock in between
+    # instead of waiting for the whole deck; each chunk is a consistent
+    # revision for the sync feed
+    deleted = 0
+    while True:
+        cursor.execute('SELECT id FROM user_cards WHERE user_id = ? ORDER BY id LIMIT ?',
+                       (user_id, PURGE_CHUNK_SIZE))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            break
+        deleted += len(delete_cards(cursor, user_id, ids))
+        conn.commit()
+        if len(ids) < PURGE_CHUNK_SIZE:
+            break
+        time.sleep(PURGE_PAUSE_SECONDS)
+
+    return jsonify({'success': True, 'deleted': deleted})
+
+# Stats endpoints
+@bp.route('/api/stats', methods=['GET'])
+def get_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    return jsonify(stats.get(get_db(session['user_id']).cursor(), session['user_id']))
+
+@bp.route('/api/history', methods=['GET'])
+def get_history():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    days = parse_limit(request.args.get('days'), HISTORY_DAYS, HISTORY_MAX_DAYS)
+    if days is None:
+        return jsonify({'error': 'Paramètre days invalide'}), 400
+
+    # Make the user's latest answers visible before reading
+    flush_review_log()
+
+    return jsonify(reviewlog.history(get_db(session['user_id']).cursor(), session['user_id'], days))
+
+@bp.cli.command('compact-reviews')
+def compact_reviews_command():
+    """Fold past days of review_log into review_rollups"""
+    flush_review_log()
+    folded = sum(reviewlog.compact(conn) for conn in deck_databases())
+    print(f'{folded} review rows compacted')
+
+@bp.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Check user_stats against the flashcards table and rebuild it"""
+    for conn in deck_databases():
+        cursor = conn.cursor()
+        for user_id, actual, expected in stats.check(cursor):
+            print(f'user {user_id}: stored {actual}, expected {expected}')
+        stats.rebuild(cursor)
+        conn.commit()
+    print('user_stats rebuilt')
+
+@bp.cli.command('load-shared-deck')
+@click.argument('name')
+@click.argument('csv_file', type=click.File('rb'))
+def load_shared_deck_command(name, csv_file):
+    """Create or extend a shared deck from a CSV file (import format)"""
+    contents = []
+    for line, card in parse_csv(csv_file):
+        error = card if isinstance(card, str) else validate_card(*card)
+        if error:
+            print(f'line {line}: {error}')
+            continue
+        character, pinyin, zhuyin, meaning = card
+        contents.append((character, pinyin or None, zhuyin or None, meaning))
+
+    # Every deck database holds its own copy of the catalog
+    for conn in deck_databases():
+        size = catalog.load_shared_deck(conn.cursor(), name, contents)
+        conn.commit()
+    print(f'{name}: {size} cards')
+
+@bp.cli.command('purge-sessions')
+def purge_sessions_command():
+    """Delete expired server-side sessions"""
+    interface = current_app.session_interface
+    if not isinstance(interface, sessions.ServerSessionInterface):
+        raise click.ClickException('Les sessions sont stockées dans les cookies')
+    print(f'{interface.purge_expired()} expired sessions deleted')
+
+@bp.cli.command('migrate')
+def migrate_command():
+    """Bring every database to the latest schema version"""
+    try:
+        applied = init_db()
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+    for path, names in applied.items():
+        for name in names:
+            print(f'{path}: {name}')
+    print(f'{sum(len(names) for names in applied.values())} migration steps applied')
+
+@bp.cli.command('split-shards')
+@click.option('--count', type=int, required=True, help='Number of shard files')
+@click.option('--drop-source', is_flag=True, help='Empty the deck tables of DATABASE afterwards')
+def split_shards_command(count, drop_source):
+    """Move the decks of an unsharded DATABASE into per-user shard files"""
+    if SHARD_COUNT:
+        raise click.ClickException('La base est déjà répartie (SHARD_COUNT non nul)')
+    if count < 1:
+        raise click.ClickException('--count doit être positif')
+    init_db()
+    flush_review_log()
+    close_db_connections()
+    copied = shards.split(DATABASE, count, db.connect, migrate_deck, drop_source)
+    for table, rows in copied.items():
+        print(f'{table}: {rows} rows copied')
+
+    cards = shards.count_rows(shards.shard_paths(DATABASE, count), 'flashcards')
     conn = get_db()
+    conn.execute("UPDATE settings SET value = ? WHERE key = 'shard_count'", (str(count),))
+    conn.commit()
+    # This process's SHARD_COUNT no longer matches: check it again on next use
+    schema_ready.discard((DATABASE, SHARD_COUNT))
+    print(f'{cards} cards in {count} shards; now start the app with FLASHCARDS_SHARD_COUNT={count}')
+
+# Review endpoints
+@bp.route('/api/reviews/batch', methods=['POST'])
+def submit_reviews_batch():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    data = request.get_json(silent=True) or {}
+    reviews = data.get('reviews')
+    if not isinstance(reviews, list):
+        return jsonify({'error': 'Liste de révisions requise'}), 400
+    if len(reviews) > REVIEW_BATCH_MAX:
+        return jsonify({'error': f'Au plus {REVIEW_BATCH_MAX} révisions par requête'}), 400
+
+    for review in reviews:
+        if not isinstance(review, dict) or type(review.get('id')) is not int:
+            return jsonify({'error': 'Chaque révision doit avoir un id'}), 400
+    try:
+        reviews = [review_times(review) for review in reviews]
+    except ValueError:
+        return jsonify({'error': 'Date ou réponse de révision invalide'}), 400
+    # Without answers, the review is the state to store: check it is complete
+    for review in reviews:
+        if not review.get('answers') and (
+                review['nextReview'] is None
+                or any(type(review.get(field)) is not int for field in REVIEW_STATE_FIELDS)
+                or not 0 <= review['level'] <= scheduler.MAX_LEVEL):
+            return jsonify({'error': 'Révision incomplète (niveau, compteurs et prochaine révision requis)'}), 400
+
+    # Answers are scheduled on the server, in order; reviews without
+    # answers carry the state to store, and the last one per card wins
+    latest = {}
+    answers = {}
+    for review in reviews:
+        latest[review['id']] = review
+        if review.get('answers'):
+            answers.setdefault(review['id'], []).extend(review['answers'])
+
+    user_id = session['user_id']
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
 
-    cursor.execute('DELETE FROM flashcards WHERE user_id = ?', (session['user_id'],))
+    # Verify ownership of every card with a single query
+    if latest:
+        placeholders = ','.join('?' * len(latest))
+        cursor.execute(f'''
+            SELECT id, level, streak, correct_count, incorrect_count FROM user_cards
+            WHERE user_id = ? AND id IN ({placeholders})
+        ''', [user_id, *latest])
+        cards = {row['id']: row for row in cursor.fetchall()}
+    else:
+        cards = {}
+    owned = set(cards)
+    for card_id in answers.keys() & owned:
+        latest[card_id] = apply_answers(cards[card_id], answers[card_id])
+
+    rev = bump_revision(cursor, user_id) if owned else None
+    cursor.executemany('''
+        UPDATE user_cards
+        SET level = ?, last_review = ?, next_review = ?,
+            correct_count = ?, incorrect_count = ?, streak = ?, updated_rev = ?
+        WHERE id = ? AND user_id = ?
+    ''', [(
+        review.get('level'),
+        review.get('lastReview'),
+        review.get('nextReview'),
+        review.get('correctCount'),
+        review.get('incorrectCount'),
+        review.get('streak'),
+        rev,
+        card_id,
+        user_id
+    ) for card_id, review in latest.items() if card_id in owned])
 
     conn.commit()
-    conn.close()
+    # Every answer is logged, including those the coalesced update replaced
+    log_reviews([row for review in reviews if review['id'] in owned and review['id'] not in answers
+                 for row in reviewlog.answer_rows(user_id, review['id'], review)] +
+                [row for card_id in answers.keys() & owned
+                 for row in reviewlog.answer_rows(user_id, card_id, latest[card_id])])
 
-    return jsonify({'success': True})
+    return jsonify({
+        'updated': len(owned),
+        'missing': [card_id for card_id in latest if card_id not in owned]
+    })
+
+# Scheduling endpoints
+def load_schedule(cursor, user_id):
+    """Return the user's deck as (ids, levels, next_reviews) columns"""
+    cursor.execute('SELECT id, level, next_review FROM user_cards WHERE user_id = ?', (user_id,))
+    rows = cursor.fetchall()
+    return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+
+@bp.route('/api/schedule/shift', methods=['POST'])
+def shift_schedule():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    data = request.get_json(silent=True) or {}
+    days = data.get('days')
+    if type(days) is not int or abs(days) > SCHEDULE_MAX_SHIFT_DAYS:
+        return jsonify({'error': 'Nombre de jours invalide'}), 400
+
+    user_id = session['user_id']
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+
+    ids, _, next_reviews = load_schedule(cursor, user_id)
+    rows = scheduler.shift_due_dates(ids, next_reviews, days)
+    if rows:
+        rev = bump_revision(cursor, user_id)
+        cursor.executemany('UPDATE user_cards SET next_review = ?, updated_rev = ? WHERE id = ?',
+                           [(next_review, rev, card_id) for next_review, card_id in rows])
+    conn.commit()
+
+    return jsonify({'updated': len(rows)})
+
+@bp.route('/api/schedule/rebalance', methods=['POST'])
+def rebalance_schedule():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    data = request.get_json(silent=True) or {}
+    max_per_day = data.get('maxPerDay')
+    horizon = data.get('horizonDays', 7)
+    if type(max_per_day) is not int or max_per_day < 1:
+        return jsonify({'error': 'maxPerDay invalide'}), 400
+    if type(horizon) is not int or not 1 <= horizon <= SCHEDULE_MAX_SHIFT_DAYS:
+        return jsonify({'error': 'horizonDays invalide'}), 400
+
+    user_id = session['user_id']
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+
+    ids, levels, next_reviews = load_schedule(cursor, user_id)
+    rows, unplaced = scheduler.rebalance(ids, levels, next_reviews, max_per_day, horizon)
+    if rows:
+        rev = bump_revision(cursor, user_id)
+        cursor.executemany('UPDATE user_cards SET next_review = ?, updated_rev = ? WHERE id = ?',
+                           [(next_review, rev, card_id) for next_review, card_id in rows])
+    conn.commit()
+
+    return jsonify({'moved': len(rows), 'unplaced': unplaced})
+
+@bp.route('/api/schedule/reset', methods=['POST'])
+def reset_schedule():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    user_id = session['user_id']
+    conn = get_db(session['user_id'])
+    cursor = conn.cursor()
+
+    ids, _, _ = load_schedule(cursor, user_id)
+    rows = scheduler.reset_levels(ids)
+    if rows:
+        rev = bump_revision(cursor, user_id)
+        cursor.executemany('''
+            UPDATE user_cards SET level = ?, streak = ?, next_review = ?, updated_rev = ?
+            WHERE id = ?
+        ''', [(level, streak, next_review, rev, card_id)
+              for level, streak, next_review, card_id in rows])
+    conn.commit()
+
+    return jsonify({'updated': len(rows)})
+
+@bp.cli.command('serve')
+@click.option('--host', default='0.0.0.0')
+@click.option('--port', default=5001, type=int)
+@click.option('--workers', default=0, type=int, help='Worker processes (default: one per CPU)')
+def serve_command(host, port, workers):
+    """Serve the app from pre-forked worker processes on a shared socket"""
+    import server
+
+    if current_app.config.get('SECRET_KEY_GENERATED') and current_app.config['SESSION_STORE'] == 'cookie':
+        print('Warning: no FLASHCARDS_SECRET_KEY set, sessions will not survive a restart')
+    init_db()
+    # Preloaded here; each worker opens its own connections and hashing pool
+    # after the fork
+    server.serve(current_app._get_current_object(), host, port, workers or None,
+                 before_fork=release_process_resources, before_exit=release_process_resources)
+
+# Application factory
+def create_app(config=None):
+    """Create the Flask application
+
+    Settings come from FLASHCARDS_* environment variables (e.g.
+    FLASHCARDS_SECRET_KEY, FLASHCARDS_DATABASE, FLASHCARDS_SHARD_COUNT), then
+    from config. Every process serving the same users must share SECRET_KEY;
+    without one a random key is generated and sessions do not survive a
+    restart.
+
+    No database is opened here: the schema is migrated on first use, or
+    beforehand with `flask migrate`.
+    """
+    global DATABASE, SHARD_COUNT
+
+    app = Flask(__name__)
+    app.config.from_prefixed_env('FLASHCARDS')
+    app.config.update(config or {})
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+        app.config['SECRET_KEY_GENERATED'] = True
+    if app.config.get('DATABASE'):
+        DATABASE = app.config['DATABASE']
+    if 'SHARD_COUNT' in app.config:
+        SHARD_COUNT = int(app.config['SHARD_COUNT'])
+
+    # Sessions: 'sqlite' (in DATABASE, shared by every worker), 'file' or
+    # 'cookie' (Flask's signed cookies)
+    store = app.config.setdefault('SESSION_STORE', 'sqlite')
+    if store == 'sqlite':
+        app.session_interface = sessions.ServerSessionInterface(sessions.SQLiteSessionStore(get_db))
+    elif store == 'file':
+        directory = app.config.get('SESSION_FILE_DIR', os.path.join(app.instance_path, 'sessions'))
+        app.session_interface = sessions.ServerSessionInterface(sessions.FileSessionStore(directory))
+    elif store != 'cookie':
+        raise ValueError(f'SESSION_STORE inconnu : {store}')
+
+    app.register_blueprint(bp)
+    app.teardown_appcontext(release_db)
+    static_assets.auto_reload = app.debug
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
+    static_assets.auto_reload = True
     app.run(debug=True, host='0.0.0.0', port=5001)
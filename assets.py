@@ -0,0 +1,141 @@
+"""
+Fingerprinted, precompressed static assets for the flashcards application.
+
+At startup every script and stylesheet referenced by the HTML pages is
+read into memory, named after a hash of its content
+(/assets/script.3f2a9c1e07.js) and gzipped once. Pages are served with
+their references rewritten to those names. Fingerprinted URLs never change
+content, so they are cached as immutable; pages and unversioned names are
+revalidated with an ETag instead.
+
+No build step: editing a file and restarting the server (or setting
+auto_reload) is enough to publish a new fingerprint.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response
+
+
+ASSET_PREFIX = '/assets/'
+HASH_LENGTH = 10
+MIN_GZIP_SIZE = 256  # bytes; smaller bodies are sent as is
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# src="script.js" / href="styles.css": local references to rewrite
+REFERENCE = re.compile(r'''(\b(?:src|href)=["'])([\w.-]+\.(?:js|css))(["'])''')
+
+
+class Asset:
+    """One file held in memory, raw and gzipped."""
+
+    __slots__ = ('name', 'body', 'gzipped', 'mimetype', 'etag', 'mtime')
+
+    def __init__(self, name, body, mtime):
+        self.name = name
+        self.body = body
+        self.mtime = mtime
+        self.etag = hashlib.sha256(body).hexdigest()[:HASH_LENGTH * 2]
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        self.gzipped = compressed if len(body) >= MIN_GZIP_SIZE and len(compressed) < len(body) else None
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    @property
+    def fingerprinted(self):
+        """URL of this exact content"""
+        stem, ext = os.path.splitext(self.name)
+        return f'{ASSET_PREFIX}{stem}.{self.etag[:HASH_LENGTH]}{ext}'
+
+
+class AssetStore:
+    """In-memory pages and fingerprinted assets loaded from one directory."""
+
+    def __init__(self, root, pages, auto_reload=False):
+        self.root = root
+        self.page_names = tuple(pages)
+        self.auto_reload = auto_reload
+        self._lock = threading.Lock()
+        self._load()
+
+    def _read(self, name):
+        path = os.path.join(self.root, name)
+        with open(path, 'rb') as f:
+            return Asset(name, f.read(), os.path.getmtime(path))
+
+    def _load(self):
+        """Read the pages, fingerprint what they reference and rewrite them"""
+        sources = {name: self._read(name) for name in self.page_names}
+        assets = {}
+        for page in sources.values():
+            for match in REFERENCE.finditer(page.body.decode('utf-8')):
+                name = match.group(2)
+                if name not in assets and os.path.isfile(os.path.join(self.root, name)):
+                    assets[name] = self._read(name)
+
+        def rewrite(match):
+            asset = assets.get(match.group(2))
+            if asset is None:
+                return match.group(0)
+            return match.group(1) + asset.fingerprinted + match.group(3)
+
+        pages = {}
+        for name, source in sources.items():
+            html = REFERENCE.sub(rewrite, source.body.decode('utf-8')).encode('utf-8')
+            pages[name] = Asset(name, html, source.mtime)
+
+        self._sources = sources
+        self.assets = assets
+        self.pages = pages
+        self._by_url = {asset.fingerprinted: asset for asset in assets.values()}
+
+    def _reload_if_changed(self):
+        if not self.auto_reload:
+            return
+        for asset in list(self._sources.values()) + list(self.assets.values()):
+            path = os.path.join(self.root, asset.name)
+            if not os.path.isfile(path) or os.path.getmtime(path) != asset.mtime:
+                with self._lock:
+                    self._load()
+                return
+
+    def lookup(self, path):
+        """Return (asset, cache_control) for a request path, or (None, None)
+
+        Unknown fingerprints of a known file (a page cached from a previous
+        deployment) get the current content, but revalidated.
+        """
+        self._reload_if_changed()
+        asset = self._by_url.get(path)
+        if asset is not None:
+            return asset, IMMUTABLE
+        if path.startswith(ASSET_PREFIX):
+            parts = path[len(ASSET_PREFIX):].rsplit('.', 2)
+            asset = self.assets.get(f'{parts[0]}.{parts[-1]}') if len(parts) == 3 else None
+            return (asset, REVALIDATE) if asset is not None else (None, None)
+        name = path.lstrip('/')
+        asset = self.pages.get(name) or self.assets.get(name)
+        return (asset, REVALIDATE) if asset is not None else (None, None)
+
+    def page(self, name):
+        """The rewritten page, served with revalidation"""
+        self._reload_if_changed()
+        return self.pages[name]
+
+
+def send_asset(asset, cache_control, request):
+    """Build the response for an asset, gzipped if the client accepts it"""
+    gzipped = asset.gzipped is not None and request.accept_encodings['gzip'] > 0
+    response = Response(asset.gzipped if gzipped else asset.body, mimetype=asset.mimetype)
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(asset.etag + ('-gz' if gzipped else ''))
+    return response.make_conditional(request)
@@ -0,0 +1,120 @@
+"""
+Benchmark: per-request sqlite3.connect() versus pooled WAL connections.
+
+Simulates the request pattern of the API handlers (one deck read and one
+progress write per request) from several threads and reports requests/sec
+for both strategies.
+
+Usage: python -m benchmarks.bench_connections [--threads 8] [--requests 2000]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from db import ConnectionPool
+
+
+def seed(path, users=20, cards_per_user=200):
+    """Create a database with a few users and their decks"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE flashcards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            character TEXT NOT NULL,
+            pinyin TEXT,
+            zhuyin TEXT,
+            meaning TEXT NOT NULL,
+            level INTEGER DEFAULT 0,
+            last_review TIMESTAMP,
+            next_review TIMESTAMP NOT NULL,
+            correct_count INTEGER DEFAULT 0,
+            incorrect_count INTEGER DEFAULT 0,
+            streak INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    now = datetime.now().isoformat()
+    conn.executemany(
+        'INSERT INTO flashcards (user_id, character, pinyin, meaning, next_review) VALUES (?, ?, ?, ?, ?)',
+        [(u, f'字{i}', f'zi{i}', f'word{i}', now)
+         for u in range(1, users + 1) for i in range(cards_per_user)])
+    conn.commit()
+    conn.close()
+
+
+def handle_request(conn, user_id, card_id):
+    """One read of the user's deck followed by one progress update"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, character, level FROM flashcards WHERE user_id = ?', (user_id,))
+    cursor.fetchall()
+    cursor.execute('UPDATE flashcards SET streak = streak + 1 WHERE id = ? AND user_id = ?',
+                   (card_id, user_id))
+    conn.commit()
+
+
+def per_request_connect(path):
+    def run(user_id, card_id):
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        handle_request(conn, user_id, card_id)
+        conn.close()
+    return run, lambda: None
+
+
+def pooled(path):
+    pool = ConnectionPool()
+
+    def run(user_id, card_id):
+        conn = pool.get(path)
+        handle_request(conn, user_id, card_id)
+        pool.release(conn)
+    return run, pool.close_all
+
+
+def measure(strategy, path, threads, requests):
+    run, cleanup = strategy(path)
+    per_thread = requests // threads
+    errors = []
+
+    def worker(index):
+        try:
+            for i in range(per_thread):
+                user_id = (index + i) % 20 + 1
+                run(user_id, (user_id - 1) * 200 + 1)
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    cleanup()
+    return per_thread * threads / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, strategy in (('per-request connect', per_request_connect),
+                           ('pooled WAL', pooled)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.db')
+            seed(path)
+            rps, errors = measure(strategy, path, args.threads, args.requests)
+            print(f'{name:20s} {rps:10.1f} req/s  ({errors} errors)')
+
+
+if __name__ == '__main__':
+    main()
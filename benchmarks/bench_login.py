@@ -0,0 +1,112 @@
+"""
+Benchmark: login latency under a concurrent login storm.
+
+Starts the app on a real multi-threaded WSGI server, fires concurrent
+logins from many client threads while another thread polls a cheap
+endpoint, and reports p50/p99 latencies for both. Runs once with the KDF
+computed inline on request threads and once with the worker pool.
+
+Usage: python -m benchmarks.bench_login [--users 50] [--threads 16] [--logins 200]
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+
+from werkzeug.serving import make_server
+
+import app as app_module
+from passwords import PasswordHasher
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def run_storm(base_url, users, threads, logins):
+    login_times = []
+    poll_times = []
+    done = threading.Event()
+
+    def login_worker(index):
+        for i in range(index, logins, threads):
+            start = time.perf_counter()
+            post_json(f'{base_url}/api/login', {'name': f'user{i % users}', 'password': 'secret'})
+            login_times.append(time.perf_counter() - start)
+
+    def poller():
+        while not done.is_set():
+            start = time.perf_counter()
+            urllib.request.urlopen(f'{base_url}/api/check-auth').read()
+            poll_times.append(time.perf_counter() - start)
+
+    poll_thread = threading.Thread(target=poller)
+    poll_thread.start()
+    workers = [threading.Thread(target=login_worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    done.set()
+    poll_thread.join()
+    return login_times, poll_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        original_db, original_hasher = app_module.DATABASE, app_module.password_hasher
+        app_module.DATABASE = os.path.join(tmp, 'bench.db')
+        app_module.init_db()
+
+        seed_hasher = PasswordHasher(workers=0)
+        stored = seed_hasher.hash('secret')
+        conn = app_module.get_db()
+        conn.executemany('INSERT INTO users (name, password_hash) VALUES (?, ?)',
+                         [(f'user{i}', stored) for i in range(args.users)])
+        conn.commit()
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+        try:
+            for label, hasher in (('inline', PasswordHasher(workers=0, max_pending=10 ** 6)),
+                                  ('process pool', PasswordHasher(workers=os.cpu_count() or 2,
+                                                                  max_pending=10 ** 6))):
+                app_module.password_hasher = hasher
+                start = time.perf_counter()
+                login_times, poll_times = run_storm(base_url, args.users, args.threads, args.logins)
+                elapsed = time.perf_counter() - start
+                hasher.shutdown()
+                print(f'{label:13s} logins/s {len(login_times) / elapsed:7.1f}  '
+                      f'login p50 {percentile(login_times, 50) * 1000:7.1f} ms  '
+                      f'p99 {percentile(login_times, 99) * 1000:7.1f} ms  '
+                      f'check-auth p99 {percentile(poll_times, 99) * 1000:7.1f} ms')
+        finally:
+            server.shutdown()
+            app_module.close_db_connections()
+            app_module.DATABASE, app_module.password_hasher = original_db, original_hasher
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: bulk rescheduling endpoints on a large deck.
+
+Seeds one user with a large deck, then times the shift, rebalance and
+reset operations through the Flask test client. For comparison it also
+times shifting the same deck with one UPDATE and commit per card, the
+pattern a client-driven implementation would produce.
+
+Usage: python -m benchmarks.bench_scheduler [--cards 100000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import app as app_module
+import scheduler
+
+
+def seed_deck(cards):
+    """Register a user and give them a deck spread over the next 30 days"""
+    client = app_module.app.test_client()
+    client.post('/api/register', json={'name': 'bench', 'password': 'bench'})
+
+    conn = app_module.get_db()
+    now = datetime.now()
+    conn.executemany(
+        'INSERT INTO flashcards (user_id, character, pinyin, meaning, level, next_review) VALUES (1, ?, ?, ?, ?, ?)',
+        [(f'字{i}', f'zi{i}', f'word{i}', random.randint(0, scheduler.MAX_LEVEL),
+          scheduler.format_time(now + timedelta(days=random.randint(0, 30),
+                                                minutes=random.randint(0, 1440))))
+         for i in range(cards)])
+    conn.commit()
+    return client
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:28s} {time.perf_counter() - start:8.3f} s  {result}')
+
+
+def per_card_shift(days):
+    """Shift every card with its own UPDATE and commit"""
+    conn = app_module.get_db()
+    rows = conn.execute('SELECT id, next_review FROM user_cards WHERE user_id = 1').fetchall()
+    for card_id, next_review in rows:
+        shifted = scheduler.parse_time(next_review) + timedelta(days=days)
+        conn.execute('UPDATE user_cards SET next_review = ? WHERE id = ?',
+                     (scheduler.format_time(shifted), card_id))
+        conn.commit()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--cards', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        original_db = app_module.DATABASE
+        app_module.DATABASE = os.path.join(tmp, 'bench.db')
+        try:
+            app_module.init_db()
+            client = seed_deck(args.cards)
+
+            timed('rebalance (bulk)', lambda: client.post('/api/schedule/rebalance',
+                                                          json={'maxPerDay': 500}).json)
+            timed('shift (bulk)', lambda: client.post('/api/schedule/shift', json={'days': 3}).json)
+            timed('reset (bulk)', lambda: client.post('/api/schedule/reset').json)
+            timed('shift (per-card commits)', lambda: per_card_shift(3))
+        finally:
+            app_module.close_db_connections()
+            app_module.DATABASE = original_db
+
+
+if __name__ == '__main__':
+    main()
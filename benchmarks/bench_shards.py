@@ -0,0 +1,114 @@
+"""
+Benchmark: review write throughput vs number of deck shards.
+
+Forks several writer processes (as the pre-forking server does) that each
+apply review transactions (bump the deck revision and update a card, then
+commit) for random users, and reports committed writes per second for
+each shard count. With one file every writer queues on the same SQLite
+write lock; with N shards, writers for users on different shards proceed
+in parallel. The gain needs spare cores, or commits that wait on the disk
+(--synchronous FULL fsyncs every commit while holding the lock).
+
+Usage: python -m benchmarks.bench_shards [--shards 0,2,4,8] [--processes 8]
+                                         [--users 400] [--writes 4000]
+                                         [--synchronous NORMAL|FULL]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+import app as app_module
+import db
+
+
+def seed(users, cards_per_user):
+    """Create users and decks in the current layout; returns {user_id: card ids}"""
+    conn = app_module.get_db()
+    conn.executemany('INSERT INTO users (name, password_hash) VALUES (?, ?)',
+                     [(f'user{i}', 'x') for i in range(users)])
+    conn.commit()
+    deck = {}
+    for user_id in range(1, users + 1):
+        conn = app_module.get_db(user_id)
+        conn.executemany('''
+            INSERT INTO flashcards (user_id, character, pinyin, meaning, next_review)
+            VALUES (?, '字', 'zì', 'mot', '2024-01-01T09:00:00')
+        ''', [(user_id,)] * cards_per_user)
+        cursor = conn.execute('SELECT id FROM flashcards WHERE user_id = ?', (user_id,))
+        deck[user_id] = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+    return deck
+
+
+def writer(deck, writes, seed_value, result):
+    rng = random.Random(seed_value)
+    users = list(deck)
+    for _ in range(writes):
+        user_id = rng.choice(users)
+        conn = app_module.get_db(user_id)
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        rev = app_module.bump_revision(cursor, user_id)
+        cursor.execute('''
+            UPDATE user_cards SET level = ?, streak = streak + 1, correct_count = correct_count + 1,
+                                  last_review = ?, next_review = ?, updated_rev = ?
+            WHERE id = ? AND user_id = ?
+        ''', (rng.randrange(8), '2024-01-02T09:00:00', '2024-01-05T09:00:00', rev,
+              rng.choice(deck[user_id]), user_id))
+        conn.commit()
+    result.put(writes)
+
+
+def run(shard_count, processes, users, writes, cards_per_user):
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.DATABASE = os.path.join(tmp, 'bench.db')
+        app_module.SHARD_COUNT = shard_count
+        app_module.init_db()
+        deck = seed(users, cards_per_user)
+        # Connections must not cross the fork
+        app_module.close_db_connections()
+
+        context = multiprocessing.get_context('fork')
+        result = context.Queue()
+        workers = [context.Process(target=writer, args=(deck, writes // processes, i, result))
+                   for i in range(processes)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        done = sum(result.get() for _ in workers)
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--shards', default='0,2,4,8', help='shard counts (0: single file)')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--cards', type=int, default=50, help='cards per user')
+    parser.add_argument('--writes', type=int, default=4000, help='total review writes per run')
+    parser.add_argument('--synchronous', choices=('NORMAL', 'FULL'), default='NORMAL')
+    args = parser.parse_args()
+
+    original = app_module.DATABASE, app_module.SHARD_COUNT, db.PRAGMAS
+    db.PRAGMAS = tuple((name, args.synchronous if name == 'synchronous' else value)
+                       for name, value in db.PRAGMAS)
+    try:
+        baseline = None
+        for shard_count in (int(n) for n in args.shards.split(',')):
+            rate = run(shard_count, args.processes, args.users, args.writes, args.cards)
+            baseline = baseline or rate
+            label = 'single file' if shard_count == 0 else f'{shard_count} shards'
+            print(f'{label:12s} {rate:9.0f} writes/s  x{rate / baseline:4.2f}')
+    finally:
+        app_module.DATABASE, app_module.SHARD_COUNT, db.PRAGMAS = original
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare two load test reports written by benchmarks.load.
+
+Prints throughput and p50/p99 latency changes per endpoint and exits with
+status 1 when any endpoint's p99 got slower by more than --threshold
+percent, so it can gate a CI job.
+
+Usage: python -m benchmarks.compare baseline.json candidate.json [--threshold 20]
+"""
+
+import argparse
+import json
+import sys
+
+
+def change(old, new):
+    """Relative change in percent (None when there is no baseline)"""
+    if not old:
+        return None
+    return (new - old) / old * 100
+
+
+def fmt(pct):
+    return '     n/a' if pct is None else f'{pct:+7.1f}%'
+
+
+def compare(baseline, candidate, threshold):
+    """Return (lines, regressions) for two loaded reports"""
+    lines = [f'{"endpoint":28s} {"req/s":>8s} {"p50":>8s} {"p99":>8s}']
+    regressions = []
+    for label, new in candidate['endpoints'].items():
+        old = baseline['endpoints'].get(label)
+        if old is None:
+            lines.append(f'{label:28s} (new)')
+            continue
+        p99 = change(old['p99_ms'], new['p99_ms'])
+        lines.append(f'{label:28s} {fmt(change(old["throughput_rps"], new["throughput_rps"]))} '
+                     f'{fmt(change(old["p50_ms"], new["p50_ms"]))} {fmt(p99)}')
+        if p99 is not None and p99 > threshold:
+            regressions.append(label)
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='p99 slowdown (percent) counted as a regression')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f'{baseline["meta"].get("commit")} -> {candidate["meta"].get("commit")} '
+          f'({candidate["meta"].get("transport")})')
+    lines, regressions = compare(baseline, candidate, args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f'p99 regression above {args.threshold:g}%: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Load test: replay study sessions against the API and record latencies.
+
+Each virtual user logs in, loads their deck and due queue, answers 50
+cards (flushed in batches, as the web client does), reads stats, imports a
+few cards and logs out. Sessions run concurrently through either the Flask
+test client (no network, measures the app itself) or a real multi-threaded
+WSGI server over HTTP. The report (throughput and latency percentiles per
+endpoint) is written as JSON; compare two reports with benchmarks.compare.
+
+Usage: python -m benchmarks.load [--transport client|http] [--database seeded.db]
+                                 [--users 200] [--cards 5000] [--sessions 200]
+                                 [--threads 16] [--output report.json]
+"""
+
+import argparse
+import functools
+import http.cookiejar
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from werkzeug.serving import make_server
+
+import app as app_module
+from benchmarks import seed as seeder
+
+
+REVIEWS_PER_SESSION = 50
+REVIEW_FLUSH_EVERY = 10
+IMPORT_ROWS = 20
+
+
+# Transports
+
+class ClientTransport:
+    """One Flask test client (and cookie jar) per virtual user"""
+
+    def __init__(self):
+        self.client = app_module.app.test_client()
+
+    def request(self, method, path, body=None, content_type=None):
+        response = self.client.open(path, method=method, data=body, content_type=content_type)
+        return response.status_code, response.get_data()
+
+
+class HttpTransport:
+    """One urllib opener (and cookie jar) per virtual user"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {'Content-Type': content_type} if content_type else {}
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+# Scenario
+
+class Recorder:
+    """Collects (label, seconds, status) samples from all session threads"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def timed(self, transport, label, method, path, body=None, content_type=None):
+        start = time.perf_counter()
+        status, payload = transport.request(method, path, body, content_type)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples.append((label, elapsed, status))
+        return status, payload
+
+
+def json_body(payload):
+    return json.dumps(payload).encode()
+
+
+def study_session(transport, recorder, name, password, rng):
+    """Run one virtual user's session"""
+    rec = recorder.timed
+    status, _ = rec(transport, 'POST /api/login', 'POST', '/api/login',
+                 json_body({'name': name, 'password': password}), 'application/json')
+    if status != 200:
+        return
+
+    deck_status, deck = rec(transport, 'GET /api/flashcards', 'GET', '/api/flashcards')
+    due_status, due = rec(transport, 'GET /api/flashcards/due', 'GET',
+                          f'/api/flashcards/due?limit={REVIEWS_PER_SESSION}')
+
+    # Answer the due cards first, topped up with random cards from the deck
+    cards = json.loads(due)['cards'] if due_status == 200 else []
+    deck = json.loads(deck) if deck_status == 200 else []
+    cards += rng.sample(deck, min(len(deck), REVIEWS_PER_SESSION - len(cards)))
+    pending = []
+    for card in cards:
+        correct = rng.random() < 0.8
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        pending.append({
+            'id': card['id'],
+            'level': min(card['level'] + 1, 7) if correct else 0,
+            'streak': card['streak'] + 1 if correct else 0,
+            'correctCount': card['correctCount'] + int(correct),
+            'incorrectCount': card['incorrectCount'] + int(not correct),
+            'lastReview': now,
+            'nextReview': now,
+        })
+        if len(pending) == REVIEW_FLUSH_EVERY:
+            rec(transport, 'POST /api/reviews/batch', 'POST', '/api/reviews/batch',
+                json_body({'reviews': pending}), 'application/json')
+            pending = []
+    if pending:
+        rec(transport, 'POST /api/reviews/batch', 'POST', '/api/reviews/batch',
+            json_body({'reviews': pending}), 'application/json')
+
+    rec(transport, 'GET /api/stats', 'GET', '/api/stats')
+
+    rows = '\n'.join(f'字{rng.randrange(10 ** 6)},zi{i},,imported {i}' for i in range(IMPORT_ROWS))
+    rec(transport, 'POST /api/flashcards/bulk', 'POST', '/api/flashcards/bulk',
+        rows.encode(), 'text/csv')
+
+    rec(transport, 'POST /api/logout', 'POST', '/api/logout')
+
+
+# Report
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples, elapsed):
+    """Per-endpoint and overall throughput and latency percentiles (ms)"""
+    by_label = {}
+    for label, seconds, status in samples:
+        by_label.setdefault(label, []).append((seconds, status))
+
+    def stats(entries):
+        times = [seconds for seconds, _ in entries]
+        return {
+            'count': len(entries),
+            'errors': sum(1 for _, status in entries if status >= 400),
+            'throughput_rps': round(len(entries) / elapsed, 2),
+            'p50_ms': round(percentile(times, 50) * 1000, 2),
+            'p90_ms': round(percentile(times, 90) * 1000, 2),
+            'p99_ms': round(percentile(times, 99) * 1000, 2),
+            'max_ms': round(max(times) * 1000, 2),
+        }
+
+    return {
+        'duration_s': round(elapsed, 3),
+        'total': stats([(seconds, status) for _, seconds, status in samples]) if samples else {},
+        'endpoints': {label: stats(entries) for label, entries in sorted(by_label.items())},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runner
+
+def run(transport_name, user_ids, sessions, threads, password=seeder.PASSWORD, rng_seed=0):
+    """Run `sessions` study sessions over `threads` threads; returns the summary
+
+    The app must already point at a seeded database.
+    """
+    server = None
+    if transport_name == 'http':
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        make_transport = functools.partial(HttpTransport, base_url)
+    else:
+        make_transport = ClientTransport
+
+    recorder = Recorder()
+
+    def one_session(index):
+        rng = random.Random(rng_seed + index)
+        name = seeder.user_name(user_ids[rng.randrange(len(user_ids))])
+        study_session(make_transport(), recorder, name, password, rng)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one_session, range(sessions)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+    return summarize(recorder.samples, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--transport', choices=('client', 'http'), default='client')
+    parser.add_argument('--database', help='reuse a database made by benchmarks.seed')
+    parser.add_argument('--users', type=int, default=200, help='users to seed (no --database)')
+    parser.add_argument('--cards', type=int, default=5000, help='cards per seeded user')
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--output', help='report path (default: bench-<commit>-<transport>.json)')
+    args = parser.parse_args()
+
+    original_db = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database:
+            app_module.DATABASE = args.database
+            cursor = app_module.get_db().cursor()
+            cursor.execute("SELECT id FROM users WHERE name LIKE 'bench%'")
+            user_ids = [row[0] for row in cursor.fetchall()]
+        else:
+            path = os.path.join(tmp, 'bench.db')
+            user_ids = seeder.seed(path, args.users, args.cards)
+            app_module.DATABASE = path
+
+        try:
+            summary = run(args.transport, user_ids, args.sessions, args.threads)
+        finally:
+            app_module.close_db_connections()
+            app_module.DATABASE = original_db
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'transport': args.transport,
+            'sessions': args.sessions,
+            'threads': args.threads,
+            'users': len(user_ids),
+            'cards_per_user': None if args.database else args.cards,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        **summary,
+    }
+    output = args.output or f'bench-{commit or "local"}-{args.transport}.json'
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for label, entry in report['endpoints'].items():
+        print(f'{label:28s} n {entry["count"]:6d}  err {entry["errors"]:4d}  '
+              f'{entry["throughput_rps"]:8.1f} req/s  p50 {entry["p50_ms"]:8.2f} ms  '
+              f'p99 {entry["p99_ms"]:8.2f} ms')
+    print(f'report written to {output}')
+
+
+if __name__ == '__main__':
+    main()
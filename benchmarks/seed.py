@@ -0,0 +1,113 @@
+"""
+Fast synthetic data seeder for load tests.
+
+Users are inserted with executemany and their decks are generated inside
+SQLite with a recursive CTE (one INSERT ... SELECT per chunk of users), so
+millions of cards are created without building Python rows. Decks are
+drawn from one shared vocabulary in the card catalog, as for users who
+import the same word lists.
+
+Usage: python -m benchmarks.seed flashcards_bench.db [--users 10000] [--cards 5000]
+"""
+
+import argparse
+import time
+
+import app as app_module
+from passwords import PasswordHasher
+
+
+PASSWORD = 'bench-password'
+USERS_PER_CHUNK = 100
+VOCABULARY_SIZE = 20000  # distinct catalog cards; decks above this size repeat words
+
+
+def user_name(index):
+    """Name of the index-th synthetic user"""
+    return f'bench{index}'
+
+
+def seed(path, users, cards_per_user, password=PASSWORD):
+    """Create (or extend) the database at path with synthetic users and decks
+
+    Returns the ids of the created users.
+    """
+    original_db = app_module.DATABASE
+    app_module.DATABASE = path
+    try:
+        app_module.init_db()
+        conn = app_module.get_db()
+        cursor = conn.cursor()
+
+        # One real hash, shared by every user, with the app's cost settings
+        hasher = PasswordHasher(workers=0, scrypt_n=app_module.PASSWORD_SCRYPT_N)
+        password_hash = hasher.hash(password)
+
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM users')
+        first = cursor.fetchone()[0] + 1
+        cursor.executemany('INSERT INTO users (name, password_hash) VALUES (?, ?)',
+                           [(user_name(first + i), password_hash) for i in range(users)])
+        user_ids = list(range(first, first + users))
+
+        # Shared vocabulary in the card catalog; decks reference it
+        cursor.execute('''
+            WITH RECURSIVE n(i) AS (
+                SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?
+            )
+            INSERT OR IGNORE INTO cards (character, pinyin, zhuyin, meaning)
+            SELECT char(19968 + i), 'pin' || (i % 400), NULL, 'meaning ' || i FROM n
+        ''', (VOCABULARY_SIZE,))
+
+        for start in range(0, users, USERS_PER_CHUNK):
+            chunk = user_ids[start:start + USERS_PER_CHUNK]
+            cursor.execute('''
+                WITH RECURSIVE n(i) AS (
+                    SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?
+                ),
+                deck(user_id, i, word) AS (
+                    SELECT users.id, n.i, (n.i * 7 + users.id) % ?
+                    FROM users CROSS JOIN n
+                    WHERE users.id BETWEEN ? AND ?
+                )
+                INSERT INTO user_cards (user_id, card_id, level, last_review, next_review,
+                                        correct_count, incorrect_count, streak, updated_rev)
+                SELECT deck.user_id,
+                       cards.id,
+                       deck.i % 8,
+                       NULL,
+                       strftime('%Y-%m-%dT%H:%M:%fZ', 'now',
+                                ((deck.i * 13 + deck.user_id) % 60 - 20) || ' days'),
+                       deck.i % 5,
+                       deck.i % 3,
+                       deck.i % 4,
+                       0
+                FROM deck JOIN cards
+                  ON cards.character = char(19968 + deck.word)
+                 AND coalesce(cards.pinyin, '') = 'pin' || (deck.word % 400)
+                 AND coalesce(cards.zhuyin, '') = ''
+                 AND cards.meaning = 'meaning ' || deck.word
+                ORDER BY deck.user_id, deck.i
+            ''', (cards_per_user, VOCABULARY_SIZE, chunk[0], chunk[-1]))
+            conn.commit()
+
+        return user_ids
+    finally:
+        app_module.DATABASE = original_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('database')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--cards', type=int, default=5000, help='cards per user')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed(args.database, args.users, args.cards)
+    app_module.close_db_connections()
+    elapsed = time.perf_counter() - start
+    print(f'{args.users} users x {args.cards} cards seeded in {elapsed:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
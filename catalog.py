@@ -0,0 +1,246 @@
+"""
+Shared card catalog for the flashcards application.
+
+Card content (character, pinyin, zhuyin, meaning) is stored once in the
+cards table, whatever the number of users holding it. A user's deck is a
+set of slim user_cards rows: a reference to the catalog plus the review
+progress. Importing a prebuilt shared deck (shared_decks and
+shared_deck_cards) is a single INSERT ... SELECT of references.
+
+The flashcards view joins the two back into the original row shape, so
+reads keep their queries, and its INSTEAD OF triggers route writes made
+through it (maintenance scripts, benchmarks) to the right table. The
+application writes progress to user_cards directly. user_cards ids are
+the card ids of the API.
+
+Catalog rows are never deleted: they are shared, and reused when the same
+content is added again.
+
+Databases created before the split are converted in place by
+create_schema().
+"""
+
+
+# Content equality as used by the idx_cards_content unique index; a missing
+# pinyin or zhuyin matches NULL or ''. Parameters: character, pinyin,
+# zhuyin, meaning.
+CONTENT_MATCH = '''character = ? AND coalesce(pinyin, '') = coalesce(?, '')
+                   AND coalesce(zhuyin, '') = coalesce(?, '') AND meaning = ?'''
+
+_NEW_CONTENT_MATCH = '''character = NEW.character AND coalesce(pinyin, '') = coalesce(NEW.pinyin, '')
+                        AND coalesce(zhuyin, '') = coalesce(NEW.zhuyin, '') AND meaning = NEW.meaning'''
+
+# Progress columns of user_cards, in flashcards order
+PROGRESS_COLUMNS = ('level', 'last_review', 'next_review', 'correct_count', 'incorrect_count',
+                    'streak', 'created_at', 'updated_rev')
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS cards (
+        id INTEGER PRIMARY KEY,
+        character TEXT NOT NULL,
+        pinyin TEXT,
+        zhuyin TEXT,
+        meaning TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_cards_content
+    ON cards (character, coalesce(pinyin, ''), coalesce(zhuyin, ''), meaning)
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_cards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        card_id INTEGER NOT NULL,
+        level INTEGER DEFAULT 0,
+        last_review TIMESTAMP,
+        next_review TIMESTAMP NOT NULL,
+        correct_count INTEGER DEFAULT 0,
+        incorrect_count INTEGER DEFAULT 0,
+        streak INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_rev INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (card_id) REFERENCES cards (id)
+    )
+    ''',
+    # Shared-deck imports skip catalog cards the user already holds
+    'CREATE INDEX IF NOT EXISTS idx_user_cards_user_card ON user_cards (user_id, card_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS shared_decks (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS shared_deck_cards (
+        deck_id INTEGER NOT NULL,
+        card_id INTEGER NOT NULL,
+        PRIMARY KEY (deck_id, card_id),
+        FOREIGN KEY (deck_id) REFERENCES shared_decks (id),
+        FOREIGN KEY (card_id) REFERENCES cards (id)
+    ) WITHOUT ROWID
+    ''',
+]
+
+VIEW = [
+    '''
+    CREATE VIEW IF NOT EXISTS flashcards AS
+    SELECT u.id, u.user_id, c.character, c.pinyin, c.zhuyin, c.meaning, u.level, u.last_review,
+           u.next_review, u.correct_count, u.incorrect_count, u.streak, u.created_at,
+           u.updated_rev, u.card_id
+    FROM user_cards u JOIN cards c ON c.id = u.card_id
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS flashcards_instead_of_insert INSTEAD OF INSERT ON flashcards
+    BEGIN
+        INSERT OR IGNORE INTO cards (character, pinyin, zhuyin, meaning)
+        VALUES (NEW.character, NEW.pinyin, NEW.zhuyin, NEW.meaning);
+        INSERT INTO user_cards (id, user_id, card_id, level, last_review, next_review, correct_count,
+                                incorrect_count, streak, created_at, updated_rev)
+        SELECT NEW.id, NEW.user_id, id, coalesce(NEW.level, 0), NEW.last_review, NEW.next_review,
+               coalesce(NEW.correct_count, 0), coalesce(NEW.incorrect_count, 0),
+               coalesce(NEW.streak, 0), coalesce(NEW.created_at, CURRENT_TIMESTAMP),
+               coalesce(NEW.updated_rev, 0)
+        FROM cards WHERE {_NEW_CONTENT_MATCH};
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS flashcards_instead_of_update INSTEAD OF UPDATE ON flashcards
+    BEGIN
+        INSERT OR IGNORE INTO cards (character, pinyin, zhuyin, meaning)
+        SELECT NEW.character, NEW.pinyin, NEW.zhuyin, NEW.meaning
+        WHERE NEW.character IS NOT OLD.character OR NEW.pinyin IS NOT OLD.pinyin
+           OR NEW.zhuyin IS NOT OLD.zhuyin OR NEW.meaning IS NOT OLD.meaning;
+        UPDATE user_cards SET
+            card_id = (SELECT id FROM cards WHERE {_NEW_CONTENT_MATCH}),
+            level = NEW.level, last_review = NEW.last_review, next_review = NEW.next_review,
+            correct_count = NEW.correct_count, incorrect_count = NEW.incorrect_count,
+            streak = NEW.streak, updated_rev = NEW.updated_rev
+        WHERE id = OLD.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS flashcards_instead_of_delete INSTEAD OF DELETE ON flashcards
+    BEGIN
+        DELETE FROM user_cards WHERE id = OLD.id;
+    END
+    ''',
+]
+
+
+def create_schema(cursor):
+    """Create the catalog, progress and shared-deck tables and the flashcards view
+
+    A flashcards table from before the split is migrated first.
+    """
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'flashcards'")
+    row = cursor.fetchone()
+    for statement in TABLES:
+        cursor.execute(statement)
+    if row is not None and row[0] == 'table':
+        migrate(cursor)
+    for statement in VIEW:
+        cursor.execute(statement)
+
+
+def migrate(cursor):
+    """Move a flashcards table into cards and user_cards, keeping card ids
+
+    The table's triggers and indexes go with it; the callers' create_schema
+    functions recreate them on user_cards.
+    """
+    cursor.execute('PRAGMA table_info(flashcards)')
+    has_updated_rev = 'updated_rev' in [row[1] for row in cursor.fetchall()]
+
+    cursor.execute('''
+        INSERT OR IGNORE INTO cards (character, pinyin, zhuyin, meaning)
+        SELECT character, pinyin, zhuyin, meaning FROM flashcards ORDER BY id
+    ''')
+    cursor.execute(f'''
+        INSERT INTO user_cards (id, user_id, card_id, {', '.join(PROGRESS_COLUMNS)})
+        SELECT f.id, f.user_id, c.id, f.level, f.last_review, f.next_review, f.correct_count,
+               f.incorrect_count, f.streak, f.created_at, {'f.updated_rev' if has_updated_rev else 0}
+        FROM flashcards f JOIN cards c
+          ON c.character = f.character AND coalesce(c.pinyin, '') = coalesce(f.pinyin, '')
+         AND coalesce(c.zhuyin, '') = coalesce(f.zhuyin, '') AND c.meaning = f.meaning
+    ''')
+
+    # Ids of deleted cards must stay unused (the sync feed reports them)
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'flashcards'")
+    row = cursor.fetchone()
+    if row is not None:
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'user_cards'")
+        cursor.execute('''
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'user_cards', max(?, coalesce((SELECT max(id) FROM user_cards), 0))
+        ''', (row[0],))
+
+    cursor.execute('DROP TABLE flashcards')
+
+
+def add_card(cursor, user_id, content, next_review, rev):
+    """Add one card (character, pinyin, zhuyin, meaning) to a deck; returns its id"""
+    cursor.execute('INSERT OR IGNORE INTO cards (character, pinyin, zhuyin, meaning) VALUES (?, ?, ?, ?)',
+                   content)
+    cursor.execute(f'''
+        INSERT INTO user_cards (user_id, card_id, next_review, updated_rev)
+        SELECT ?, id, ?, ? FROM cards WHERE {CONTENT_MATCH}
+    ''', (user_id, next_review, rev, *content))
+    return cursor.lastrowid
+
+
+def add_cards(cursor, user_id, contents, next_review, rev):
+    """Add a list of card contents to a deck"""
+    cursor.executemany('INSERT OR IGNORE INTO cards (character, pinyin, zhuyin, meaning) VALUES (?, ?, ?, ?)',
+                       contents)
+    cursor.executemany(f'''
+        INSERT INTO user_cards (user_id, card_id, next_review, updated_rev)
+        SELECT ?, id, ?, ? FROM cards WHERE {CONTENT_MATCH}
+    ''', [(user_id, next_review, rev, *content) for content in contents])
+
+
+def load_shared_deck(cursor, name, contents):
+    """Create or extend the shared deck `name` with card contents; returns its size"""
+    cursor.execute('INSERT OR IGNORE INTO shared_decks (name) VALUES (?)', (name,))
+    cursor.execute('SELECT id FROM shared_decks WHERE name = ?', (name,))
+    deck_id = cursor.fetchone()[0]
+    cursor.executemany('INSERT OR IGNORE INTO cards (character, pinyin, zhuyin, meaning) VALUES (?, ?, ?, ?)',
+                       contents)
+    cursor.executemany(f'''
+        INSERT OR IGNORE INTO shared_deck_cards (deck_id, card_id)
+        SELECT ?, id FROM cards WHERE {CONTENT_MATCH}
+    ''', [(deck_id, *content) for content in contents])
+    cursor.execute('SELECT COUNT(*) FROM shared_deck_cards WHERE deck_id = ?', (deck_id,))
+    return cursor.fetchone()[0]
+
+
+def shared_decks(cursor):
+    """[{'name', 'cardCount'}] of every shared deck, by name"""
+    cursor.execute('''
+        SELECT d.name, COUNT(c.card_id)
+        FROM shared_decks d LEFT JOIN shared_deck_cards c ON c.deck_id = d.id
+        GROUP BY d.id
+        ORDER BY d.name
+    ''')
+    return [{'name': row[0], 'cardCount': row[1]} for row in cursor.fetchall()]
+
+
+def import_shared_deck(cursor, user_id, name, next_review, rev):
+    """Add the cards of a shared deck the user does not hold yet
+
+    Returns how many were added, or None if there is no such deck.
+    """
+    cursor.execute('SELECT id FROM shared_decks WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute('''
+        INSERT INTO user_cards (user_id, card_id, next_review, updated_rev)
+        SELECT ?, card_id, ?, ? FROM shared_deck_cards
+        WHERE deck_id = ?
+          AND card_id NOT IN (SELECT card_id FROM user_cards WHERE user_id = ?)
+        ORDER BY card_id
+    ''', (user_id, next_review, rev, row[0], user_id))
+    return cursor.rowcount
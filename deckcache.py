@@ -0,0 +1,98 @@
+"""
+In-process cache of serialized decks for the flashcards application.
+
+GET /api/flashcards re-sends a user's whole deck after every change made
+by the web client. The encoded payloads are kept here, per user and per
+representation (format, fields, gzip; see deckformat.py), tagged with the
+deck revision they were built from, in an LRU bounded by total payload size.
+
+Entries are dropped when the owner's deck changes (bump_revision), and a
+lookup only hits if the stored revision equals the current one, so another
+worker process writing the deck can never make this one serve stale data.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+MAX_BYTES = 64 * 1024 * 1024
+MAX_ENTRY_FRACTION = 8  # decks above MAX_BYTES / 8 are not cached
+
+
+class DeckCache:
+    """Thread-safe LRU of (revision, {variant: payload bytes}) per user, bounded in bytes."""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id, rev, variant=''):
+        """Payload of a variant of user_id's deck at revision rev, or None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            payload = entry[1].get(variant) if entry is not None and entry[0] == rev else None
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return payload
+
+    def put(self, user_id, rev, payload, variant=''):
+        """Store a payload, evicting least recently used decks to fit"""
+        if len(payload) > self.max_bytes // MAX_ENTRY_FRACTION:
+            return
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != rev:
+                self._discard(user_id)
+                entry = self._entries[user_id] = (rev, {})
+            else:
+                self._entries.move_to_end(user_id)
+                self.size -= len(entry[1].pop(variant, b''))
+            entry[1][variant] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= sum(map(len, evicted.values()))
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        """Forget a user's deck (called on every write to it)"""
+        with self._lock:
+            self._discard(user_id)
+
+    def clear(self):
+        """Forget every deck"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _discard(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.size -= sum(map(len, entry[1].values()))
+
+    def collect(self):
+        """Prometheus text lines for the counters (see Metrics.add_collector)"""
+        with self._lock:
+            return [
+                '# TYPE flashcards_deck_cache_hits_total counter',
+                f'flashcards_deck_cache_hits_total {self.hits}',
+                '# TYPE flashcards_deck_cache_misses_total counter',
+                f'flashcards_deck_cache_misses_total {self.misses}',
+                '# TYPE flashcards_deck_cache_evictions_total counter',
+                f'flashcards_deck_cache_evictions_total {self.evictions}',
+                '# TYPE flashcards_deck_cache_entries gauge',
+                f'flashcards_deck_cache_entries {len(self._entries)}',
+                '# TYPE flashcards_deck_cache_bytes gauge',
+                f'flashcards_deck_cache_bytes {self.size}',
+            ]
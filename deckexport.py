@@ -0,0 +1,66 @@
+"""
+Deck export files for GET /api/flashcards/export.
+
+Exports are streamed: rows are read from a cursor in batches, written with
+the csv module (so fields holding commas, quotes or newlines survive) and
+sent as they are produced, optionally through an incremental gzip stream.
+Memory use does not grow with the deck.
+
+Formats:
+
+- csv: character,pinyin,zhuyin,meaning, the four-column import format;
+- tsv: the same columns separated by tabs;
+- apkg-like: tab-separated notes with the header lines Anki's text import
+  reads (separator, html, columns). A real .apkg is a zipped SQLite
+  collection and cannot be written as a stream.
+"""
+
+import csv
+import io
+import zlib
+
+
+# Exported flashcards columns, in file order
+COLUMNS = ('character', 'pinyin', 'zhuyin', 'meaning')
+
+CSV = 'csv'
+TSV = 'tsv'
+ANKI = 'apkg-like'
+
+# format -> (delimiter, mimetype, file name)
+FORMATS = {
+    CSV: (',', 'text/csv', 'chinese_flashcards.csv'),
+    TSV: ('\t', 'text/tab-separated-values', 'chinese_flashcards.tsv'),
+    ANKI: ('\t', 'text/plain', 'chinese_flashcards_anki.txt'),
+}
+
+ANKI_HEADER = '#separator:tab\n#html:false\n#columns:Character\tPinyin\tZhuyin\tMeaning\n'
+
+GZIP_LEVEL = 6
+
+
+def generate(cursor, fmt, batch_size):
+    """Yield the export file of the rows selected on cursor, batch_size rows at a time"""
+    delimiter = FORMATS[fmt][0]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator='\n')
+    if fmt == ANKI:
+        yield ANKI_HEADER
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        writer.writerows(['' if value is None else value for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzip_stream(chunks):
+    """Gzip a stream of text chunks incrementally"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
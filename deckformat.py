@@ -0,0 +1,113 @@
+"""
+Wire formats for decks served by GET /api/flashcards.
+
+The default is a JSON array of card objects, which repeats every field
+name on every card. Clients can ask instead (Accept header or ?format=)
+for:
+
+- columns: one JSON object holding an array per field,
+  {"id": [1, 2], "character": ["一", "二"], ...};
+- msgpack: the same columns encoded as MessagePack. It needs the optional
+  msgpack package and is not offered when it is missing.
+
+?fields=character,pinyin,meaning keeps only the listed fields, read from
+SQLite and sent in the FIELDS order. Bodies of GZIP_MIN_BYTES or more are
+gzipped for clients that accept it.
+"""
+
+import gzip
+
+try:
+    import msgpack
+except ImportError:  # optional: pip install msgpack
+    msgpack = None
+
+
+# JSON field name -> flashcards column, in response order
+FIELDS = {
+    'id': 'id',
+    'character': 'character',
+    'pinyin': 'pinyin',
+    'zhuyin': 'zhuyin',
+    'meaning': 'meaning',
+    'level': 'level',
+    'lastReview': 'last_review',
+    'nextReview': 'next_review',
+    'correctCount': 'correct_count',
+    'incorrectCount': 'incorrect_count',
+    'streak': 'streak',
+}
+
+JSON = 'json'
+COLUMNS = 'columns'
+MSGPACK = 'msgpack'
+
+MIMETYPES = {
+    JSON: 'application/json',
+    COLUMNS: 'application/vnd.flashcards.columns+json',
+    MSGPACK: 'application/msgpack',
+}
+
+GZIP_MIN_BYTES = 1024  # smaller bodies are sent as is
+GZIP_LEVEL = 6
+
+
+def formats():
+    """Names of the formats this process can produce"""
+    return [name for name in MIMETYPES if name != MSGPACK or msgpack is not None]
+
+
+def negotiate(request):
+    """Format named by ?format= or preferred by the Accept header, None if unsupported"""
+    name = request.args.get('format')
+    if name is not None:
+        return name if name in formats() else None
+    mimetype = request.accept_mimetypes.best_match([MIMETYPES[name] for name in formats()],
+                                                   default=MIMETYPES[JSON])
+    return next(name for name in formats() if MIMETYPES[name] == mimetype)
+
+
+def parse_fields(value):
+    """Parse ?fields= into a tuple in FIELDS order; all fields if absent, None if invalid"""
+    if value is None:
+        return tuple(FIELDS)
+    names = {name.strip() for name in value.split(',')}
+    if not names <= FIELDS.keys():
+        return None
+    return tuple(name for name in FIELDS if name in names)
+
+
+def variant(fmt, fields):
+    """Suffix telling apart the ETags (and cache entries) of a deck's representations"""
+    if fmt == JSON and fields == tuple(FIELDS):
+        return ''
+    if fields == tuple(FIELDS):
+        return fmt
+    return f"{fmt}-{'.'.join(fields)}"
+
+
+def select_list(fields):
+    """SQL select list for fields, in order"""
+    return ', '.join(FIELDS[name] for name in fields)
+
+
+def cards(rows, fields, fmt):
+    """Cards for rows selected with select_list(fields) (extra trailing columns are ignored)"""
+    if fmt == JSON:
+        return [dict(zip(fields, row)) for row in rows]
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    return {name: list(column) for name, column in zip(fields, columns)}
+
+
+def encode(data, fmt, dumps):
+    """Body bytes for data; dumps is the app's JSON encoder"""
+    if fmt == MSGPACK:
+        return msgpack.packb(data)
+    return (dumps(data) + '\n').encode()
+
+
+def compress(payload):
+    """Gzipped payload, or None if it is too small to be worth it"""
+    if len(payload) < GZIP_MIN_BYTES:
+        return None
+    return gzip.compress(payload, compresslevel=GZIP_LEVEL, mtime=0)
@@ -1,8 +1,10 @@
 // Flashcard Review Game Mode
 
-function startFlashcardMode() {
+let dueQueue = [];
+
+async function startFlashcardMode() {
     currentGame = 'flashcard';
-    const dueCards = getDueCards();
+    const dueCards = await fetchDueCards();
 
     if (dueCards.length === 0) {
         alert('Aucune carte à réviser ! Excellent travail ! 🎉');
@@ -14,7 +16,8 @@ function startFlashcardMode() {
 
     currentCardIndex = 0;
     sessionStats = { correct: 0, incorrect: 0, streak: 0 };
-    showFlashcard(dueCards);
+    dueQueue = dueCards;
+    showFlashcard(dueQueue);
 }
 
 function showFlashcard(cards) {
@@ -66,8 +69,7 @@ function revealAnswer() {
 }
 
 function answerFlashcard(correct) {
-    const dueCards = getDueCards();
-    const card = dueCards[currentCardIndex];
+    const card = dueQueue[currentCardIndex];
     cardAnswered(card, correct);
 
     const feedback = document.getElementById('feedback');
@@ -76,6 +78,6 @@ function answerFlashcard(correct) {
 
     setTimeout(() => {
         currentCardIndex++;
-        showFlashcard(dueCards);
+        showFlashcard(dueQueue);
     }, 1000);
 }
@@ -0,0 +1,211 @@
+"""
+Request and SQL instrumentation for the flashcards application.
+
+Latencies go into fixed-bucket histograms whose counts live in
+preallocated lists, so recording a sample is a bisect and two additions
+under one lock. SQL statements are timed by a sqlite3 connection/cursor
+subclass pair, labelled by their leading keyword (SELECT, INSERT, ...).
+Everything is exported in the Prometheus text format.
+
+A statement's time covers execute() only: rows fetched later by
+fetchall()/fetchmany() are not included. Request time stops when the view
+returns, so streamed bodies are not included either.
+"""
+
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+
+# Upper bounds (seconds) of the latency buckets; +Inf is implicit
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+# Distinct SQL strings whose label is memoized
+STATEMENT_LABEL_CACHE_SIZE = 1024
+
+
+class Histogram:
+    """Cumulative-on-export histogram over fixed bucket bounds."""
+
+    __slots__ = ('bounds', 'counts', 'total')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        """Record one sample (callers serialize access)"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def render(self, name, labels):
+        """Prometheus text lines for this histogram"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+def statement_label(sql):
+    """Leading keyword of a SQL statement, e.g. 'SELECT'"""
+    words = sql.split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+
+class Metrics:
+    """Registry of request and SQL metrics for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._requests = {}        # (method, endpoint, status) -> count
+        self._latency = {}         # (method, endpoint) -> Histogram
+        self._request_sql = {}     # (method, endpoint) -> statements executed
+        self._sql = {}             # label -> Histogram
+        self._sql_errors = {}      # label -> count
+        self._labels = {}          # sql -> label
+        self._collectors = []      # callables returning extra exposition lines
+
+    # Requests
+
+    def start_request(self):
+        """Mark the start of a request on the calling thread"""
+        self._local.start = time.perf_counter()
+        self._local.statements = 0
+
+    def end_request(self, method, endpoint, status):
+        """Record a finished request started on the calling thread"""
+        start = getattr(self._local, 'start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        self._local.start = None
+        key = (method, endpoint)
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(REQUEST_BUCKETS)
+            histogram.observe(elapsed)
+            status_key = (method, endpoint, status)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            self._request_sql[key] = self._request_sql.get(key, 0) + self._local.statements
+
+    # SQL
+
+    def observe_sql(self, sql, elapsed, failed=False):
+        """Record one executed statement"""
+        label = self._labels.get(sql)
+        if label is None:
+            label = statement_label(sql)
+            if len(self._labels) < STATEMENT_LABEL_CACHE_SIZE:
+                self._labels[sql] = label
+        if getattr(self._local, 'start', None) is not None:
+            self._local.statements += 1
+        with self._lock:
+            histogram = self._sql.get(label)
+            if histogram is None:
+                histogram = self._sql[label] = Histogram(SQL_BUCKETS)
+            histogram.observe(elapsed)
+            if failed:
+                self._sql_errors[label] = self._sql_errors.get(label, 0) + 1
+
+    def connection_factory(self):
+        """sqlite3.Connection subclass whose statements are recorded here"""
+        return type('InstrumentedConnection', (InstrumentedConnection,), {'metrics': self})
+
+    # Export
+
+    def add_collector(self, collect):
+        """Append the lines returned by collect() to every export"""
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = sorted(self._latency.items())
+            request_sql = sorted(self._request_sql.items())
+            sql = sorted(self._sql.items())
+            sql_errors = sorted(self._sql_errors.items())
+
+            lines = ['# HELP flashcards_http_requests_total HTTP requests by endpoint and status.',
+                     '# TYPE flashcards_http_requests_total counter']
+            for (method, endpoint, status), count in requests:
+                lines.append(f'flashcards_http_requests_total{{method="{method}",'
+                             f'endpoint="{endpoint}",status="{status}"}} {count}')
+
+            lines += ['# HELP flashcards_http_request_duration_seconds Time spent in the view.',
+                      '# TYPE flashcards_http_request_duration_seconds histogram']
+            for (method, endpoint), histogram in latency:
+                lines += histogram.render('flashcards_http_request_duration_seconds',
+                                          f'method="{method}",endpoint="{endpoint}"')
+
+            lines += ['# HELP flashcards_http_request_sql_statements_total SQL statements run by endpoint.',
+                      '# TYPE flashcards_http_request_sql_statements_total counter']
+            for (method, endpoint), count in request_sql:
+                lines.append(f'flashcards_http_request_sql_statements_total{{method="{method}",'
+                             f'endpoint="{endpoint}"}} {count}')
+
+            lines += ['# HELP flashcards_sql_statement_duration_seconds SQL execute() time by statement type.',
+                      '# TYPE flashcards_sql_statement_duration_seconds histogram']
+            for label, histogram in sql:
+                lines += histogram.render('flashcards_sql_statement_duration_seconds',
+                                          f'statement="{label}"')
+
+            lines += ['# HELP flashcards_sql_errors_total SQL statements that raised.',
+                      '# TYPE flashcards_sql_errors_total counter']
+            for label, count in sql_errors:
+                lines.append(f'flashcards_sql_errors_total{{statement="{label}"}} {count}')
+        for collect in self._collectors:
+            lines += collect()
+        return '\n'.join(lines) + '\n'
+
+
+# SQLite wrappers
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor reporting execute()/executemany() times to its connection's metrics."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(sql, parameters)
+            failed = False
+            return result
+        finally:
+            self.connection.metrics.observe_sql(sql, time.perf_counter() - start, failed)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+            failed = False
+            return result
+        finally:
+            self.connection.metrics.observe_sql(sql, time.perf_counter() - start, failed)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements all go through TimedCursor."""
+
+    metrics = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
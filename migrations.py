@@ -0,0 +1,70 @@
+"""
+Versioned schema migrations for the flashcards application.
+
+A migration is a (version, name, apply) step; apply(cursor) changes the
+schema. The schema_version table records the steps applied to a database,
+per scope ('users' for the main database, 'decks' for deck databases: the
+main database holds both when unsharded). run() applies the missing steps
+in order, each in its own IMMEDIATE transaction together with its
+schema_version row, so a step is either fully applied or not at all and
+concurrent processes apply it once. When the schema is current, run() only
+reads schema_version.
+
+Steps are append-only: once released, a step is never edited or
+reordered. Index builds get steps of their own (see create_index()), so a
+long build on a large database commits on its own and is not repeated if
+a later step fails.
+"""
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        scope TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (scope, version)
+    )
+'''
+
+
+def current_version(cursor, scope):
+    """Latest version applied to the database in scope, 0 if none"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if cursor.fetchone() is None:
+        return 0
+    cursor.execute('SELECT coalesce(max(version), 0) FROM schema_version WHERE scope = ?', (scope,))
+    return cursor.fetchone()[0]
+
+
+def run(conn, scope, steps):
+    """Apply the steps newer than the database's version; returns the names applied"""
+    cursor = conn.cursor()
+    if current_version(cursor, scope) >= steps[-1][0]:
+        return []
+
+    applied = []
+    for version, name, apply in steps:
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute(SCHEMA)
+            # Another process may have applied it since the first check
+            if current_version(cursor, scope) >= version:
+                conn.rollback()
+                continue
+            apply(cursor)
+            cursor.execute('INSERT INTO schema_version (scope, version, name) VALUES (?, ?, ?)',
+                           (scope, version, name))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(name)
+    return applied
+
+
+def create_index(name, definition):
+    """Step building the index `name` ON definition, e.g. 'user_cards (user_id)'"""
+    def apply(cursor):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+    return apply
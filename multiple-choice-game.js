@@ -1,48 +1,55 @@
 // Multiple Choice Quiz Game Mode
+// Questions (due cards and their distractors) are built by the server
 
-function startMultipleChoice() {
+const QUIZ_LENGTH = 10;
+let quizQuestions = [];
+
+async function startMultipleChoice() {
     currentGame = 'multiplechoice';
     document.getElementById('mainMenu').classList.add('hidden');
     document.getElementById('gameScreen').classList.remove('hidden');
 
-    if (flashcards.length < 4) {
-        alert('Vous avez besoin d\'au moins 4 cartes pour ce jeu !');
+    let data;
+    try {
+        const response = await fetch(`/api/quiz/multiple-choice?n=${QUIZ_LENGTH}`);
+        data = await response.json();
+        if (!response.ok) {
+            alert(data.error || 'Erreur lors du chargement du quiz');
+            returnToMenu();
+            return;
+        }
+    } catch (error) {
+        console.error('Erreur lors du chargement du quiz:', error);
+        alert('Erreur lors du chargement du quiz');
         returnToMenu();
         return;
     }
 
+    // Answers update the loaded cards, like the other game modes
+    const byId = new Map(flashcards.map(card => [card.id, card]));
+    quizQuestions = data.questions.map(question => ({
+        ...question,
+        card: byId.get(question.card.id) || question.card
+    }));
+
     currentCardIndex = 0;
     sessionStats = { correct: 0, incorrect: 0, streak: 0 };
     showMultipleChoice();
 }
 
 function showMultipleChoice() {
-    if (currentCardIndex >= 10 || currentCardIndex >= flashcards.length) {
+    if (currentCardIndex >= quizQuestions.length) {
         showSessionResults();
         return;
     }
 
-    const card = flashcards[currentCardIndex];
-    const options = [card];
-
-    while (options.length < 4) {
-        const random = flashcards[Math.floor(Math.random() * flashcards.length)];
-        if (!options.includes(random)) {
-            options.push(random);
-        }
-    }
-
-    // Shuffle options
-    for (let i = options.length - 1; i > 0; i--) {
-        const j = Math.floor(Math.random() * (i + 1));
-        [options[i], options[j]] = [options[j], options[i]];
-    }
+    const { card, choices } = quizQuestions[currentCardIndex];
 
     const content = document.getElementById('gameContent');
     content.innerHTML = `
         <div class="progress-bar">
-            <div class="progress-fill" style="width: ${(currentCardIndex / Math.min(10, flashcards.length)) * 100}%">
-                ${currentCardIndex} / ${Math.min(10, flashcards.length)}
+            <div class="progress-fill" style="width: ${(currentCardIndex / quizQuestions.length) * 100}%">
+                ${currentCardIndex} / ${quizQuestions.length}
             </div>
         </div>
 
@@ -52,8 +59,8 @@ function showMultipleChoice() {
         </div>
 
         <div class="answer-buttons" id="choiceButtons">
-            ${options.map((opt, i) => `
-                <button class="btn answer-btn" onclick="checkMultipleChoice(${opt === card}, '${opt.meaning}')">${opt.meaning}</button>
+            ${choices.map((choice, i) => `
+                <button class="btn answer-btn" onclick="checkMultipleChoice(${i})">${choice}</button>
             `).join('')}
         </div>
 
@@ -61,8 +68,9 @@ function showMultipleChoice() {
     `;
 }
 
-function checkMultipleChoice(correct, answer) {
-    const card = flashcards[currentCardIndex];
+function checkMultipleChoice(choice) {
+    const { card, choices, answer } = quizQuestions[currentCardIndex];
+    const correct = choice === answer;
     cardAnswered(card, correct);
 
     // Get pronunciation (pinyin and/or zhuyin)
@@ -77,7 +85,7 @@ function checkMultipleChoice(correct, answer) {
     feedback.className = 'feedback ' + (correct ? 'correct' : 'incorrect');
     feedback.innerHTML = correct ?
         `🎉 Correct ! ${card.character} (${pronunciation}) = ${card.meaning}` :
-        `❌ Oups ! ${card.character} (${pronunciation}) = ${card.meaning}<br>Vous avez sélectionné : ${answer}`;
+        `❌ Oups ! ${card.character} (${pronunciation}) = ${card.meaning}<br>Vous avez sélectionné : ${choices[choice]}`;
 
     document.getElementById('choiceButtons').style.display = 'none';
 
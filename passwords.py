@@ -0,0 +1,120 @@
+"""
+Password hashing for the flashcards application.
+
+Passwords are hashed with salted scrypt (PBKDF2-SHA256 where the Python
+build lacks scrypt). Hashing is deliberately slow, so it runs in a bounded
+process pool instead of on the request thread; when too many hashes are
+already queued, callers get HasherBusy instead of piling up.
+
+Stored format: "<algorithm>$<cost parameters>$<salt hex>$<hash hex>".
+Hashes without a "$" are legacy unsalted SHA-256 digests, which are still
+accepted and flagged for rehashing.
+"""
+
+import hashlib
+import hmac
+import secrets
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# scrypt: N (CPU/memory cost), r (block size), p (parallelism)
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+def _derive(password, algorithm, cost, salt):
+    """Compute a password hash (runs inside a pool worker)"""
+    if algorithm == 'scrypt':
+        n, r, p = cost
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r, dklen=KEY_BYTES)
+    if algorithm == 'pbkdf2':
+        (iterations,) = cost
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, KEY_BYTES)
+    raise ValueError(f'Unknown password hash algorithm: {algorithm}')
+
+
+def _init_worker():
+    """Pool processes die on SIGTERM, whatever handler the forking process had"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _parse(stored):
+    """Split a stored hash into (algorithm, cost, salt, digest)"""
+    algorithm, cost, salt, digest = stored.split('$')
+    return algorithm, tuple(int(c) for c in cost.split(',')), bytes.fromhex(salt), bytes.fromhex(digest)
+
+
+def legacy_hash(password):
+    """Unsalted SHA-256, as stored by earlier versions"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in a bounded worker process pool.
+
+    workers=0 computes hashes inline on the calling thread.
+    """
+
+    def __init__(self, workers=2, max_pending=32, scrypt_n=2 ** 14,
+                 pbkdf2_iterations=600000, timeout=30):
+        self.workers = workers
+        self.timeout = timeout
+        if hasattr(hashlib, 'scrypt'):
+            self.algorithm, self.cost = 'scrypt', (scrypt_n, SCRYPT_R, SCRYPT_P)
+        else:
+            self.algorithm, self.cost = 'pbkdf2', (pbkdf2_iterations,)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _run(self, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            if not self.workers:
+                return _derive(*args)
+            with self._pool_lock:
+                # Started lazily so that forking servers get one pool per process
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            return self._pool.submit(_derive, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Return a new salted hash of password in the stored format"""
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = self._run(password, self.algorithm, self.cost, salt)
+        cost = ','.join(str(c) for c in self.cost)
+        return f'{self.algorithm}${cost}${salt.hex()}${digest.hex()}'
+
+    def verify(self, password, stored):
+        """Check password against a stored hash (new or legacy format)"""
+        if '$' not in stored:
+            return hmac.compare_digest(legacy_hash(password), stored)
+        algorithm, cost, salt, digest = _parse(stored)
+        return hmac.compare_digest(self._run(password, algorithm, cost, salt), digest)
+
+    def needs_rehash(self, stored):
+        """True if stored was made with a legacy scheme or other cost settings"""
+        if '$' not in stored:
+            return True
+        algorithm, cost, _, _ = _parse(stored)
+        return (algorithm, cost) != (self.algorithm, self.cost)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
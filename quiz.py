@@ -0,0 +1,164 @@
+"""
+Server-generated multiple-choice quizzes for the flashcards application.
+
+Each question asks for the meaning of a due card, with three distractors
+drawn from the same user's deck: cards sharing the first pinyin syllable
+(tones ignored) first, then cards with the same number of characters,
+then any card. The quiz_index table keeps those buckets per user, and
+SQLite triggers on user_cards keep it current for every write path.
+
+Every index row carries a random sample_key. Sampling a bucket seeks to a
+random key in the (user_id, bucket, sample_key) index and reads the next
+few rows, wrapping around, so it costs one index range scan instead of the
+full-bucket sort of ORDER BY RANDOM().
+"""
+
+import random
+
+
+CHOICES = 4            # options per question, the answer included
+SAMPLE_SLACK = 3       # extra rows read per bucket to skip duplicate meanings
+
+# sample_key holds random(): a signed 64-bit integer
+KEY_MIN = -2 ** 63
+KEY_MAX = 2 ** 63 - 1
+
+TONE_MARKS = {
+    'a': 'āáǎà', 'e': 'ēéěè', 'i': 'īíǐì', 'o': 'ōóǒò', 'u': 'ūúǔù', 'ü': 'ǖǘǚǜ',
+}
+
+
+def _replace_marks(expression, vowels):
+    for plain in vowels:
+        for mark in TONE_MARKS[plain]:
+            expression = f"replace({expression}, '{mark}', '{plain}')"
+    return expression
+
+
+# SQLite's parser only nests about 30 function calls, fewer than the 24
+# replace() calls tone stripping takes plus the word split, so syllables
+# are computed in two passes: first_syllable() on the pinyin column, then
+# finish_syllable() on the stored result.
+
+def first_syllable(column):
+    """SQL expression for the lowercased first word of a pinyin column, a/e/i marks removed"""
+    word = f"substr(trim({column}) || ' ', 1, instr(trim({column}) || ' ', ' ') - 1)"
+    return _replace_marks(f'lower({word})', 'aei')
+
+
+def finish_syllable(column):
+    """SQL expression completing first_syllable(): o/u/ü marks and tone numbers removed"""
+    return f"nullif(rtrim({_replace_marks(column, 'ouü')}, '012345'), '')"
+
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS quiz_index (
+        card_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        syllable TEXT,
+        char_length INTEGER NOT NULL,
+        sample_key INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_quiz_syllable ON quiz_index (user_id, syllable, sample_key)',
+    'CREATE INDEX IF NOT EXISTS idx_quiz_length ON quiz_index (user_id, char_length, sample_key)',
+    'CREATE INDEX IF NOT EXISTS idx_quiz_user ON quiz_index (user_id, sample_key)',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS quiz_index_after_insert AFTER INSERT ON user_cards
+    BEGIN
+        INSERT INTO quiz_index (card_id, user_id, syllable, char_length, sample_key)
+        SELECT NEW.id, NEW.user_id, {first_syllable('pinyin')}, length(character), random()
+        FROM cards WHERE id = NEW.card_id;
+        UPDATE quiz_index SET syllable = {finish_syllable('syllable')} WHERE card_id = NEW.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS quiz_index_after_update AFTER UPDATE OF card_id ON user_cards
+    WHEN NEW.card_id IS NOT OLD.card_id
+    BEGIN
+        UPDATE quiz_index SET
+            syllable = (SELECT {first_syllable('pinyin')} FROM cards WHERE id = NEW.card_id),
+            char_length = (SELECT length(character) FROM cards WHERE id = NEW.card_id)
+        WHERE card_id = NEW.id;
+        UPDATE quiz_index SET syllable = {finish_syllable('syllable')} WHERE card_id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS quiz_index_after_delete AFTER DELETE ON user_cards
+    BEGIN
+        DELETE FROM quiz_index WHERE card_id = OLD.id;
+    END
+    ''',
+]
+
+
+def create_schema(cursor):
+    """Create the quiz index and its triggers; backfill if the table is new"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'quiz_index'")
+    existed = cursor.fetchone() is not None
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    if not existed:
+        rebuild(cursor)
+
+
+def rebuild(cursor):
+    """Recompute quiz_index from scratch for every card"""
+    cursor.execute('DELETE FROM quiz_index')
+    cursor.execute(f'''
+        INSERT INTO quiz_index (card_id, user_id, syllable, char_length, sample_key)
+        SELECT id, user_id, {first_syllable('pinyin')}, length(character), random()
+        FROM flashcards
+    ''')
+    cursor.execute(f'UPDATE quiz_index SET syllable = {finish_syllable("syllable")}')
+
+
+def _sample(cursor, user_id, column, value, limit, rng):
+    """Up to limit (id, meaning) rows of a bucket, from a random start key"""
+    bucket = f'AND q.{column} = ?' if column else ''
+    params = [user_id] + ([value] if column else [])
+    start = rng.randint(KEY_MIN, KEY_MAX)
+    rows = []
+    for condition in ('q.sample_key >= ?', 'q.sample_key < ?'):
+        cursor.execute(f'''
+            SELECT f.id, f.meaning
+            FROM quiz_index q JOIN flashcards f ON f.id = q.card_id
+            WHERE q.user_id = ? {bucket} AND {condition}
+            ORDER BY q.sample_key
+            LIMIT ?
+        ''', params + [start, limit - len(rows)])
+        rows += cursor.fetchall()
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def distractors(cursor, user_id, card_id, meaning, rng=random):
+    """Meanings of CHOICES - 1 other cards, closest buckets first"""
+    cursor.execute('SELECT syllable, char_length FROM quiz_index WHERE card_id = ?', (card_id,))
+    row = cursor.fetchone()
+    buckets = [('syllable', row[0]), ('char_length', row[1])] if row else []
+    buckets.append((None, None))
+
+    chosen = []
+    seen = {meaning}
+    needed = CHOICES - 1
+    for column, value in buckets:
+        if column and value is None:
+            continue
+        for other_id, other_meaning in _sample(cursor, user_id, column, value,
+                                               needed + SAMPLE_SLACK, rng):
+            if other_id != card_id and other_meaning not in seen:
+                seen.add(other_meaning)
+                chosen.append(other_meaning)
+                if len(chosen) == needed:
+                    return chosen
+    return chosen
+
+
+def question(cursor, user_id, card, rng=random):
+    """One question for a card dict: the card, shuffled choices, answer index"""
+    choices = [card['meaning']] + distractors(cursor, user_id, card['id'], card['meaning'], rng)
+    rng.shuffle(choices)
+    return {'card': card, 'choices': choices, 'answer': choices.index(card['meaning'])}
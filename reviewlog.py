@@ -0,0 +1,180 @@
+"""
+Append-only review history for the flashcards application.
+
+Every answer is recorded as one row of review_log: clients send the
+answers given since their last update, from which the server schedules
+the card, so a card answered several times between two updates still
+logs each answer. Rows are buffered in memory and written in batches, so recording
+an answer costs no extra transaction on the request path.
+
+A compaction job folds raw rows from past days into review_rollups (one
+row per user and day), which history and heatmap queries read instead of
+the raw events. Run it daily (flask compact-reviews, e.g. from cron) to
+keep review_log to about a day of rows.
+
+Buffered rows not yet flushed are lost if the process crashes; at most
+FLUSH_SIZE rows or FLUSH_INTERVAL seconds of answers per process.
+"""
+
+import threading
+import time
+from datetime import date, timedelta
+
+import scheduler
+
+
+FLUSH_SIZE = 200
+FLUSH_INTERVAL = 10  # seconds
+
+SCHEMA = [
+    # Write-optimized: history reads it through idx_review_log_user_day
+    # (a deck migration), compaction reads it whole
+    '''
+    CREATE TABLE IF NOT EXISTS review_log (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        card_id INTEGER NOT NULL,
+        reviewed_at TEXT NOT NULL,
+        day TEXT NOT NULL,
+        correct INTEGER NOT NULL,
+        level INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS review_rollups (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        reviews INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
+    ''',
+]
+
+
+def create_schema(cursor):
+    """Create the review log and rollup tables"""
+    for statement in SCHEMA:
+        cursor.execute(statement)
+
+
+def review_row(user_id, card_id, review):
+    """Build a review_log row from a review payload, or None if not an answer
+
+    An answer always sets lastReview; a streak of 0 means it was wrong.
+    """
+    return _row(user_id, card_id, review.get('lastReview'), review.get('streak'), review.get('level'))
+
+
+def answer_rows(user_id, card_id, review):
+    """Build the review_log rows of a review payload, one per answer
+
+    The payload's answers list holds {reviewedAt, correct, level} events
+    (see app.apply_answers()); without one (older clients), the final
+    state counts as one answer.
+    """
+    answers = review.get('answers')
+    if answers is None:
+        return [review_row(user_id, card_id, review)]
+    return [_row(user_id, card_id, answer.get('reviewedAt'), answer.get('correct'), answer.get('level'))
+            for answer in answers]
+
+
+def _row(user_id, card_id, reviewed_at, correct, level):
+    if not reviewed_at:
+        return None
+    try:
+        day = scheduler.parse_time(reviewed_at).date().isoformat()
+    except (TypeError, ValueError):
+        return None
+    return (user_id, card_id, reviewed_at, day, int(bool(correct)), level)
+
+
+class ReviewLogBuffer:
+    """Thread-safe in-memory buffer of review_log rows, flushed in batches."""
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, rows):
+        """Queue rows; returns True when the buffer is due for a flush"""
+        rows = [row for row in rows if row is not None]
+        with self._lock:
+            if rows and not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            return bool(self._rows) and (
+                len(self._rows) >= self.flush_size
+                or time.monotonic() - self._oldest >= self.flush_interval)
+
+    def flush(self, connect):
+        """Write all buffered rows, one executemany and commit per database
+
+        connect maps a user_id to the connection holding that user's deck.
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        by_conn = {}
+        for row in rows:
+            by_conn.setdefault(connect(row[0]), []).append(row)
+        for conn, conn_rows in by_conn.items():
+            conn.executemany('''
+                INSERT INTO review_log (user_id, card_id, reviewed_at, day, correct, level)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', conn_rows)
+            conn.commit()
+        return len(rows)
+
+
+def compact(conn, today=None):
+    """Fold raw rows from days before today into review_rollups
+
+    Returns the number of raw rows folded.
+    """
+    today = (today or date.today()).isoformat()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO review_rollups (user_id, day, reviews, correct)
+        SELECT user_id, day, COUNT(*), SUM(correct)
+        FROM review_log
+        WHERE day < ?
+        GROUP BY user_id, day
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            reviews = reviews + excluded.reviews,
+            correct = correct + excluded.correct
+    ''', (today,))
+    cursor.execute('DELETE FROM review_log WHERE day < ?', (today,))
+    folded = cursor.rowcount
+    conn.commit()
+    return folded
+
+
+def history(cursor, user_id, days, today=None):
+    """Return [{day, reviews, correct}] for the last `days` days, oldest first
+
+    Days without reviews are omitted.
+    """
+    today = today or date.today()
+    since = (today - timedelta(days=days - 1)).isoformat()
+    cursor.execute('''
+        SELECT day, SUM(reviews), SUM(correct) FROM (
+            SELECT day, reviews, correct FROM review_rollups
+            WHERE user_id = ? AND day >= ?
+            UNION ALL
+            SELECT day, COUNT(*), SUM(correct) FROM review_log
+            WHERE user_id = ? AND day >= ?
+            GROUP BY day
+        )
+        GROUP BY day
+        ORDER BY day
+    ''', (user_id, since, user_id, since))
+    return [{'day': row[0], 'reviews': row[1], 'correct': row[2]} for row in cursor.fetchall()]
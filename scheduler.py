@@ -0,0 +1,152 @@
+"""
+Spaced-repetition scheduling for the flashcards application.
+
+Owns the review interval table and level transitions (answers sent to
+the review endpoints are scheduled here), and implements bulk
+rescheduling over a whole deck. Bulk operations work column-wise on plain
+lists and return the rows to write back, so a caller can apply them with a
+single executemany.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+
+# Days until the next review for each level (level 0 = review again now)
+INTERVALS = [0, 1, 3, 7, 14, 30, 60, 120]
+MAX_LEVEL = len(INTERVALS) - 1
+
+
+def interval_days(level):
+    """Return the review interval in days for a level"""
+    return INTERVALS[max(0, min(level, MAX_LEVEL))]
+
+
+# Stored review timestamps are UTC with millisecond precision, as the
+# browser's Date.toISOString() writes them ("2024-01-31T08:00:00.000Z"), so
+# they compare correctly as strings in SQL
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+SQL_TIME_FORMAT = '%Y-%m-%dT%H:%M:%fZ'
+
+
+def parse_time(value):
+    """Parse a review timestamp into a naive local datetime
+
+    Accepts the stored UTC format, other ISO offsets, and naive local
+    timestamps as older versions stored them.
+    """
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def format_time(value):
+    """Format a datetime (naive means local time) as a stored review timestamp"""
+    return value.astimezone(timezone.utc).strftime(TIME_FORMAT)[:-3] + 'Z'
+
+
+def current_time():
+    """The current time as a stored review timestamp"""
+    return format_time(datetime.now())
+
+
+def normalize_time(value):
+    """A client-sent review timestamp in the stored format (None stays None)
+
+    Raises ValueError if it cannot be read.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid review timestamp: {value!r}')
+    return format_time(parse_time(value))
+
+
+def migrate_times(cursor):
+    """Rewrite the review timestamps of user_cards in the stored format"""
+    for column in ('last_review', 'next_review'):
+        cursor.execute(f'''
+            UPDATE user_cards SET {column} = coalesce(
+                CASE WHEN {column} GLOB '*[Zz]' OR {column} GLOB '*[+-][0-9][0-9]:[0-9][0-9]'
+                     THEN strftime('{SQL_TIME_FORMAT}', {column})
+                     ELSE strftime('{SQL_TIME_FORMAT}', {column}, 'utc') END,
+                {column})
+            WHERE {column} IS NOT NULL
+              AND {column} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]:[0-9][0-9]:[0-9][0-9].[0-9][0-9][0-9]Z'
+        ''')
+
+
+def answer(level, streak, correct_count, incorrect_count, correct, now=None):
+    """Apply one answer to a card's progress
+
+    Returns (level, streak, correct_count, incorrect_count, last_review,
+    next_review). cardAnswered() in script.js applies the same rules to
+    the page's copy of the card.
+    """
+    now = now or datetime.now()
+    if correct:
+        level = min(level + 1, MAX_LEVEL)
+        streak += 1
+        correct_count += 1
+    else:
+        level = 0
+        streak = 0
+        incorrect_count += 1
+    next_review = now + timedelta(days=interval_days(level))
+    return level, streak, correct_count, incorrect_count, format_time(now), format_time(next_review)
+
+
+def shift_due_dates(ids, next_reviews, days):
+    """Move every review date by a number of days (e.g. after a vacation)
+
+    Returns (next_review, id) rows.
+    """
+    delta = timedelta(days=days)
+    return [(format_time(parse_time(due) + delta), card_id)
+            for card_id, due in zip(ids, next_reviews)]
+
+
+def rebalance(ids, levels, next_reviews, max_per_day, horizon_days=7, today=None):
+    """Spread tomorrow's reviews beyond max_per_day over the following days
+
+    Lower-level cards stay on tomorrow; the most stable (highest level)
+    cards are the ones moved, each to the first later day within the
+    horizon that still has room. The time of day is preserved. Returns
+    (next_review, id) rows for the moved cards and the number of cards
+    that could not be placed.
+    """
+    today = today or datetime.now().date()
+    tomorrow = today + timedelta(days=1)
+    last_day = tomorrow + timedelta(days=horizon_days)
+
+    due = [parse_time(value) for value in next_reviews]
+    per_day = Counter(d.date() for d in due if tomorrow <= d.date() < last_day)
+
+    tomorrow_cards = sorted((i for i, d in enumerate(due) if d.date() == tomorrow),
+                            key=lambda i: (levels[i], due[i]))
+    overflow = tomorrow_cards[max_per_day:]
+
+    rows = []
+    day = tomorrow + timedelta(days=1)
+    for position, i in enumerate(overflow):
+        while day < last_day and per_day[day] >= max_per_day:
+            day += timedelta(days=1)
+        if day >= last_day:
+            return rows, len(overflow) - position
+        per_day[day] += 1
+        per_day[tomorrow] -= 1
+        moved = datetime.combine(day, due[i].time())
+        rows.append((format_time(moved), ids[i]))
+    return rows, 0
+
+
+def reset_levels(ids, now=None):
+    """Send every card back to level 0, due now
+
+    Returns (level, streak, next_review, id) rows.
+    """
+    due = format_time(now or datetime.now())
+    return [(0, 0, due, card_id) for card_id in ids]
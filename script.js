@@ -1,5 +1,8 @@
 // Data structure for flashcards
 let flashcards = [];
+let deckEtag = null;  // ETag of the deck currently held in `flashcards`
+let deckRevision = null;  // Server revision the local deck is synced to
+let deckStats = { totalCards: 0, totalStreak: 0, totalCorrect: 0, reviewsToday: 0 };
 let currentGame = null;
 let currentCardIndex = 0;
 let sessionStats = {
@@ -19,10 +22,27 @@ window.onload = async function() {
 
 // Data Management
 async function loadData() {
+    // Reloading must not overwrite answers that are still buffered
+    await flushReviews();
+    refreshStats();
+    if (deckRevision !== null && await syncChanges()) {
+        return;
+    }
     try {
-        const response = await fetch('/api/flashcards');
+        // One array per field: each field name is sent once, not once per card
+        const headers = { 'Accept': 'application/vnd.flashcards.columns+json' };
+        if (deckEtag) {
+            headers['If-None-Match'] = deckEtag;
+        }
+        const response = await fetch('/api/flashcards', { headers, cache: 'no-store' });
+        if (response.status === 304) {
+            // Deck unchanged since the last load
+            return;
+        }
         if (response.ok) {
-            flashcards = await response.json();
+            flashcards = cardsFromColumns(await response.json());
+            deckEtag = response.headers.get('ETag');
+            deckRevision = Number(response.headers.get('X-Deck-Revision'));
         } else if (response.status === 401) {
             window.location.href = '/login.html';
         }
@@ -31,6 +51,53 @@ async function loadData() {
     }
 }
 
+// Rebuild card objects from the columnar deck format
+function cardsFromColumns(columns) {
+    const fields = Object.keys(columns);
+    const count = fields.length > 0 ? columns[fields[0]].length : 0;
+    const cards = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const card = {};
+        fields.forEach(field => {
+            card[field] = columns[field][i];
+        });
+        cards[i] = card;
+    }
+    return cards;
+}
+
+// Apply only what changed since the last sync; false if a full reload is needed
+async function syncChanges() {
+    try {
+        const response = await fetch(`/api/flashcards/changes?since=${deckRevision}`, { cache: 'no-store' });
+        if (!response.ok) {
+            return false;
+        }
+        const changes = await response.json();
+
+        const deleted = new Set(changes.deleted);
+        const byId = new Map(flashcards.map(card => [card.id, card]));
+        changes.upserted.forEach(card => {
+            if (byId.has(card.id)) {
+                // Update in place so cards referenced by a running game stay current
+                Object.assign(byId.get(card.id), card);
+            } else {
+                flashcards.push(card);
+            }
+        });
+        if (deleted.size > 0) {
+            flashcards = flashcards.filter(card => !deleted.has(card.id));
+        }
+
+        deckRevision = changes.rev;
+        deckEtag = null;
+        return true;
+    } catch (error) {
+        console.error('Erreur lors de la synchronisation:', error);
+        return false;
+    }
+}
+
 async function saveData() {
     // Data is saved automatically via API calls, just update stats
     updateStats();
@@ -38,19 +105,9 @@ async function saveData() {
 
 async function importPastedData() {
     const text = document.getElementById('pasteInput').value;
-    const lines = text.split('\n').filter(line => line.trim());
-
-    for (const line of lines) {
-        const parts = line.split(',').map(p => p.trim());
-        if (parts.length >= 3) {
-            // Format: character,pinyin,meaning OR character,pinyin,zhuyin,meaning
-            const character = parts[0];
-            const pinyin = parts[1];
-            const zhuyin = parts.length >= 4 ? parts[2] : '';
-            const meaning = parts.length >= 4 ? parts[3] : parts[2];
-            await addCard(character, pinyin, meaning, zhuyin);
-        }
-    }
+
+    // Format: character,pinyin,meaning OR character,pinyin,zhuyin,meaning
+    await bulkImport(text, { 'Content-Type': 'text/csv; charset=utf-8' });
 
     document.getElementById('pasteInput').value = '';
     await loadData();
@@ -59,29 +116,36 @@ async function importPastedData() {
 
 async function importCSV(event) {
     const file = event.target.files[0];
-    const reader = new FileReader();
-
-    reader.onload = async function(e) {
-        const text = e.target.result;
-        const lines = text.split('\n').filter(line => line.trim());
-
-        for (const line of lines) {
-            const parts = line.split(',').map(p => p.trim());
-            if (parts.length >= 3) {
-                // Format: character,pinyin,meaning OR character,pinyin,zhuyin,meaning
-                const character = parts[0];
-                const pinyin = parts[1];
-                const zhuyin = parts.length >= 4 ? parts[2] : '';
-                const meaning = parts.length >= 4 ? parts[3] : parts[2];
-                await addCard(character, pinyin, meaning, zhuyin);
-            }
-        }
+    const formData = new FormData();
+    formData.append('file', file);
 
-        await loadData();
-        updateCardList();
-    };
+    await bulkImport(formData);
+    await loadData();
+    updateCardList();
+}
 
-    reader.readAsText(file);
+// Send a whole CSV import in one request; the server parses and inserts it
+async function bulkImport(body, headers = {}) {
+    try {
+        const response = await fetch('/api/flashcards/bulk', {
+            method: 'POST',
+            headers,
+            body
+        });
+
+        if (response.ok) {
+            const result = await response.json();
+            if (result.errorCount > 0) {
+                const details = result.errors.map(e => `Ligne ${e.line} : ${e.error}`).join('\n');
+                alert(`${result.inserted} cartes importées, ${result.errorCount} lignes ignorées :\n${details}`);
+            }
+            return result;
+        } else {
+            console.error('Erreur lors de l\'import des cartes');
+        }
+    } catch (error) {
+        console.error('Erreur:', error);
+    }
 }
 
 async function addManualCard() {
@@ -126,10 +190,23 @@ async function addCard(character, pinyin, meaning, zhuyin = '') {
 }
 
 function updateCardList() {
+    document.getElementById('startBtn').disabled = flashcards.length === 0;
+    if (document.getElementById('cardSearch').value.trim()) {
+        searchCards();
+        return;
+    }
+    renderCardList(flashcards, 'Cartes Actuelles :');
+}
+
+function renderCardList(cards, title) {
     const list = document.getElementById('cardList');
-    list.innerHTML = '<h3 style="color: #667eea;">Cartes Actuelles :</h3>';
+    list.innerHTML = '';
+    const heading = document.createElement('h3');
+    heading.style.color = '#667eea';
+    heading.textContent = title;
+    list.appendChild(heading);
 
-    flashcards.forEach((card, index) => {
+    cards.forEach(card => {
         const item = document.createElement('div');
         item.className = 'card-item';
 
@@ -145,43 +222,78 @@ function updateCardList() {
 
         item.innerHTML = `
             <span><strong>${card.character}</strong> (${pronunciation}) - ${card.meaning}</span>
-            <button class="btn btn-secondary" style="padding: 5px 15px; margin: 0;" onclick="removeCard(${index})">Supprimer</button>
+            <button class="btn btn-secondary" style="padding: 5px 15px; margin: 0;" onclick="removeCard(${card.id})">Supprimer</button>
         `;
         list.appendChild(item);
     });
-
-    document.getElementById('startBtn').disabled = flashcards.length === 0;
 }
 
-async function removeCard(index) {
-    const card = flashcards[index];
-    try {
-        const response = await fetch(`/api/flashcards/${card.id}`, {
-            method: 'DELETE'
-        });
+// Search runs on the server (GET /api/flashcards/search), once typing pauses
+const SEARCH_DELAY_MS = 250;
+const SEARCH_RESULTS = 50;
+let searchTimer = null;
 
-        if (response.ok) {
-            await loadData();
+function searchCards() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(async () => {
+        const query = document.getElementById('cardSearch').value.trim();
+        if (!query) {
             updateCardList();
+            return;
+        }
+        try {
+            const response = await fetch(`/api/flashcards/search?q=${encodeURIComponent(query)}&limit=${SEARCH_RESULTS}`);
+            if (response.ok) {
+                const data = await response.json();
+                renderCardList(data.cards, `Résultats pour « ${query} » :`);
+                if (data.cards.length > 1) {
+                    const button = document.createElement('button');
+                    button.className = 'btn btn-secondary';
+                    button.textContent = `Supprimer ces ${data.cards.length} cartes`;
+                    button.onclick = () => {
+                        if (confirm(`Supprimer ces ${data.cards.length} cartes ?`)) {
+                            removeCards(data.cards.map(card => card.id));
+                        }
+                    };
+                    document.getElementById('cardList').appendChild(button);
+                }
+            }
+        } catch (error) {
+            console.error('Erreur lors de la recherche:', error);
         }
+    }, SEARCH_DELAY_MS);
+}
+
+async function removeCard(id) {
+    await removeCards([id]);
+}
+
+// One request for any number of cards (POST /api/flashcards/delete-batch)
+const DELETE_BATCH_MAX = 5000;
+
+async function removeCards(ids) {
+    try {
+        for (let i = 0; i < ids.length; i += DELETE_BATCH_MAX) {
+            const response = await fetch('/api/flashcards/delete-batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ ids: ids.slice(i, i + DELETE_BATCH_MAX) })
+            });
+            if (!response.ok) {
+                break;
+            }
+        }
+        await loadData();
+        updateCardList();
     } catch (error) {
         console.error('Erreur lors de la suppression:', error);
     }
 }
 
 function exportData() {
-    const csvContent = flashcards.map(card => {
-        if (card.pinyin && card.zhuyin) {
-            return `${card.character},${card.pinyin},${card.zhuyin},${card.meaning}`;
-        } else {
-            return `${card.character},${card.pinyin || card.zhuyin},${card.meaning}`;
-        }
-    }).join('\n');
-
-    const blob = new Blob([csvContent], { type: 'text/csv' });
-    const url = window.URL.createObjectURL(blob);
+    // The server streams the file straight to the download
     const a = document.createElement('a');
-    a.href = url;
+    a.href = '/api/flashcards/export?format=csv';
     a.download = 'chinese_flashcards.csv';
     a.click();
 }
@@ -196,6 +308,7 @@ async function clearAllData() {
             if (response.ok) {
                 flashcards = [];
                 sessionStats = { correct: 0, incorrect: 0, streak: 0 };
+                deckStats = { totalCards: 0, totalStreak: 0, totalCorrect: 0, reviewsToday: 0 };
                 updateStats();
                 updateCardList();
             }
@@ -226,29 +339,43 @@ function startLearning() {
     }
 }
 
-function returnToMenu() {
+async function returnToMenu() {
+    await flushReviews();
     goToMenu();
 }
 
 // Stats
+// Totals come from the server (GET /api/stats) and are adjusted locally
+// after each answer until the buffered reviews are flushed
+async function refreshStats() {
+    try {
+        const response = await fetch('/api/stats', { cache: 'no-store' });
+        if (response.ok) {
+            deckStats = await response.json();
+            updateStats();
+        }
+    } catch (error) {
+        console.error('Erreur lors du chargement des statistiques:', error);
+    }
+}
+
 function updateStats() {
-    document.getElementById('totalCards').textContent = flashcards.length;
-    const totalStreak = flashcards.reduce((sum, card) => sum + card.streak, 0);
-    document.getElementById('streak').textContent = totalStreak;
-    const totalCorrect = flashcards.reduce((sum, card) => sum + card.correctCount, 0);
-    document.getElementById('score').textContent = totalCorrect;
-
-    const today = new Date().toDateString();
-    const todayReviews = flashcards.filter(card =>
-        card.lastReview && new Date(card.lastReview).toDateString() === today
-    ).length;
-    document.getElementById('todayReviews').textContent = todayReviews;
+    document.getElementById('totalCards').textContent = deckStats.totalCards;
+    document.getElementById('streak').textContent = deckStats.totalStreak;
+    document.getElementById('score').textContent = deckStats.totalCorrect;
+    document.getElementById('todayReviews').textContent = deckStats.reviewsToday;
 }
 
-function updateDueCards() {
-    const now = new Date();
-    const due = flashcards.filter(card => new Date(card.nextReview) <= now).length;
-    document.getElementById('dueCards').textContent = due;
+async function updateDueCards() {
+    try {
+        const response = await fetch('/api/flashcards/due/count');
+        if (response.ok) {
+            const data = await response.json();
+            document.getElementById('dueCards').textContent = data.due;
+        }
+    } catch (error) {
+        console.error('Erreur lors du comptage des cartes à réviser:', error);
+    }
 }
 
 // Spaced Repetition Logic
@@ -259,6 +386,9 @@ function getIntervalDays(level) {
 
 async function cardAnswered(card, correct) {
     const now = new Date();
+    const reviewedToday = card.lastReview && new Date(card.lastReview).toDateString() === now.toDateString();
+    const previousStreak = card.streak;
+    const previousCorrect = card.correctCount;
     card.lastReview = now.toISOString();
 
     if (correct) {
@@ -280,36 +410,109 @@ async function cardAnswered(card, correct) {
     nextReview.setDate(nextReview.getDate() + daysToAdd);
     card.nextReview = nextReview.toISOString();
 
-    // Save to API
+    // Buffered; sent with the next batch
+    queueReview(card, correct);
+
+    deckStats.totalStreak += card.streak - previousStreak;
+    deckStats.totalCorrect += card.correctCount - previousCorrect;
+    if (!reviewedToday) {
+        deckStats.reviewsToday++;
+    }
+
+    saveData();
+}
+
+// Review batching: answers are buffered per card and sent in one request
+const REVIEW_FLUSH_DELAY_MS = 5000;
+// Reviews per request (REVIEW_BATCH_MAX in app.py)
+const REVIEW_BATCH_MAX = 500;
+let pendingReviews = new Map();
+let reviewFlushTimer = null;
+
+function queueReview(card, correct) {
+    // The server schedules the card from its answers; cardAnswered()
+    // updates the local copy only to keep the page current
+    const pending = pendingReviews.get(card.id);
+    const answers = pending ? pending.answers : [];
+    answers.push({ reviewedAt: card.lastReview, correct });
+    pendingReviews.set(card.id, { id: card.id, answers });
+
+    if (!reviewFlushTimer) {
+        reviewFlushTimer = setTimeout(flushReviews, REVIEW_FLUSH_DELAY_MS);
+    }
+}
+
+async function flushReviews() {
+    clearTimeout(reviewFlushTimer);
+    reviewFlushTimer = null;
+    if (pendingReviews.size === 0) return;
+
+    const reviews = Array.from(pendingReviews.values());
+    pendingReviews = new Map();
+
+    // The server takes at most REVIEW_BATCH_MAX reviews per request
+    let sent = 0;
     try {
-        await fetch(`/api/flashcards/${card.id}`, {
-            method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                level: card.level,
-                lastReview: card.lastReview,
-                nextReview: card.nextReview,
-                correctCount: card.correctCount,
-                incorrectCount: card.incorrectCount,
-                streak: card.streak
-            })
-        });
+        for (; sent < reviews.length; sent += REVIEW_BATCH_MAX) {
+            const response = await fetch('/api/reviews/batch', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ reviews: reviews.slice(sent, sent + REVIEW_BATCH_MAX) })
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+        }
     } catch (error) {
         console.error('Erreur lors de la mise à jour:', error);
+        // Keep the unsent answers, before any given since
+        reviews.slice(sent).forEach(review => {
+            const newer = pendingReviews.get(review.id);
+            if (newer) {
+                newer.answers = review.answers.concat(newer.answers);
+            } else {
+                pendingReviews.set(review.id, review);
+            }
+        });
     }
-
-    saveData();
 }
 
+// Last chance to deliver buffered answers when the page goes away
+window.addEventListener('pagehide', () => {
+    if (pendingReviews.size === 0) return;
+    const reviews = Array.from(pendingReviews.values());
+    for (let i = 0; i < reviews.length; i += REVIEW_BATCH_MAX) {
+        const body = JSON.stringify({ reviews: reviews.slice(i, i + REVIEW_BATCH_MAX) });
+        navigator.sendBeacon('/api/reviews/batch', new Blob([body], { type: 'application/json' }));
+    }
+    pendingReviews = new Map();
+});
+
 function getDueCards() {
     const now = new Date();
     return flashcards.filter(card => new Date(card.nextReview) <= now);
 }
 
+// Fetch the next due cards from the server queue, reusing the loaded objects
+async function fetchDueCards(limit = 100) {
+    try {
+        const response = await fetch(`/api/flashcards/due?limit=${limit}`);
+        if (response.ok) {
+            const data = await response.json();
+            const byId = new Map(flashcards.map(card => [card.id, card]));
+            return data.cards.map(card => byId.get(card.id) || card);
+        }
+    } catch (error) {
+        console.error('Erreur lors du chargement des cartes à réviser:', error);
+    }
+    return getDueCards();
+}
+
 // Logout function
 async function logout() {
+    await flushReviews();
     try {
         const response = await fetch('/api/logout', {
             method: 'POST'
@@ -326,6 +529,7 @@ async function logout() {
 // Session Results (Shared by multiple game modes)
 
 function showSessionResults() {
+    flushReviews();
     const content = document.getElementById('gameContent');
     const accuracy = sessionStats.correct + sessionStats.incorrect > 0 ?
         Math.round((sessionStats.correct / (sessionStats.correct + sessionStats.incorrect)) * 100) : 0;
@@ -0,0 +1,123 @@
+"""
+Full-text card search for the flashcards application.
+
+flashcards_search is an FTS5 index with one row per user_cards row (same
+rowid), over the card's character, pinyin, zhuyin and meaning. Triggers
+on user_cards keep it current for every write path. It is contentless:
+the text lives in the card catalog, which is never modified, so a row can
+always be deleted again with the exact values it was indexed with.
+
+Matching ignores tone marks (the tokenizer removes diacritics), and a
+pinyin_plain column holds the pinyin without spaces and tone numbers, so
+"nihao", "ni hao", "ni3 hao3" and "nǐ hǎo" all find 你好. Every query term
+is a prefix. Each row also carries an owner token ("u42"), so a user's
+query only walks index entries of that user's cards. Query terms are
+restricted to the text columns, so they never match an owner token.
+
+Chinese text is not split into words: a character matches the entries
+whose character field starts with it.
+"""
+
+import re
+
+
+# Relative weight of each column in the bm25 ranking (owner never counts)
+RANK = "bm25(0.0, 4.0, 2.0, 2.0, 2.0, 1.0)"
+
+# Columns a query term may match (never owner)
+TEXT_COLUMNS = '{character pinyin pinyin_plain zhuyin meaning}'
+
+# Query terms beyond this are ignored
+MAX_TERMS = 8
+
+# Tone number after a pinyin syllable, e.g. "ni3hao3"
+TONE_NUMBER = re.compile(r'(?<=[a-zü])[1-5]')
+
+
+def pinyin_plain(column):
+    """SQL expression for a pinyin string without spaces, apostrophes or tone numbers"""
+    expression = f'lower({column})'
+    for char in (' ', "''", '1', '2', '3', '4', '5'):
+        expression = f"replace({expression}, '{char}', '')"
+    return expression
+
+
+def _values(user_id):
+    """Indexed values of a user's card, from its catalog row `c`"""
+    return f"'u' || {user_id}, c.character, c.pinyin, {pinyin_plain('c.pinyin')}, c.zhuyin, c.meaning"
+
+
+_INSERT = f'''
+        INSERT INTO flashcards_search (rowid, owner, character, pinyin, pinyin_plain, zhuyin, meaning)
+        SELECT NEW.id, {_values('NEW.user_id')} FROM cards c WHERE c.id = NEW.card_id;
+'''
+_DELETE = f'''
+        INSERT INTO flashcards_search (flashcards_search, rowid, owner, character, pinyin,
+                                       pinyin_plain, zhuyin, meaning)
+        SELECT 'delete', OLD.id, {_values('OLD.user_id')} FROM cards c WHERE c.id = OLD.card_id;
+'''
+
+SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS flashcards_search USING fts5 (
+        owner, character, pinyin, pinyin_plain, zhuyin, meaning,
+        content = '',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS flashcards_search_after_insert AFTER INSERT ON user_cards
+    BEGIN
+        {_INSERT}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS flashcards_search_after_update AFTER UPDATE OF card_id ON user_cards
+    WHEN NEW.card_id IS NOT OLD.card_id
+    BEGIN
+        {_DELETE}
+        {_INSERT}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS flashcards_search_after_delete AFTER DELETE ON user_cards
+    BEGIN
+        {_DELETE}
+    END
+    ''',
+]
+
+
+def create_schema(cursor):
+    """Create the search index and its triggers; backfill if the index is new"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'flashcards_search'")
+    existed = cursor.fetchone() is not None
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    if not existed:
+        cursor.execute("INSERT INTO flashcards_search (flashcards_search, rank) VALUES ('rank', ?)",
+                       (RANK,))
+        rebuild(cursor)
+
+
+def rebuild(cursor):
+    """Re-index every card"""
+    cursor.execute("INSERT INTO flashcards_search (flashcards_search) VALUES ('delete-all')")
+    cursor.execute(f'''
+        INSERT INTO flashcards_search (rowid, owner, character, pinyin, pinyin_plain, zhuyin, meaning)
+        SELECT u.id, {_values('u.user_id')}
+        FROM user_cards u JOIN cards c ON c.id = u.card_id
+    ''')
+
+
+def match_query(user_id, text):
+    """FTS5 query for the terms of text within user_id's cards, None if no term"""
+    terms = []
+    for word in text.lower().split()[:MAX_TERMS]:
+        word = TONE_NUMBER.sub('', word.replace('"', ''))
+        if word:
+            terms.append(f'{TEXT_COLUMNS} : "{word}"*')
+    if not terms:
+        return None
+    return f'owner:"u{int(user_id)}" AND ' + ' AND '.join(terms)
@@ -0,0 +1,140 @@
+"""
+Pre-forking production server for the flashcards application.
+
+The master process imports (preloads) the application, binds the listening
+socket and forks N workers that all accept on that shared socket; each
+worker runs a multi-threaded WSGI server. The master restarts workers that
+die and, on SIGTERM or SIGINT, asks every worker to stop accepting, finish
+its in-flight requests and exit (SIGKILL after a grace period).
+
+Only available where os.fork exists (Linux, macOS).
+"""
+
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+
+GRACEFUL_TIMEOUT = 30  # seconds before stragglers are killed
+LISTEN_BACKLOG = 1024
+
+
+def bind(host, port):
+    """Open the listening socket shared by all workers"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, before_exit=None):
+    """Serve on the inherited socket until SIGTERM, then drain and return"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master handles ^C
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    # Join request threads on close so in-flight requests finish
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    worker_pid = os.getpid()
+
+    def stop(signum, frame):
+        if os.getpid() != worker_pid:
+            # A process forked by this worker (e.g. a hashing pool child)
+            # before it set its own handler: die as SIGTERM normally does
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        # shutdown() waits for serve_forever() to return: not from this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if before_exit is not None:
+            before_exit()
+
+
+def serve(app, host='0.0.0.0', port=5001, workers=None, before_fork=None, before_exit=None,
+          graceful_timeout=GRACEFUL_TIMEOUT, log=print):
+    """Run app on `workers` forked processes (default: one per CPU)
+
+    before_fork runs in the master before each fork (e.g. to close database
+    connections and stop helper processes that must not be shared);
+    before_exit runs in each worker after it has drained, and must stop any
+    helper processes the worker started: it leaves through os._exit().
+    """
+    if not hasattr(os, 'fork'):
+        raise RuntimeError('Le serveur multi-processus nécessite os.fork (Linux, macOS)')
+    workers = workers or os.cpu_count() or 1
+    sock = bind(host, port)
+    log(f'Listening on http://{host}:{sock.getsockname()[1]} with {workers} workers '
+        f'(master pid {os.getpid()})')
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        if before_fork is not None:
+            before_fork()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app, sock, before_exit)
+            except BaseException:
+                code = 1
+                sys.excepthook(*sys.exc_info())
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children.add(pid)
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for _ in range(workers):
+        spawn()
+
+    # Supervise: reap exited workers and replace them until asked to stop
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid:
+            children.discard(pid)
+            log(f'worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting')
+            spawn()
+        else:
+            time.sleep(0.2)
+
+    log('Shutting down: draining workers')
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + graceful_timeout
+    while children and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            children.discard(pid)
+        else:
+            time.sleep(0.05)
+    for pid in children:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    sock.close()
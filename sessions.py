@@ -0,0 +1,277 @@
+"""
+Server-side sessions for the flashcards application.
+
+The session cookie only carries a random 256-bit session id; the session
+data lives in a shared store (a SQLite table or one file per session), so
+every worker process sees the same sessions and a restart logs nobody out.
+Recently used sessions are kept in a small in-memory hot cache, which makes
+the per-request session lookup a dict access instead of a signature check.
+
+Expiry slides: each use pushes it back, but the store is only written when
+the stored expiry is more than refresh_interval old. Expired sessions are
+deleted in bounded batches, at most once per cleanup_interval per process.
+
+A session deleted (logout) in one process may still be honoured by another
+process's hot cache for up to hot_ttl seconds.
+"""
+
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+
+SID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{43}$')  # secrets.token_urlsafe(32)
+
+REFRESH_INTERVAL = 300    # seconds between sliding-expiry writes
+HOT_TTL = 2               # seconds a cached session is trusted without the store
+HOT_MAX_ENTRIES = 10000
+CLEANUP_INTERVAL = 60     # seconds between expired-session sweeps
+CLEANUP_BATCH = 500       # sessions deleted per sweep
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS sessions (
+        sid TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires REAL NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)',
+]
+
+serializer = TaggedJSONSerializer()
+
+
+def create_schema(cursor):
+    """Create the sessions table"""
+    for statement in SCHEMA:
+        cursor.execute(statement)
+
+
+class SQLiteSessionStore:
+    """Sessions in a table of a shared SQLite database.
+
+    connect returns the current request's connection to that database.
+    Session writes commit on it, so writes the view left uncommitted (a
+    handler that raised mid-transaction) are rolled back first rather than
+    committed with them; teardown would roll them back anyway.
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def _writer(self):
+        conn = self.connect()
+        if conn.in_transaction:
+            conn.rollback()
+        return conn
+
+    def load(self, sid):
+        """Return (data, expires) or None"""
+        cursor = self.connect().cursor()
+        cursor.execute('SELECT data, expires FROM sessions WHERE sid = ?', (sid,))
+        row = cursor.fetchone()
+        return (serializer.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, expires):
+        conn = self._writer()
+        conn.execute('''
+            INSERT INTO sessions (sid, data, expires) VALUES (?, ?, ?)
+            ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires = excluded.expires
+        ''', (sid, serializer.dumps(data), expires))
+        conn.commit()
+
+    def touch(self, sid, expires):
+        conn = self._writer()
+        conn.execute('UPDATE sessions SET expires = ? WHERE sid = ?', (expires, sid))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._writer()
+        conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+        conn.commit()
+
+    def purge_expired(self, now, limit):
+        """Delete up to limit expired sessions; returns how many"""
+        conn = self._writer()
+        cursor = conn.execute('''
+            DELETE FROM sessions WHERE sid IN (
+                SELECT sid FROM sessions WHERE expires < ? LIMIT ?
+            )
+        ''', (now, limit))
+        conn.commit()
+        return cursor.rowcount
+
+
+class FileSessionStore:
+    """Sessions as one JSON file each in a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return serializer.loads(record['data']), record['expires']
+
+    def save(self, sid, data, expires):
+        # Write then rename, so readers never see a partial file
+        tmp = self._path(f'.{sid}.{os.getpid()}.{threading.get_ident()}')
+        with open(tmp, 'w') as f:
+            json.dump({'data': serializer.dumps(data), 'expires': expires}, f)
+        os.replace(tmp, self._path(sid))
+
+    def touch(self, sid, expires):
+        record = self.load(sid)
+        if record is not None:
+            self.save(sid, record[0], expires)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self, now, limit):
+        purged = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if purged >= limit:
+                    break
+                if not SID_PATTERN.match(entry.name):
+                    continue
+                record = self.load(entry.name)
+                if record is None or record[1] < now:
+                    self.delete(entry.name)
+                    purged += 1
+        return purged
+
+
+class ServerSession(SecureCookieSession):
+    """Session data plus the id, expiry and user it was loaded with."""
+
+    def __init__(self, initial=None, sid=None, expires=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires = expires
+        self.user_id = (initial or {}).get('user_id')
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface backed by a SQLite or file session store."""
+
+    def __init__(self, store, refresh_interval=REFRESH_INTERVAL, hot_ttl=HOT_TTL,
+                 hot_max_entries=HOT_MAX_ENTRIES, cleanup_interval=CLEANUP_INTERVAL,
+                 cleanup_batch=CLEANUP_BATCH):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.hot_ttl = hot_ttl
+        self.hot_max_entries = hot_max_entries
+        self.cleanup_interval = cleanup_interval
+        self.cleanup_batch = cleanup_batch
+        self._hot = OrderedDict()  # sid -> (data, expires, cached_at)
+        self._lock = threading.Lock()
+        self._last_cleanup = time.monotonic()
+
+    # Hot cache
+
+    def _cache(self, sid, data, expires):
+        with self._lock:
+            self._hot[sid] = (data, expires, time.monotonic())
+            self._hot.move_to_end(sid)
+            while len(self._hot) > self.hot_max_entries:
+                self._hot.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._lock:
+            self._hot.pop(sid, None)
+
+    def _load(self, sid):
+        with self._lock:
+            cached = self._hot.get(sid)
+        if cached is not None and time.monotonic() - cached[2] < self.hot_ttl:
+            return cached[0], cached[1]
+        record = self.store.load(sid)
+        if record is None:
+            self._forget(sid)
+            return None
+        self._cache(sid, *record)
+        return record
+
+    # SessionInterface
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SID_PATTERN.match(sid):
+            record = self._load(sid)
+            if record is not None and record[1] > time.time():
+                return ServerSession(dict(record[0]), sid, record[1])
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        cookie = {
+            'domain': self.get_cookie_domain(app),
+            'path': self.get_cookie_path(app),
+            'secure': self.get_cookie_secure(app),
+            'samesite': self.get_cookie_samesite(app),
+            'httponly': self.get_cookie_httponly(app),
+        }
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                self._forget(session.sid)
+                response.delete_cookie(name, **cookie)
+            return
+
+        now = time.time()
+        expires = now + app.permanent_session_lifetime.total_seconds()
+        sid = session.sid
+        if session.modified:
+            # New id when the session starts or changes hands (no fixation)
+            if sid is None or session.get('user_id') != session.user_id:
+                if sid is not None:
+                    self.store.delete(sid)
+                    self._forget(sid)
+                sid = secrets.token_urlsafe(32)
+            data = dict(session)
+            self.store.save(sid, data, expires)
+            self._cache(sid, data, expires)
+            response.set_cookie(name, sid, expires=self.get_expiration_time(app, session), **cookie)
+        elif expires - session.expires > self.refresh_interval:
+            self.store.touch(sid, expires)
+            self._cache(sid, dict(session), expires)
+
+        self._maybe_cleanup(now)
+
+    def _maybe_cleanup(self, now):
+        if time.monotonic() - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = time.monotonic()
+        self.store.purge_expired(now, self.cleanup_batch)
+
+    def purge_expired(self):
+        """Delete every expired session; returns how many"""
+        total = 0
+        while True:
+            purged = self.store.purge_expired(time.time(), self.cleanup_batch)
+            total += purged
+            if purged < self.cleanup_batch:
+                return total
@@ -0,0 +1,113 @@
+"""
+Per-user sharding of deck storage for the flashcards application.
+
+SQLite lets one writer hold a database file at a time, so answers from
+unrelated users serialize on that lock. With sharding enabled, the main
+database keeps only the users table (authentication). Every deck table
+(cards, revisions, tombstones, stats and the review log) lives in one of
+N shard files, chosen by user_id % N, so writers on different shards never
+wait for each other. Each shard holds a full copy of the shared card
+catalog.
+
+Card ids are unique within a shard, which is all the API needs since every
+card query is scoped to one user.
+"""
+
+import os
+import sqlite3
+
+
+# Card catalog and shared decks (see catalog.py), copied whole into every
+# shard, which then holds its own catalog
+SHARED_TABLES = ('cards', 'shared_decks', 'shared_deck_cards')
+
+# Tables holding per-user deck data, in copy order (user_cards first: its
+# insert trigger rebuilds user_stats, which is then replaced by the copy)
+DECK_TABLES = ('user_cards', 'deck_revisions', 'deleted_flashcards', 'user_stats',
+               'review_log', 'review_rollups')
+
+
+def shard_index(user_id, count):
+    """Shard number holding a user's deck"""
+    return user_id % count
+
+
+def shard_path(database, index):
+    """File of shard `index` next to the main database (flashcards.shard0.db)"""
+    root, ext = os.path.splitext(database)
+    return f'{root}.shard{index}{ext}'
+
+
+def shard_paths(database, count):
+    """Files of all shards"""
+    return [shard_path(database, index) for index in range(count)]
+
+
+def split(source, count, connect, migrate_deck, drop_source=False):
+    """Copy every deck table of an unsharded database into `count` shards
+
+    connect opens a database file, migrate_deck brings a connection to the
+    latest deck schema. Shards must not hold cards yet. Returns
+    {table: rows copied}; with drop_source, the deck and catalog tables
+    are then emptied from the source, which keeps only users.
+    """
+    copied = dict.fromkeys(SHARED_TABLES + DECK_TABLES, 0)
+    for index, path in enumerate(shard_paths(source, count)):
+        conn = connect(path)
+        try:
+            migrate_deck(conn)
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM flashcards')
+            if cursor.fetchone()[0]:
+                raise RuntimeError(f'Le fichier {path} contient déjà des cartes')
+            conn.commit()
+
+            cursor.execute('ATTACH DATABASE ? AS source', (source,))
+            for table in SHARED_TABLES + DECK_TABLES:
+                if table == 'user_stats':
+                    cursor.execute('DELETE FROM main.user_stats')
+                columns = ', '.join(row[1] for row in
+                                    cursor.execute(f'PRAGMA main.table_info({table})').fetchall())
+                where, params = ('WHERE user_id % ? = ?', (count, index)) if table in DECK_TABLES else ('', ())
+                cursor.execute(f'''
+                    INSERT INTO main.{table} ({columns})
+                    SELECT {columns} FROM source.{table} {where}
+                ''', params)
+                copied[table] += cursor.rowcount
+            # Ids of deleted cards must stay unused (the sync feed reports
+            # them and deleted_flashcards is keyed by them)
+            cursor.execute('''
+                SELECT max(coalesce((SELECT seq FROM source.sqlite_sequence WHERE name = 'user_cards'), 0),
+                           coalesce((SELECT max(card_id) FROM main.deleted_flashcards), 0),
+                           coalesce((SELECT max(id) FROM main.user_cards), 0))
+            ''')
+            seq = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM main.sqlite_sequence WHERE name = 'user_cards'")
+            cursor.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES ('user_cards', ?)", (seq,))
+            conn.commit()
+            cursor.execute('DETACH DATABASE source')
+        finally:
+            conn.close()
+
+    if drop_source:
+        conn = connect(source)
+        try:
+            for table in DECK_TABLES + SHARED_TABLES:
+                conn.execute(f'DELETE FROM {table}')
+            conn.commit()
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+    return copied
+
+
+def count_rows(paths, table):
+    """Total rows of a table over several database files"""
+    total = 0
+    for path in paths:
+        conn = sqlite3.connect(path)
+        try:
+            total += conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        finally:
+            conn.close()
+    return total
@@ -0,0 +1,162 @@
+"""
+Materialized per-user deck statistics.
+
+The user_stats table holds, for each user, the totals shown in the header
+of the web client. SQLite triggers on user_cards keep it current for every
+write path, so reading stats costs one primary-key lookup whatever the
+deck size.
+
+"Reviews today" counts distinct cards whose last review falls on
+review_day; a stored review_day older than today means zero.
+"""
+
+from datetime import date
+
+
+def local_day(column):
+    """SQL expression for the local calendar day of a review timestamp
+
+    Timestamps are stored in UTC ending in 'Z' (see scheduler.py); naive
+    ones, from databases not migrated yet, are local time.
+    """
+    return (f"(CASE WHEN {column} LIKE '%Z' THEN date({column}, 'localtime') "
+            f"ELSE date({column}) END)")
+
+
+OLD_DAY = local_day('OLD.last_review')
+NEW_DAY = local_day('NEW.last_review')
+
+# Review-day bookkeeping shared by the triggers: forget a card's old day,
+# then count its new one (only the most recent day is tracked)
+_FORGET_OLD_DAY = f'''
+    UPDATE user_stats SET reviews_on_day = reviews_on_day - 1
+    WHERE user_id = OLD.user_id AND review_day = {OLD_DAY} AND {OLD_DAY} IS NOT {{new_day}};
+'''
+_COUNT_NEW_DAY = f'''
+    UPDATE user_stats SET
+        reviews_on_day = CASE WHEN review_day = {NEW_DAY} THEN reviews_on_day + 1 ELSE 1 END,
+        review_day = {NEW_DAY}
+    WHERE user_id = NEW.user_id AND {NEW_DAY} IS NOT NULL
+      AND {NEW_DAY} IS NOT {{old_day}} AND {NEW_DAY} >= coalesce(review_day, '');
+'''
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        card_count INTEGER NOT NULL DEFAULT 0,
+        total_streak INTEGER NOT NULL DEFAULT 0,
+        total_correct INTEGER NOT NULL DEFAULT 0,
+        review_day TEXT,
+        reviews_on_day INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS user_stats_after_insert AFTER INSERT ON user_cards
+    BEGIN
+        INSERT INTO user_stats (user_id, card_count, total_streak, total_correct)
+        VALUES (NEW.user_id, 1, coalesce(NEW.streak, 0), coalesce(NEW.correct_count, 0))
+        ON CONFLICT (user_id) DO UPDATE SET
+            card_count = card_count + 1,
+            total_streak = total_streak + excluded.total_streak,
+            total_correct = total_correct + excluded.total_correct;
+        {_COUNT_NEW_DAY.format(old_day='NULL')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS user_stats_after_update
+    AFTER UPDATE OF streak, correct_count, last_review ON user_cards
+    BEGIN
+        UPDATE user_stats SET
+            total_streak = total_streak - coalesce(OLD.streak, 0) + coalesce(NEW.streak, 0),
+            total_correct = total_correct - coalesce(OLD.correct_count, 0) + coalesce(NEW.correct_count, 0)
+        WHERE user_id = NEW.user_id;
+        {_FORGET_OLD_DAY.format(new_day=NEW_DAY)}
+        {_COUNT_NEW_DAY.format(old_day=OLD_DAY)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS user_stats_after_delete AFTER DELETE ON user_cards
+    BEGIN
+        UPDATE user_stats SET
+            card_count = card_count - 1,
+            total_streak = total_streak - coalesce(OLD.streak, 0),
+            total_correct = total_correct - coalesce(OLD.correct_count, 0)
+        WHERE user_id = OLD.user_id;
+        {_FORGET_OLD_DAY.format(new_day='NULL')}
+    END
+    ''',
+]
+
+
+def create_schema(cursor):
+    """Create the stats table and triggers; backfill if the table is new"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'")
+    existed = cursor.fetchone() is not None
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    if not existed:
+        rebuild(cursor)
+
+
+def _recompute_query():
+    day = local_day('last_review')
+    return f'''
+        SELECT user_id, COUNT(*), coalesce(SUM(streak), 0), coalesce(SUM(correct_count), 0),
+               ?, coalesce(SUM({day} = ?), 0)
+        FROM flashcards
+        GROUP BY user_id
+    '''
+
+
+def rebuild(cursor, today=None):
+    """Recompute user_stats from scratch for every user"""
+    today = (today or date.today()).isoformat()
+    cursor.execute('DELETE FROM user_stats')
+    cursor.execute(f'''
+        INSERT INTO user_stats (user_id, card_count, total_streak, total_correct,
+                                review_day, reviews_on_day)
+        {_recompute_query()}
+    ''', (today, today))
+
+
+def check(cursor, today=None):
+    """Compare user_stats with a full recomputation
+
+    Returns a list of (user_id, materialized, expected) tuples for users
+    whose stats differ, each side as a stats dict.
+    """
+    today = today or date.today()
+    cursor.execute(_recompute_query(), (today.isoformat(), today.isoformat()))
+    expected = {row[0]: _to_dict(row[1], row[2], row[3], row[4], row[5], today)
+                for row in cursor.fetchall()}
+
+    cursor.execute('SELECT * FROM user_stats')
+    actual = {row[0]: _to_dict(*row[1:], today) for row in cursor.fetchall()}
+
+    empty = _to_dict(0, 0, 0, None, 0, today)
+    return [(user_id, actual.get(user_id, empty), expected.get(user_id, empty))
+            for user_id in sorted(set(actual) | set(expected))
+            if actual.get(user_id, empty) != expected.get(user_id, empty)]
+
+
+def _to_dict(card_count, total_streak, total_correct, review_day, reviews_on_day, today):
+    return {
+        'totalCards': card_count,
+        'totalStreak': total_streak,
+        'totalCorrect': total_correct,
+        'reviewsToday': reviews_on_day if review_day == today.isoformat() else 0
+    }
+
+
+def get(cursor, user_id, today=None):
+    """Return a user's stats as served by GET /api/stats"""
+    cursor.execute('''
+        SELECT card_count, total_streak, total_correct, review_day, reviews_on_day
+        FROM user_stats WHERE user_id = ?
+    ''', (user_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return _to_dict(0, 0, 0, None, 0, today or date.today())
+    return _to_dict(*row, today or date.today())
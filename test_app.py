@@ -4,16 +4,29 @@ Tests user authentication, flashcard CRUD operations, and edge cases.
 """
 
 import pytest
+import gzip
+import re
 import json
 import os
-from app import app, init_db, get_db, hash_password
-from datetime import datetime
+from app import app, init_db, get_db, hash_password, close_db_connections
+from datetime import date, datetime, timedelta
+import scheduler
+import stats
+import reviewlog
 
 
 # Test configuration
 TEST_DATABASE = 'test_flashcards.db'
 
 
+def remove_test_database():
+    """Close pooled connections and delete the test database and its WAL files."""
+    close_db_connections()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(TEST_DATABASE + suffix):
+            os.remove(TEST_DATABASE + suffix)
+
+
 @pytest.fixture
 def client():
     """Create a test client with a fresh test database."""
@@ -29,8 +42,7 @@ def client():
     app_module.DATABASE = TEST_DATABASE
 
     # Remove test database if it exists
-    if os.path.exists(TEST_DATABASE):
-        os.remove(TEST_DATABASE)
+    remove_test_database()
 
     # Initialize test database
     init_db()
@@ -40,9 +52,8 @@ def client():
             yield client
 
     # Cleanup
+    remove_test_database()
     app_module.DATABASE = original_db
-    if os.path.exists(TEST_DATABASE):
-        os.remove(TEST_DATABASE)
 
 
 @pytest.fixture
@@ -54,6 +65,25 @@ def authenticated_client(client):
     return client
 
 
+def add_cards(client, cards):
+    """Bulk-add cards given as (character, pinyin, meaning) tuples or card dicts."""
+    response = client.post('/api/flashcards/bulk', json=[
+        card if isinstance(card, dict) else dict(zip(('character', 'pinyin', 'meaning'), card))
+        for card in cards
+    ])
+    assert response.status_code == 200
+
+
+def numbered_cards(count):
+    """(character, pinyin, meaning) tuples of count distinct cards."""
+    return [(f'字{i}', f'zi{i}', f'word{i}') for i in range(count)]
+
+
+def deck_ids(client):
+    """Ids of the client's cards, in deck order."""
+    return [card['id'] for card in client.get('/api/flashcards').get_json()]
+
+
 # ============================================================================
 # AUTHENTICATION TESTS
 # ============================================================================
@@ -566,6 +596,1770 @@ class TestEdgeCases:
         assert response.status_code == 200
 
 
+# ============================================================================
+# DUE QUEUE TESTS
+# ============================================================================
+
+class TestDueQueue:
+    """Test the server-side due-card queue."""
+
+    def _add_cards(self, client, count):
+        ids = []
+        for i in range(count):
+            response = client.post('/api/flashcards', json={
+                'character': f'字{i}',
+                'pinyin': f'zi{i}',
+                'meaning': f'word{i}'
+            })
+            ids.append(json.loads(response.data)['id'])
+        return ids
+
+    def _schedule(self, client, card_id, next_review):
+        client.put(f'/api/flashcards/{card_id}', json={
+            'level': 1,
+            'lastReview': next_review,
+            'nextReview': next_review,
+            'correctCount': 1,
+            'incorrectCount': 0,
+            'streak': 1
+        })
+
+    def test_due_returns_only_due_cards_in_order(self, authenticated_client):
+        """Test that future cards are excluded and due cards are ordered."""
+        ids = self._add_cards(authenticated_client, 3)
+        self._schedule(authenticated_client, ids[0], '2000-01-02T00:00:00')
+        self._schedule(authenticated_client, ids[1], '2999-01-01T00:00:00')
+        self._schedule(authenticated_client, ids[2], '2000-01-01T00:00:00')
+
+        response = authenticated_client.get('/api/flashcards/due')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [card['id'] for card in data['cards']] == [ids[2], ids[0]]
+        assert data['nextCursor'] is None
+
+    def test_due_pagination_with_cursor(self, authenticated_client):
+        """Test walking the due queue page by page."""
+        ids = self._add_cards(authenticated_client, 5)
+
+        seen = []
+        cursor = None
+        while True:
+            url = '/api/flashcards/due?limit=2'
+            if cursor:
+                url += f'&cursor={cursor}'
+            data = json.loads(authenticated_client.get(url).data)
+            seen.extend(card['id'] for card in data['cards'])
+            cursor = data['nextCursor']
+            if not cursor:
+                break
+
+        assert sorted(seen) == ids
+
+    def test_due_invalid_parameters(self, authenticated_client):
+        """Test invalid limit and cursor values are rejected."""
+        assert authenticated_client.get('/api/flashcards/due?limit=abc').status_code == 400
+        assert authenticated_client.get('/api/flashcards/due?cursor=bogus').status_code == 400
+
+    def test_due_count(self, authenticated_client):
+        """Test the due count used by the menu."""
+        ids = self._add_cards(authenticated_client, 3)
+        self._schedule(authenticated_client, ids[0], '2999-01-01T00:00:00')
+
+        response = authenticated_client.get('/api/flashcards/due/count')
+        assert json.loads(response.data)['due'] == 2
+
+    def test_due_unauthenticated(self, client):
+        """Test the due queue requires authentication."""
+        assert client.get('/api/flashcards/due').status_code == 401
+        assert client.get('/api/flashcards/due/count').status_code == 401
+
+
+# ============================================================================
+# BULK IMPORT TESTS
+# ============================================================================
+
+class TestBulkImport:
+    """Test the single-request bulk import endpoint."""
+
+    def test_bulk_import_json(self, authenticated_client):
+        """Test importing a JSON array with one invalid item."""
+        response = authenticated_client.post('/api/flashcards/bulk', json=[
+            {'character': '一', 'pinyin': 'yī', 'meaning': 'un'},
+            {'character': '二', 'meaning': 'deux'},
+            {'character': '三', 'zhuyin': 'ㄙㄢ', 'meaning': 'trois'}
+        ])
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['inserted'] == 2
+        assert data['errorCount'] == 1
+        assert data['errors'][0]['line'] == 2
+
+        cards = json.loads(authenticated_client.get('/api/flashcards').data)
+        assert [card['character'] for card in cards] == ['一', '三']
+
+    def test_bulk_import_csv_body(self, authenticated_client):
+        """Test importing pasted CSV text with quoting and short lines."""
+        text = '你好,nǐ hǎo,bonjour\n"一,二",yī èr,"un, deux"\n\nincomplet,x\n'
+        response = authenticated_client.post('/api/flashcards/bulk', data=text.encode('utf-8'),
+                                             content_type='text/csv; charset=utf-8')
+
+        data = json.loads(response.data)
+        assert data['inserted'] == 2
+        assert data['errors'] == [{'line': 4, 'error': 'Ligne incomplète (au moins 3 colonnes attendues)'}]
+
+        cards = json.loads(authenticated_client.get('/api/flashcards').data)
+        assert cards[1]['character'] == '一,二'
+        assert cards[1]['meaning'] == 'un, deux'
+
+    def test_bulk_import_csv_file(self, authenticated_client):
+        """Test uploading a zhuyin-only CSV file."""
+        with open('test_flashcards_zhuyin_only.csv', 'rb') as f:
+            response = authenticated_client.post('/api/flashcards/bulk',
+                                                 data={'file': (f, 'cards.csv')},
+                                                 content_type='multipart/form-data')
+
+        data = json.loads(response.data)
+        assert data['inserted'] == 20
+        assert data['errorCount'] == 0
+
+        cards = json.loads(authenticated_client.get('/api/flashcards').data)
+        assert cards[0]['pinyin'] is None
+        assert cards[0]['zhuyin'] == 'ㄋㄧˇ ㄏㄠˇ'
+
+    def test_bulk_import_unreadable_csv_inserts_nothing(self, authenticated_client):
+        """Test a CSV error after written chunks rolls the whole import back."""
+        text = ''.join(f'字{i},zì,mot {i}\n' for i in range(600)) + '长,cháng,' + 'x' * 200000 + '\n'
+        response = authenticated_client.post('/api/flashcards/bulk', data=text.encode('utf-8'),
+                                             content_type='text/csv; charset=utf-8')
+        assert response.status_code == 400
+        assert 'error' in json.loads(response.data)
+        assert json.loads(authenticated_client.get('/api/stats').data)['totalCards'] == 0
+
+    def test_bulk_import_unauthenticated(self, client):
+        """Test bulk import requires authentication."""
+        response = client.post('/api/flashcards/bulk', json=[])
+        assert response.status_code == 401
+
+
+# ============================================================================
+# REVIEW BATCH TESTS
+# ============================================================================
+
+class TestReviewBatch:
+    """Test batched review submission."""
+
+    def test_batch_updates_and_coalesces(self, authenticated_client):
+        """Test several reviews are applied and the last one per card wins."""
+        ids = []
+        for char in ('一', '二'):
+            response = authenticated_client.post('/api/flashcards', json={
+                'character': char, 'pinyin': 'x', 'meaning': 'y'
+            })
+            ids.append(json.loads(response.data)['id'])
+
+        now = datetime.now().isoformat()
+        review = {'lastReview': now, 'nextReview': now, 'incorrectCount': 0}
+        response = authenticated_client.post('/api/reviews/batch', json={'reviews': [
+            {**review, 'id': ids[0], 'level': 1, 'correctCount': 1, 'streak': 1},
+            {**review, 'id': ids[1], 'level': 1, 'correctCount': 1, 'streak': 1},
+            {**review, 'id': ids[0], 'level': 2, 'correctCount': 2, 'streak': 2},
+        ]})
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data == {'updated': 2, 'missing': []}
+
+        cards = {c['id']: c for c in json.loads(authenticated_client.get('/api/flashcards').data)}
+        assert cards[ids[0]]['level'] == 2
+        assert cards[ids[0]]['streak'] == 2
+        assert cards[ids[1]]['level'] == 1
+
+    def test_batch_ignores_other_users_cards(self, client):
+        """Test a batch cannot update cards owned by someone else."""
+        client.post('/api/register', json={'name': 'user1', 'password': 'pass1'})
+        response = client.post('/api/flashcards', json={
+            'character': '你', 'pinyin': 'nǐ', 'meaning': 'tu'
+        })
+        card_id = json.loads(response.data)['id']
+        client.post('/api/logout')
+        client.post('/api/register', json={'name': 'user2', 'password': 'pass2'})
+
+        response = client.post('/api/reviews/batch', json={'reviews': [
+            {'id': card_id, 'level': 7, 'streak': 99, 'correctCount': 99, 'incorrectCount': 0,
+             'nextReview': '2099-01-01T00:00:00Z'}
+        ]})
+        assert json.loads(response.data) == {'updated': 0, 'missing': [card_id]}
+
+        client.post('/api/logout')
+        client.post('/api/login', json={'name': 'user1', 'password': 'pass1'})
+        cards = json.loads(client.get('/api/flashcards').data)
+        assert cards[0]['level'] == 0
+
+    def test_answers_are_scheduled_on_the_server(self, authenticated_client):
+        """Test answer events set level, counts and next review, whatever state is sent."""
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        card_id = json.loads(response.data)['id']
+        reviewed = datetime(2024, 1, 1, 12, 0)
+        response = authenticated_client.post('/api/reviews/batch', json={'reviews': [
+            {'id': card_id, 'level': 7, 'nextReview': '2099-01-01T00:00:00Z',
+             'answers': [{'reviewedAt': reviewed.isoformat(), 'correct': True}]},
+            {'id': card_id, 'answers': [{'reviewedAt': reviewed.isoformat(), 'correct': True}]},
+        ]})
+        assert json.loads(response.data) == {'updated': 1, 'missing': []}
+
+        card = json.loads(authenticated_client.get('/api/flashcards').data)[0]
+        assert (card['level'], card['streak'], card['correctCount']) == (2, 2, 2)
+        assert card['lastReview'] == scheduler.format_time(reviewed)
+        assert card['nextReview'] == scheduler.format_time(reviewed + timedelta(days=3))
+
+        response = authenticated_client.put(f'/api/flashcards/{card_id}', json={'correct': False})
+        assert response.status_code == 200
+        card = json.loads(authenticated_client.get('/api/flashcards').data)[0]
+        assert (card['level'], card['streak'], card['incorrectCount']) == (0, 0, 1)
+        assert card['nextReview'] == card['lastReview'] <= scheduler.current_time()
+
+        for answer in ({'correct': 'yes'}, {'reviewedAt': reviewed.isoformat()}):
+            response = authenticated_client.post('/api/reviews/batch', json={'reviews': [
+                {'id': card_id, 'answers': [answer]}]})
+            assert response.status_code == 400
+
+    def test_batch_validation(self, authenticated_client):
+        """Test malformed batches are rejected."""
+        assert authenticated_client.post('/api/reviews/batch', json={}).status_code == 400
+        response = authenticated_client.post('/api/reviews/batch', json={'reviews': [{'level': 1}]})
+        assert response.status_code == 400
+
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        card_id = json.loads(response.data)['id']
+        state = {'level': 1, 'streak': 1, 'correctCount': 1, 'incorrectCount': 0,
+                 'nextReview': '2099-01-01T00:00:00Z'}
+        for review in ({'id': True, **state}, {'id': card_id}, {'id': card_id, **state, 'level': '1'},
+                       {'id': card_id, **state, 'level': 8}, {'id': card_id, **state, 'nextReview': None}):
+            response = authenticated_client.post('/api/reviews/batch', json={'reviews': [review]})
+            assert response.status_code == 400, review
+        card = json.loads(authenticated_client.get('/api/flashcards').data)[0]
+        assert card['level'] == 0
+
+    def test_batch_unauthenticated(self, client):
+        """Test batch submission requires authentication."""
+        response = client.post('/api/reviews/batch', json={'reviews': []})
+        assert response.status_code == 401
+
+
+# ============================================================================
+# PAGINATION AND STREAMING TESTS
+# ============================================================================
+
+class TestDeckPagination:
+    """Test keyset pagination and NDJSON streaming of the deck."""
+
+    def test_keyset_pagination(self, authenticated_client):
+        """Test walking the deck with after_id and limit."""
+        add_cards(authenticated_client, numbered_cards(5))
+
+        pages = []
+        after_id = 0
+        while after_id is not None:
+            response = authenticated_client.get(f'/api/flashcards?after_id={after_id}&limit=2')
+            data = json.loads(response.data)
+            pages.append([card['character'] for card in data['cards']])
+            after_id = data['nextAfterId']
+
+        assert pages == [['字0', '字1'], ['字2', '字3'], ['字4']]
+
+    def test_invalid_pagination_parameters(self, authenticated_client):
+        """Test invalid after_id and limit values are rejected."""
+        assert authenticated_client.get('/api/flashcards?after_id=-1').status_code == 400
+        assert authenticated_client.get('/api/flashcards?limit=x').status_code == 400
+
+    def test_ndjson_stream(self, authenticated_client):
+        """Test the NDJSON mode returns one card per line."""
+        add_cards(authenticated_client, numbered_cards(3))
+
+        response = authenticated_client.get('/api/flashcards?format=ndjson')
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)['character'] for line in lines] == ['字0', '字1', '字2']
+
+        response = authenticated_client.get('/api/flashcards',
+                                            headers={'Accept': 'application/x-ndjson'})
+        assert len(response.get_data(as_text=True).splitlines()) == 3
+
+
+# ============================================================================
+# CONDITIONAL GET TESTS
+# ============================================================================
+
+class TestDeckEtag:
+    """Test ETag / If-None-Match support on the deck endpoint."""
+
+    def test_not_modified_until_deck_changes(self, authenticated_client):
+        """Test 304 for an unchanged deck and a new ETag after each write."""
+        response = authenticated_client.get('/api/flashcards')
+        etag = response.headers['ETag']
+        assert etag
+
+        response = authenticated_client.get('/api/flashcards', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        card_id = json.loads(response.data)['id']
+
+        now = datetime.now().isoformat()
+        review = {'level': 1, 'lastReview': now, 'nextReview': now,
+                  'correctCount': 1, 'incorrectCount': 0, 'streak': 1}
+
+        etags = {etag}
+        for write in (
+            lambda: authenticated_client.put(f'/api/flashcards/{card_id}', json=review),
+            lambda: authenticated_client.delete(f'/api/flashcards/{card_id}'),
+            lambda: authenticated_client.delete('/api/flashcards/clear'),
+        ):
+            response = authenticated_client.get('/api/flashcards', headers={'If-None-Match': etag})
+            assert response.status_code == 200
+            etag = response.headers['ETag']
+            assert etag not in etags
+            etags.add(etag)
+            write()
+
+    def test_etag_is_per_user(self, client):
+        """Test another user's ETag never matches."""
+        client.post('/api/register', json={'name': 'user1', 'password': 'pass1'})
+        etag = client.get('/api/flashcards').headers['ETag']
+        client.post('/api/logout')
+        client.post('/api/register', json={'name': 'user2', 'password': 'pass2'})
+
+        response = client.get('/api/flashcards', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+
+# ============================================================================
+# DELTA SYNC TESTS
+# ============================================================================
+
+class TestDeltaSync:
+    """Test the incremental changes feed."""
+
+    def test_changes_since_revision(self, authenticated_client):
+        """Test upserts and deletions are reported since a revision."""
+        ids = []
+        for char in ('一', '二', '三'):
+            response = authenticated_client.post('/api/flashcards', json={
+                'character': char, 'pinyin': 'x', 'meaning': 'y'
+            })
+            ids.append(json.loads(response.data)['id'])
+
+        response = authenticated_client.get('/api/flashcards')
+        rev = int(response.headers['X-Deck-Revision'])
+
+        now = datetime.now().isoformat()
+        authenticated_client.put(f'/api/flashcards/{ids[0]}', json={
+            'level': 1, 'lastReview': now, 'nextReview': now,
+            'correctCount': 1, 'incorrectCount': 0, 'streak': 1
+        })
+        authenticated_client.delete(f'/api/flashcards/{ids[1]}')
+        authenticated_client.post('/api/flashcards', json={
+            'character': '四', 'pinyin': 'sì', 'meaning': 'quatre'
+        })
+
+        response = authenticated_client.get(f'/api/flashcards/changes?since={rev}')
+        data = json.loads(response.data)
+        assert data['rev'] == rev + 3
+        assert [card['character'] for card in data['upserted']] == ['一', '四']
+        assert data['upserted'][0]['level'] == 1
+        assert data['deleted'] == [ids[1]]
+
+        response = authenticated_client.get(f"/api/flashcards/changes?since={data['rev']}")
+        data = json.loads(response.data)
+        assert data['upserted'] == [] and data['deleted'] == []
+
+    def test_changes_after_clear(self, authenticated_client):
+        """Test clearing the deck produces a tombstone per card."""
+        add_cards(authenticated_client, numbered_cards(3))
+        cards = json.loads(authenticated_client.get('/api/flashcards').data)
+        authenticated_client.delete('/api/flashcards/clear')
+
+        data = json.loads(authenticated_client.get('/api/flashcards/changes?since=0').data)
+        assert data['upserted'] == []
+        assert sorted(data['deleted']) == [card['id'] for card in cards]
+
+    def test_changes_invalid_revision(self, authenticated_client):
+        """Test malformed and future revisions are rejected."""
+        assert authenticated_client.get('/api/flashcards/changes').status_code == 400
+        assert authenticated_client.get('/api/flashcards/changes?since=99').status_code == 409
+
+
+# ============================================================================
+# SCHEDULER TESTS
+# ============================================================================
+
+class TestScheduler:
+    """Test the scheduling module and the bulk scheduling endpoints."""
+
+    def test_answer_transitions(self):
+        """Test level transitions match the client-side rules."""
+        now = datetime(2024, 1, 1, 12, 0)
+        level, streak, correct, incorrect, last, nxt = scheduler.answer(2, 2, 2, 0, True, now)
+        assert (level, streak, correct, incorrect) == (3, 3, 3, 0)
+        assert nxt == scheduler.format_time(now + timedelta(days=7))
+
+        level, streak, correct, incorrect, last, nxt = scheduler.answer(7, 9, 9, 0, True, now)
+        assert level == scheduler.MAX_LEVEL
+
+        level, streak, correct, incorrect, last, nxt = scheduler.answer(5, 4, 4, 1, False, now)
+        assert (level, streak, incorrect) == (0, 0, 2)
+        assert nxt == last
+
+    def test_parse_time_accepts_client_format(self):
+        """Test UTC timestamps from the browser are parsed."""
+        parsed = scheduler.parse_time('2024-01-01T00:00:00.000Z')
+        assert parsed.tzinfo is None
+
+    def test_due_checks_use_utc_outside_utc(self, authenticated_client, monkeypatch):
+        """Test browser UTC timestamps are due at the right time on a non-UTC server."""
+        import time
+        monkeypatch.setenv('TZ', 'Asia/Tokyo')
+        time.tzset()
+        try:
+            card = authenticated_client.post('/api/flashcards', json={
+                'character': '一', 'pinyin': 'yī', 'meaning': 'un'}).get_json()
+            assert card['nextReview'].endswith('Z')
+            assert authenticated_client.get('/api/flashcards/due/count').get_json() == {'due': 1}
+
+            # Scheduled by the browser (toISOString) three hours ahead
+            later = (datetime.utcnow() + timedelta(hours=3)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            authenticated_client.put(f"/api/flashcards/{card['id']}", json={
+                **card, 'lastReview': '2024-01-01T00:00:00+09:00', 'nextReview': later})
+            assert authenticated_client.get('/api/flashcards/due/count').get_json() == {'due': 0}
+            assert authenticated_client.get('/api/flashcards/due').get_json()['cards'] == []
+
+            stored = authenticated_client.get('/api/flashcards').get_json()[0]
+            assert (stored['lastReview'], stored['nextReview']) == ('2023-12-31T15:00:00.000Z', later)
+            response = authenticated_client.put(f"/api/flashcards/{card['id']}",
+                                                json={**card, 'nextReview': 'demain'})
+            assert response.status_code == 400
+
+            # Naive local timestamps of older databases are converted once
+            cursor = get_db().cursor()
+            cursor.execute("UPDATE user_cards SET next_review = '2024-01-01T09:00:00.123456'")
+            scheduler.migrate_times(cursor)
+            cursor.execute('SELECT next_review FROM user_cards')
+            assert cursor.fetchone()[0] == '2024-01-01T00:00:00.123Z'
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+    def test_rebalance_moves_highest_levels(self):
+        """Test the overflow of tomorrow is spread over the following days."""
+        today = datetime(2024, 1, 1).date()
+        tomorrow = '2024-01-02T09:00:00'
+        rows, unplaced = scheduler.rebalance(
+            [1, 2, 3, 4], [0, 5, 1, 6], [tomorrow] * 3 + ['2024-01-03T09:00:00'],
+            max_per_day=1, horizon_days=4, today=today)
+
+        assert unplaced == 0
+        assert rows == [(scheduler.format_time(datetime(2024, 1, 4, 9)), 3),
+                        (scheduler.format_time(datetime(2024, 1, 5, 9)), 2)]
+
+        rows, unplaced = scheduler.rebalance([1, 2, 3], [0, 1, 2], [tomorrow] * 3,
+                                             max_per_day=1, horizon_days=2, today=today)
+        assert len(rows) == 1 and unplaced == 1
+
+    def test_shift_endpoint(self, authenticated_client):
+        """Test shifting every due date by a number of days."""
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        before = scheduler.parse_time(json.loads(response.data)['nextReview'])
+
+        response = authenticated_client.post('/api/schedule/shift', json={'days': 10})
+        assert json.loads(response.data) == {'updated': 1}
+
+        card = json.loads(authenticated_client.get('/api/flashcards').data)[0]
+        assert scheduler.parse_time(card['nextReview']) - before == timedelta(days=10)
+
+        assert authenticated_client.post('/api/schedule/shift', json={'days': 'x'}).status_code == 400
+
+    def test_reset_endpoint(self, authenticated_client):
+        """Test resetting levels sends every card back to level 0."""
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        card_id = json.loads(response.data)['id']
+        authenticated_client.post('/api/reviews/batch', json={'reviews': [{
+            'id': card_id, 'level': 4, 'streak': 4, 'correctCount': 4, 'incorrectCount': 0,
+            'lastReview': '2024-01-01T00:00:00', 'nextReview': '2999-01-01T00:00:00'
+        }]})
+
+        response = authenticated_client.post('/api/schedule/reset')
+        assert json.loads(response.data) == {'updated': 1}
+
+        card = json.loads(authenticated_client.get('/api/flashcards').data)[0]
+        assert (card['level'], card['streak'], card['correctCount']) == (0, 0, 4)
+
+    def test_rebalance_endpoint_validation(self, authenticated_client):
+        """Test rebalance requires a positive daily cap."""
+        assert authenticated_client.post('/api/schedule/rebalance', json={}).status_code == 400
+        response = authenticated_client.post('/api/schedule/rebalance', json={'maxPerDay': 50})
+        assert json.loads(response.data) == {'moved': 0, 'unplaced': 0}
+
+
+# ============================================================================
+# PASSWORD HASHING TESTS
+# ============================================================================
+
+class TestPasswordHashing:
+    """Test salted password hashing and legacy hash migration."""
+
+    def _stored_hash(self, name):
+        cursor = get_db().cursor()
+        cursor.execute('SELECT password_hash FROM users WHERE name = ?', (name,))
+        return cursor.fetchone()[0]
+
+    def test_hashes_are_salted(self, client):
+        """Test the same password gives different stored hashes."""
+        client.post('/api/register', json={'name': 'a', 'password': 'same'})
+        client.post('/api/register', json={'name': 'b', 'password': 'same'})
+
+        assert self._stored_hash('a') != self._stored_hash('b')
+        assert '$' in self._stored_hash('a')
+
+    def test_legacy_hash_migrates_on_login(self, client):
+        """Test an old SHA-256 hash still logs in and is upgraded."""
+        from passwords import legacy_hash
+        conn = get_db()
+        conn.execute('INSERT INTO users (name, password_hash) VALUES (?, ?)',
+                     ('olduser', legacy_hash('oldpass')))
+        conn.commit()
+
+        response = client.post('/api/login', json={'name': 'olduser', 'password': 'wrong'})
+        assert response.status_code == 401
+        assert self._stored_hash('olduser') == legacy_hash('oldpass')
+
+        response = client.post('/api/login', json={'name': 'olduser', 'password': 'oldpass'})
+        assert response.status_code == 200
+        assert self._stored_hash('olduser') != legacy_hash('oldpass')
+
+        client.post('/api/logout')
+        response = client.post('/api/login', json={'name': 'olduser', 'password': 'oldpass'})
+        assert response.status_code == 200
+
+    def test_busy_hasher_returns_503(self, client, monkeypatch):
+        """Test a full hashing queue is reported instead of queued."""
+        import app as app_module
+        from passwords import PasswordHasher
+        monkeypatch.setattr(app_module, 'password_hasher', PasswordHasher(workers=0, max_pending=0))
+
+        response = client.post('/api/register', json={'name': 'x', 'password': 'y'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
+
+# ============================================================================
+# STATS TESTS
+# ============================================================================
+
+class TestStats:
+    """Test the materialized per-user stats."""
+
+    def _review(self, client, card_id, streak, correct, last_review):
+        client.post('/api/reviews/batch', json={'reviews': [{
+            'id': card_id, 'level': 1, 'streak': streak, 'correctCount': correct,
+            'incorrectCount': 0, 'lastReview': last_review, 'nextReview': last_review
+        }]})
+
+    def test_stats_follow_writes(self, authenticated_client):
+        """Test add, review, delete and clear keep the totals current."""
+        add_cards(authenticated_client, numbered_cards(3))
+        ids = deck_ids(authenticated_client)
+
+        now = datetime.now().isoformat()
+        self._review(authenticated_client, ids[0], 2, 3, now)
+        self._review(authenticated_client, ids[0], 3, 4, now)
+        self._review(authenticated_client, ids[1], 1, 1, '2000-01-01T00:00:00.000Z')
+
+        data = json.loads(authenticated_client.get('/api/stats').data)
+        assert data == {'totalCards': 3, 'totalStreak': 4, 'totalCorrect': 5, 'reviewsToday': 1}
+
+        authenticated_client.delete(f'/api/flashcards/{ids[0]}')
+        data = json.loads(authenticated_client.get('/api/stats').data)
+        assert data == {'totalCards': 2, 'totalStreak': 1, 'totalCorrect': 1, 'reviewsToday': 0}
+
+        authenticated_client.delete('/api/flashcards/clear')
+        data = json.loads(authenticated_client.get('/api/stats').data)
+        assert data == {'totalCards': 0, 'totalStreak': 0, 'totalCorrect': 0, 'reviewsToday': 0}
+
+    def test_consistency_check_and_rebuild(self, authenticated_client):
+        """Test the check detects drift and rebuild repairs it."""
+        authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        conn = get_db()
+        cursor = conn.cursor()
+        assert stats.check(cursor) == []
+
+        cursor.execute('UPDATE user_stats SET card_count = 42')
+        assert len(stats.check(cursor)) == 1
+
+        stats.rebuild(cursor)
+        conn.commit()
+        assert stats.check(cursor) == []
+        assert json.loads(authenticated_client.get('/api/stats').data)['totalCards'] == 1
+
+    def test_stats_unauthenticated(self, client):
+        """Test stats require authentication."""
+        assert client.get('/api/stats').status_code == 401
+
+
+# ============================================================================
+# REVIEW HISTORY TESTS
+# ============================================================================
+
+class TestReviewHistory:
+    """Test the review log, its compaction and the history endpoint."""
+
+    def _answer(self, client, card_id, streak, last_review):
+        client.post('/api/reviews/batch', json={'reviews': [{
+            'id': card_id, 'level': 1, 'streak': streak, 'correctCount': 1,
+            'incorrectCount': 0, 'lastReview': last_review, 'nextReview': last_review
+        }]})
+
+    def test_history_counts_answers_per_day(self, authenticated_client):
+        """Test answers are logged and grouped by day."""
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        card_id = json.loads(response.data)['id']
+
+        now = datetime.now()
+        yesterday = now - timedelta(days=1)
+        self._answer(authenticated_client, card_id, 1, yesterday.isoformat())
+        self._answer(authenticated_client, card_id, 2, now.isoformat())
+        self._answer(authenticated_client, card_id, 0, now.isoformat())
+
+        data = json.loads(authenticated_client.get('/api/history?days=7').data)
+        assert data == [
+            {'day': yesterday.date().isoformat(), 'reviews': 1, 'correct': 1},
+            {'day': now.date().isoformat(), 'reviews': 2, 'correct': 1},
+        ]
+
+    def test_compaction_preserves_history(self, authenticated_client):
+        """Test compaction folds past days into rollups without changing totals."""
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        card_id = json.loads(response.data)['id']
+        for days_ago in (3, 3, 1, 0):
+            when = (datetime.now() - timedelta(days=days_ago)).isoformat()
+            self._answer(authenticated_client, card_id, 1, when)
+
+        before = json.loads(authenticated_client.get('/api/history').data)
+        assert reviewlog.compact(get_db()) == 3
+        after = json.loads(authenticated_client.get('/api/history').data)
+        assert before == after
+
+        cursor = get_db().cursor()
+        cursor.execute('SELECT COUNT(*) FROM review_log')
+        assert cursor.fetchone()[0] == 1
+
+    def test_each_answer_is_logged(self, authenticated_client):
+        """Test every answer sent with a coalesced update is logged."""
+        response = authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        card_id = json.loads(response.data)['id']
+        now = datetime.now().isoformat()
+        response = authenticated_client.post('/api/reviews/batch', json={'reviews': [{
+            'id': card_id, 'level': 1, 'streak': 1, 'correctCount': 2,
+            'incorrectCount': 1, 'lastReview': now, 'nextReview': now,
+            'answers': [
+                {'reviewedAt': now, 'correct': True, 'level': 1},
+                {'reviewedAt': now, 'correct': False, 'level': 0},
+                {'reviewedAt': now, 'correct': True, 'level': 1},
+            ]
+        }]})
+        assert response.status_code == 200
+
+        data = json.loads(authenticated_client.get('/api/history?days=1').data)
+        assert data == [{'day': date.today().isoformat(), 'reviews': 3, 'correct': 2}]
+
+        response = authenticated_client.post('/api/reviews/batch', json={'reviews': [{
+            'id': card_id, 'answers': [{'reviewedAt': 'hier', 'correct': True}]
+        }]})
+        assert response.status_code == 400
+
+    def test_history_reads_log_by_index(self, authenticated_client):
+        """Test history finds a user's raw rows through the (user_id, day) index."""
+        authenticated_client.get('/api/history')
+        cursor = get_db().cursor()
+        cursor.execute('EXPLAIN QUERY PLAN SELECT day FROM review_log WHERE user_id = ? AND day >= ?',
+                       (1, '2024-01-01'))
+        assert 'idx_review_log_user_day' in ' '.join(row[-1] for row in cursor.fetchall())
+
+    def test_buffer_flushes_in_batches(self):
+        """Test the buffer reports when a batch is due."""
+        buffer = reviewlog.ReviewLogBuffer(flush_size=2, flush_interval=3600)
+        row = reviewlog.review_row(1, 1, {'lastReview': '2024-01-01T00:00:00', 'streak': 1})
+        assert buffer.add([row, None]) is False
+        assert buffer.add([row]) is True
+        assert len(buffer) == 2
+
+    def test_history_unauthenticated(self, client):
+        """Test history requires authentication."""
+        assert client.get('/api/history').status_code == 401
+
+
+# ============================================================================
+# LOAD BENCHMARK TESTS
+# ============================================================================
+
+class TestLoadBenchmark:
+    """Smoke test the seeder, the load scenario and report comparison."""
+
+    def test_seeded_sessions_run_without_errors(self, client):
+        """Test a short load run on a seeded database succeeds end to end."""
+        from benchmarks import load, seed
+
+        user_ids = seed.seed(TEST_DATABASE, users=3, cards_per_user=30)
+        cursor = get_db().cursor()
+        cursor.execute('SELECT COUNT(*) FROM flashcards')
+        assert cursor.fetchone()[0] == 90
+        assert stats.check(cursor) == []
+
+        summary = load.run('client', user_ids, sessions=3, threads=2)
+        assert summary['total']['errors'] == 0
+        assert summary['endpoints']['POST /api/login']['count'] == 3
+        assert summary['endpoints']['POST /api/reviews/batch']['count'] == 15
+
+    def test_compare_flags_p99_regressions(self):
+        """Test only p99 slowdowns above the threshold are regressions."""
+        from benchmarks import compare
+
+        def report(p99):
+            return {'endpoints': {'GET /api/stats': {
+                'throughput_rps': 100, 'p50_ms': 1.0, 'p99_ms': p99}}}
+
+        assert compare.compare(report(10.0), report(11.0), 20)[1] == []
+        assert compare.compare(report(10.0), report(15.0), 20)[1] == ['GET /api/stats']
+
+
+# ============================================================================
+# METRICS TESTS
+# ============================================================================
+
+class TestMetrics:
+    """Test request/SQL instrumentation and the /metrics endpoint."""
+
+    def _value(self, text, prefix):
+        for line in text.splitlines():
+            if line.startswith(prefix + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_requests_and_sql_are_counted(self, authenticated_client):
+        """Test requests are labelled by rule and their SQL statements counted."""
+        count = ('flashcards_http_requests_total{method="PUT",'
+                 'endpoint="/api/flashcards/<int:card_id>",status="404"}')
+        statements = ('flashcards_http_request_sql_statements_total{method="PUT",'
+                      'endpoint="/api/flashcards/<int:card_id>"}')
+        before = authenticated_client.get('/metrics').data.decode()
+
+        for card_id in (12345, 67890):
+            response = authenticated_client.put(f'/api/flashcards/{card_id}', json={'level': 1})
+            assert response.status_code == 404
+
+        response = authenticated_client.get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        after = response.data.decode()
+        assert self._value(after, count) - self._value(before, count) == 2
+        assert self._value(after, statements) - self._value(before, statements) >= 2
+        assert 'flashcards_sql_statement_duration_seconds_count{statement="SELECT"}' in after
+        assert '/api/flashcards/12345' not in after
+
+    def test_histogram_buckets(self):
+        """Test samples land in the first bucket whose bound they do not exceed."""
+        from metrics import Histogram
+
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 1]
+        assert histogram.render('h', 'a="b"') == [
+            'h_bucket{a="b",le="0.1"} 2',
+            'h_bucket{a="b",le="1.0"} 3',
+            'h_bucket{a="b",le="+Inf"} 4',
+            'h_sum{a="b"} 3.65',
+            'h_count{a="b"} 4',
+        ]
+
+    def test_failed_statements_are_counted(self):
+        """Test a failing statement is recorded as an SQL error."""
+        import sqlite3
+        from metrics import Metrics
+
+        registry = Metrics()
+        conn = sqlite3.connect(':memory:', factory=registry.connection_factory())
+        conn.execute('CREATE TABLE t (x INTEGER NOT NULL)')
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.executemany('INSERT INTO t VALUES (?)', [(1,), (None,)])
+        conn.close()
+        text = registry.render()
+        assert 'flashcards_sql_errors_total{statement="INSERT"} 1' in text
+        assert 'flashcards_sql_statement_duration_seconds_count{statement="CREATE"} 1' in text
+
+
+# ============================================================================
+# STATIC ASSET TESTS
+# ============================================================================
+
+class TestStaticAssets:
+    """Test fingerprinted, precompressed static assets."""
+
+    def _script_url(self, client, name):
+        page = client.get('/').data.decode()
+        match = re.search(r'src="(/assets/' + re.escape(name) + r'\.[0-9a-f]+\.js)"', page)
+        assert match, page
+        return match.group(1)
+
+    def test_pages_reference_fingerprinted_assets(self, authenticated_client):
+        """Test pages are rewritten to fingerprinted URLs."""
+        page = authenticated_client.get('/').data.decode()
+        assert 'src="script.js"' not in page
+        assert re.search(r'href="/assets/styles\.[0-9a-f]{10}\.css"', page)
+        login = authenticated_client.get('/login.html').data.decode()
+        assert re.search(r'href="/assets/styles\.[0-9a-f]{10}\.css"', login)
+
+    def test_fingerprinted_asset_is_immutable_and_gzipped(self, authenticated_client):
+        """Test fingerprinted assets are cached forever and gzipped on request."""
+        client = authenticated_client
+        url = self._script_url(client, 'script')
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert 'immutable' in response.headers['Cache-Control']
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        with open('script.js', 'rb') as f:
+            assert gzip.decompress(response.data) == f.read()
+
+        plain = client.get(url)
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.data == gzip.decompress(response.data)
+
+    def test_revalidation_and_stale_fingerprints(self, client):
+        """Test unversioned names revalidate and old fingerprints still resolve."""
+        response = client.get('/styles.css')
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'no-cache'
+        etag = response.headers['ETag']
+        assert client.get('/styles.css', headers={'If-None-Match': etag}).status_code == 304
+
+        stale = client.get('/assets/styles.0000000000.css')
+        assert stale.status_code == 200
+        assert stale.headers['Cache-Control'] == 'no-cache'
+        assert stale.data == response.data
+
+    def test_other_files_are_not_served(self, client):
+        """Test only pages and their assets are exposed."""
+        for path in ('/app.py', '/flashcards.db', '/README.md', '/assets/app.py'):
+            assert client.get(path).status_code == 404
+
+
+# ============================================================================
+# APP FACTORY AND SERVER TESTS
+# ============================================================================
+
+class TestAppFactory:
+    """Test create_app() configuration and the pre-forking server."""
+
+    def test_configured_secret_is_shared(self, client):
+        """Test apps created with the same secret accept each other's sessions."""
+        from app import create_app
+
+        first = create_app({'SECRET_KEY': 'shared', 'DATABASE': TEST_DATABASE}).test_client()
+        second = create_app({'SECRET_KEY': 'shared', 'DATABASE': TEST_DATABASE}).test_client()
+        first.post('/api/register', json={'name': 'worker', 'password': 'pass'})
+        second.set_cookie('session', first.get_cookie('session').value)
+        assert json.loads(second.get('/api/check-auth').data)['authenticated'] is True
+
+        other = create_app({'DATABASE': TEST_DATABASE})
+        assert other.config['SECRET_KEY'] != 'shared'
+        assert other.config['SECRET_KEY_GENERATED'] is True
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+    def test_prefork_server_shares_sessions_and_drains(self, tmp_path):
+        """Test workers behind one socket share sessions and exit cleanly on SIGTERM."""
+        import http.cookiejar
+        import signal
+        import subprocess
+        import sys
+        import time
+        import urllib.request
+
+        env = dict(os.environ, FLASHCARDS_SECRET_KEY='prefork-test',
+                   FLASHCARDS_DATABASE=str(tmp_path / 'prefork.db'), PYTHONUNBUFFERED='1')
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'serve',
+             '--host', '127.0.0.1', '--port', '0', '--workers', '2'],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            banner = process.stdout.readline()
+            port = int(re.search(r':(\d+) with 2 workers', banner).group(1))
+            base = f'http://127.0.0.1:{port}'
+            opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            opener.open(urllib.request.Request(
+                base + '/api/register', data=json.dumps({'name': 'u', 'password': 'p'}).encode(),
+                headers={'Content-Type': 'application/json'})).read()
+            for _ in range(6):
+                assert json.loads(opener.open(base + '/api/check-auth').read())['authenticated']
+            # Workers and the hashing pool processes they started
+            descendants = self._descendants(process.pid)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(timeout=15) == 0
+            process.stdout.close()
+
+        # None is left behind, orphaned
+        deadline = time.monotonic() + 5
+        while any(self._alive(pid) for pid in descendants) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not [pid for pid in descendants if self._alive(pid)]
+
+    def _descendants(self, pid):
+        """Pids of the processes below pid, from /proc (empty elsewhere)"""
+        parents = {}
+        for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # "pid (comm) state ppid ...": comm may hold spaces
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (ValueError, OSError):
+                continue
+        found, frontier = [], [pid]
+        while frontier:
+            children = [child for child, parent in parents.items() if parent in frontier]
+            found += children
+            frontier = children
+        return found
+
+    def _alive(self, pid):
+        """True if pid runs (zombies count as gone)"""
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+        except OSError:
+            return False
+
+
+# ============================================================================
+# SHARDING TESTS
+# ============================================================================
+
+class TestSharding:
+    """Test per-user deck shards and the split migration."""
+
+    @pytest.fixture
+    def storage(self, tmp_path):
+        import app as app_module
+        saved = app_module.DATABASE, app_module.SHARD_COUNT
+        close_db_connections()
+        yield str(tmp_path / 'main.db')
+        close_db_connections()
+        app_module.DATABASE, app_module.SHARD_COUNT = saved
+
+    def _user(self, flask_app, name, meanings):
+        client = flask_app.test_client()
+        client.post('/api/register', json={'name': name, 'password': 'pw'})
+        for meaning in meanings:
+            client.post('/api/flashcards', json={'character': '字', 'pinyin': 'zì', 'meaning': meaning})
+        return client
+
+    def _rows(self, path, sql):
+        import sqlite3
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def test_decks_live_in_user_shards(self, storage):
+        """Test each user's cards and review log are stored in their shard only."""
+        from app import create_app
+        import shards
+
+        sharded = create_app({'SECRET_KEY': 'k', 'DATABASE': storage, 'SHARD_COUNT': 2})
+        for name in ('alice', 'bob'):
+            client = self._user(sharded, name, [name])
+            card = client.get('/api/flashcards').get_json()[0]
+            now = datetime.now().isoformat()
+            client.post('/api/reviews/batch', json={'reviews': [{
+                'id': card['id'], 'level': 1, 'streak': 1, 'correctCount': 1,
+                'incorrectCount': 0, 'lastReview': now, 'nextReview': now}]})
+            assert client.get('/api/stats').get_json()['totalCards'] == 1
+        close_db_connections()
+
+        # alice is user 1 (shard 1), bob user 2 (shard 0)
+        shard0, shard1 = shards.shard_paths(storage, 2)
+        assert self._rows(shard0, 'SELECT meaning FROM flashcards') == [('bob',)]
+        assert self._rows(shard1, 'SELECT meaning FROM flashcards') == [('alice',)]
+        assert self._rows(shard0, 'SELECT user_id FROM review_log') == [(2,)]
+        assert self._rows(shard1, 'SELECT user_id FROM review_log') == [(1,)]
+        assert self._rows(storage, "SELECT name FROM sqlite_master WHERE name = 'flashcards'") == []
+
+    def test_split_existing_database(self, storage):
+        """Test split-shards moves existing decks and records the new layout."""
+        from app import create_app
+
+        plain = create_app({'SECRET_KEY': 'k', 'DATABASE': storage, 'SHARD_COUNT': 0})
+        self._user(plain, 'alice', ['un', 'deux'])
+        self._user(plain, 'bob', ['trois'])
+
+        result = plain.test_cli_runner().invoke(args=['split-shards', '--count', '2', '--drop-source'])
+        assert result.exit_code == 0, result.output
+        assert 'user_cards: 3 rows copied' in result.output
+        assert self._rows(storage, 'SELECT COUNT(*) FROM flashcards') == [(0,)]
+
+        # The layout is checked on first use, not when the app is created
+        stale = create_app({'SECRET_KEY': 'k', 'DATABASE': storage, 'SHARD_COUNT': 0})
+        result = stale.test_cli_runner().invoke(args=['migrate'])
+        assert result.exit_code != 0 and 'split-shards' in result.output
+        with pytest.raises(RuntimeError):
+            get_db()
+
+        sharded = create_app({'SECRET_KEY': 'k', 'DATABASE': storage, 'SHARD_COUNT': 2})
+        client = sharded.test_client()
+        client.post('/api/login', json={'name': 'alice', 'password': 'pw'})
+        assert [c['meaning'] for c in client.get('/api/flashcards').get_json()] == ['un', 'deux']
+        assert client.get('/api/stats').get_json()['totalCards'] == 2
+
+    def test_deleted_ids_stay_unused_after_split(self, storage):
+        """Test a card added after the split does not reuse a deleted card's id."""
+        from app import create_app
+
+        plain = create_app({'SECRET_KEY': 'k', 'DATABASE': storage, 'SHARD_COUNT': 0})
+        client = self._user(plain, 'alice', ['un', 'deux', 'trois'])
+        deleted = client.get('/api/flashcards').get_json()[-1]['id']
+        client.delete(f'/api/flashcards/{deleted}')
+        result = plain.test_cli_runner().invoke(args=['split-shards', '--count', '2'])
+        assert result.exit_code == 0, result.output
+
+        sharded = create_app({'SECRET_KEY': 'k', 'DATABASE': storage, 'SHARD_COUNT': 2})
+        client = sharded.test_client()
+        client.post('/api/login', json={'name': 'alice', 'password': 'pw'})
+        card_id = client.post('/api/flashcards', json={
+            'character': '四', 'pinyin': 'sì', 'meaning': 'quatre'}).get_json()['id']
+        assert card_id > deleted
+        assert client.get('/api/flashcards/changes?since=0').get_json()['deleted'] == [deleted]
+        assert client.delete(f'/api/flashcards/{card_id}').status_code == 200
+
+
+# ============================================================================
+# DECK CACHE TESTS
+# ============================================================================
+
+class TestDeckCache:
+    """Test the in-process cache of encoded decks."""
+
+    def test_repeated_loads_hit_and_writes_invalidate(self, authenticated_client):
+        """Test a second load is served from cache and a write refreshes it."""
+        from app import deck_cache
+
+        authenticated_client.post('/api/flashcards', json={
+            'character': '一', 'pinyin': 'yī', 'meaning': 'un'
+        })
+        hits, misses = deck_cache.hits, deck_cache.misses
+        first = authenticated_client.get('/api/flashcards')
+        second = authenticated_client.get('/api/flashcards')
+        assert (deck_cache.hits - hits, deck_cache.misses - misses) == (1, 1)
+        assert second.data == first.data
+        assert second.headers['ETag'] == first.headers['ETag']
+
+        authenticated_client.post('/api/flashcards', json={
+            'character': '二', 'pinyin': 'èr', 'meaning': 'deux'
+        })
+        assert len(deck_cache) == 0
+        cards = json.loads(authenticated_client.get('/api/flashcards').data)
+        assert [card['meaning'] for card in cards] == ['un', 'deux']
+
+    def test_stale_revision_misses(self):
+        """Test an entry only serves the revision it was built from."""
+        from deckcache import DeckCache
+
+        cache = DeckCache()
+        cache.put(1, 5, b'[]')
+        assert cache.get(1, 5) == b'[]'
+        assert cache.get(1, 6) is None
+
+    def test_size_bounded_lru_eviction(self):
+        """Test least recently used decks are evicted to stay under the budget."""
+        from deckcache import DeckCache
+
+        cache = DeckCache(max_bytes=80)
+        for user_id in (1, 2, 3):
+            cache.put(user_id, 0, b'x' * 10)
+        cache.get(1, 0)
+        for user_id in (4, 5, 6, 7, 8, 9):
+            cache.put(user_id, 0, b'x' * 10)
+        assert cache.size <= 80
+        assert cache.get(1, 0) is not None
+        assert cache.get(2, 0) is None
+        assert cache.evictions == 1
+
+        cache.put(10, 0, b'x' * 11)  # above max_bytes / 8: not cached
+        assert cache.get(10, 0) is None
+
+
+# ============================================================================
+# SESSION STORE TESTS
+# ============================================================================
+
+class TestSessionStore:
+    """Test server-side sessions, their expiry and cleanup."""
+
+    def _sessions(self):
+        cursor = get_db().cursor()
+        cursor.execute('SELECT sid, expires FROM sessions')
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def test_cookie_carries_only_the_session_id(self, authenticated_client):
+        """Test session data is stored server-side, keyed by the cookie."""
+        import sessions
+
+        sid = authenticated_client.get_cookie('session').value
+        assert sessions.SID_PATTERN.match(sid)
+        assert list(self._sessions()) == [sid]
+
+    def test_login_rotates_and_logout_deletes(self, authenticated_client):
+        """Test a new id is issued on login and the session is removed on logout."""
+        registered = authenticated_client.get_cookie('session').value
+        authenticated_client.post('/api/logout')
+        assert self._sessions() == {}
+
+        authenticated_client.post('/api/login', json={'name': 'testuser', 'password': 'testpass123'})
+        assert authenticated_client.get_cookie('session').value != registered
+        assert len(self._sessions()) == 1
+
+    def test_sessions_survive_a_restart(self, authenticated_client):
+        """Test another app instance with another secret accepts the session."""
+        from app import create_app
+
+        restarted = create_app({'SECRET_KEY': 'other', 'DATABASE': TEST_DATABASE}).test_client()
+        restarted.set_cookie('session', authenticated_client.get_cookie('session').value)
+        assert json.loads(restarted.get('/api/check-auth').data)['authenticated'] is True
+
+    def test_sliding_expiry_and_purge(self, authenticated_client):
+        """Test use pushes expiry back and expired sessions are purged."""
+        interface = app.session_interface
+        (sid, expires), = self._sessions().items()
+        conn = get_db()
+        conn.execute('UPDATE sessions SET expires = ? WHERE sid = ?', (expires - 3600, sid))
+        conn.commit()
+        interface._forget(sid)
+
+        authenticated_client.get('/api/check-auth')
+        assert self._sessions()[sid] > expires - 60
+
+        conn.execute('UPDATE sessions SET expires = 0')
+        conn.commit()
+        interface._forget(sid)
+        result = app.test_cli_runner().invoke(args=['purge-sessions'])
+        assert '1 expired sessions deleted' in result.output
+        assert json.loads(authenticated_client.get('/api/check-auth').data)['authenticated'] is False
+
+    def test_session_writes_do_not_commit_unfinished_writes(self, authenticated_client):
+        """Test a session write rolls back what the request left uncommitted."""
+        conn = get_db()
+        conn.execute("UPDATE users SET name = 'half-done'")
+        assert conn.in_transaction
+        authenticated_client.post('/api/logout')
+        assert conn.execute('SELECT name FROM users').fetchone()[0] == 'testuser'
+
+    def test_file_store(self, client, tmp_path):
+        """Test the file-backed store keeps sessions across app instances."""
+        from app import create_app
+
+        config = {'SECRET_KEY': 'k', 'DATABASE': TEST_DATABASE,
+                  'SESSION_STORE': 'file', 'SESSION_FILE_DIR': str(tmp_path)}
+        first = create_app(config).test_client()
+        first.post('/api/register', json={'name': 'filer', 'password': 'pw'})
+        sid = first.get_cookie('session').value
+        assert os.listdir(tmp_path) == [sid]
+
+        second = create_app(config).test_client()
+        second.set_cookie('session', sid)
+        assert json.loads(second.get('/api/check-auth').data)['user_name'] == 'filer'
+
+
+# ============================================================================
+# MULTIPLE-CHOICE QUIZ TESTS
+# ============================================================================
+
+class TestMultipleChoiceQuiz:
+    """Test server-generated quizzes and the distractor index."""
+
+    def test_quiz_needs_four_cards(self, authenticated_client):
+        """Test a deck too small for four choices is rejected."""
+        add_cards(authenticated_client, [('一', 'yī', 'un'), ('二', 'èr', 'deux')])
+        response = authenticated_client.get('/api/quiz/multiple-choice')
+        assert response.status_code == 400
+        assert authenticated_client.get('/api/quiz/multiple-choice?n=x').status_code == 400
+
+    def test_questions_follow_due_order_with_distinct_choices(self, authenticated_client):
+        """Test questions come from the due queue with the answer among four meanings."""
+        add_cards(authenticated_client, [
+            ('马', 'mǎ', 'cheval'), ('妈', 'mā', 'maman'), ('吗', 'ma', 'particule'),
+            ('骂', 'mà', 'gronder'), ('你好', 'nǐ hǎo', 'bonjour'), ('谢谢', 'xiè xie', 'merci'),
+        ])
+        cards = json.loads(authenticated_client.get('/api/flashcards').data)
+        due = cards[4]
+        authenticated_client.put(f"/api/flashcards/{due['id']}", json={
+            **due, 'nextReview': '2000-01-01T00:00:00'
+        })
+
+        response = authenticated_client.get('/api/quiz/multiple-choice?n=3')
+        assert response.status_code == 200
+        questions = json.loads(response.data)['questions']
+        assert len(questions) == 3
+        assert questions[0]['card']['id'] == due['id']
+        for question in questions:
+            assert len(set(question['choices'])) == 4
+            assert question['choices'][question['answer']] == question['card']['meaning']
+
+    def test_same_syllable_distractors_first(self, authenticated_client):
+        """Test cards sharing the toneless first syllable are preferred."""
+        add_cards(authenticated_client, [
+            ('马', 'mǎ', 'cheval'), ('妈', 'mā', 'maman'), ('吗', 'ma5', 'particule'),
+            ('骂', 'mà', 'gronder'), ('你', 'nǐ', 'tu'), ('我', 'wǒ', 'je'), ('他', 'tā', 'il'),
+        ])
+        cursor = get_db().cursor()
+        cursor.execute('SELECT id FROM flashcards WHERE character = ?', ('马',))
+        card_id = cursor.fetchone()[0]
+        cursor.execute('SELECT DISTINCT syllable FROM quiz_index WHERE card_id IN '
+                       '(SELECT id FROM flashcards WHERE character IN (?, ?, ?, ?))',
+                       ('马', '妈', '吗', '骂'))
+        assert [row[0] for row in cursor.fetchall()] == ['ma']
+
+        import quiz
+        for _ in range(5):
+            chosen = quiz.distractors(cursor, 1, card_id, 'cheval')
+            assert sorted(chosen) == ['gronder', 'maman', 'particule']
+
+    def test_index_follows_card_writes(self, authenticated_client):
+        """Test the quiz index tracks inserts, content edits and deletions."""
+        add_cards(authenticated_client, [('你好', 'Nǐ hǎo', 'bonjour')])
+        cursor = get_db().cursor()
+        cursor.execute('SELECT card_id, syllable, char_length FROM quiz_index')
+        card_id, syllable, length = cursor.fetchone()
+        assert (syllable, length) == ('ni', 2)
+
+        get_db().execute('UPDATE flashcards SET character = ?, pinyin = NULL, zhuyin = ? WHERE id = ?',
+                         ('好', 'ㄏㄠˇ', card_id))
+        cursor.execute('SELECT syllable, char_length FROM quiz_index')
+        assert tuple(cursor.fetchone()) == (None, 1)
+
+        authenticated_client.delete(f'/api/flashcards/{card_id}')
+        cursor.execute('SELECT COUNT(*) FROM quiz_index')
+        assert cursor.fetchone()[0] == 0
+
+
+# ============================================================================
+# DECK FORMAT TESTS
+# ============================================================================
+
+class TestDeckFormats:
+    """Test columnar and MessagePack decks, field projection and gzip."""
+
+    def test_columns_and_projection(self, authenticated_client):
+        """Test one array per field, restricted to the requested fields."""
+        add_cards(authenticated_client, numbered_cards(2))
+        response = authenticated_client.get('/api/flashcards', headers={
+            'Accept': 'application/vnd.flashcards.columns+json'
+        })
+        assert response.mimetype == 'application/vnd.flashcards.columns+json'
+        columns = json.loads(response.data)
+        assert columns['character'] == ['字0', '字1']
+        assert len(columns) == 11
+
+        response = authenticated_client.get('/api/flashcards?format=columns&fields=meaning,character')
+        assert list(json.loads(response.data)) == ['character', 'meaning']
+
+        cards = json.loads(authenticated_client.get('/api/flashcards?fields=id,pinyin').data)
+        assert [list(card) for card in cards] == [['id', 'pinyin']] * 2
+
+    def test_variants_have_their_own_etag(self, authenticated_client):
+        """Test each representation revalidates against its own ETag."""
+        add_cards(authenticated_client, numbered_cards(1))
+        plain = authenticated_client.get('/api/flashcards')
+        columns = authenticated_client.get('/api/flashcards?format=columns')
+        assert plain.headers['ETag'] != columns.headers['ETag']
+
+        response = authenticated_client.get('/api/flashcards?format=columns', headers={
+            'If-None-Match': columns.headers['ETag']
+        })
+        assert response.status_code == 304
+        response = authenticated_client.get('/api/flashcards', headers={
+            'If-None-Match': columns.headers['ETag']
+        })
+        assert response.status_code == 200
+
+    def test_invalid_format_or_fields(self, authenticated_client):
+        """Test unknown formats and fields are rejected."""
+        assert authenticated_client.get('/api/flashcards?format=xml').status_code == 400
+        assert authenticated_client.get('/api/flashcards?fields=character,secret').status_code == 400
+
+    def test_large_decks_are_gzipped(self, authenticated_client):
+        """Test gzip above the size threshold, for clients that accept it."""
+        add_cards(authenticated_client, numbered_cards(1))
+        small = authenticated_client.get('/api/flashcards', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+
+        add_cards(authenticated_client, numbered_cards(50))
+        plain = authenticated_client.get('/api/flashcards')
+        assert 'Content-Encoding' not in plain.headers
+        for _ in range(2):  # built, then from the deck cache
+            response = authenticated_client.get('/api/flashcards', headers={'Accept-Encoding': 'gzip'})
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert 'Accept-Encoding' in response.headers['Vary']
+            assert response.headers['ETag'] == plain.headers['ETag'][:-1] + '-gz"'
+            assert gzip.decompress(response.data) == plain.data
+
+        page = authenticated_client.get('/api/flashcards?limit=60&format=columns',
+                                        headers={'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(page.data))
+        assert len(data['cards']['id']) == 51
+        assert data['nextAfterId'] is None
+
+    def test_msgpack(self, authenticated_client):
+        """Test the MessagePack encoding of the columns."""
+        msgpack = pytest.importorskip('msgpack')
+        add_cards(authenticated_client, numbered_cards(2))
+        response = authenticated_client.get('/api/flashcards?fields=character',
+                                            headers={'Accept': 'application/msgpack'})
+        assert response.mimetype == 'application/msgpack'
+        assert msgpack.unpackb(response.data) == {'character': ['字0', '字1']}
+
+
+# ============================================================================
+# CARD CATALOG TESTS
+# ============================================================================
+
+class TestCardCatalog:
+    """Test the shared card catalog, shared decks and the in-place migration."""
+
+    def _count(self, table):
+        return get_db().execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def test_identical_content_is_stored_once(self, client):
+        """Test two users adding the same card share one catalog row."""
+        card = {'character': '你好', 'pinyin': 'nǐ hǎo', 'meaning': 'bonjour'}
+        ids = []
+        for name in ('alice', 'bob'):
+            client.post('/api/register', json={'name': name, 'password': 'pw'})
+            ids.append(client.post('/api/flashcards', json=card).get_json()['id'])
+            client.post('/api/logout')
+        assert (self._count('cards'), self._count('user_cards')) == (1, 2)
+
+        client.post('/api/login', json={'name': 'alice', 'password': 'pw'})
+        client.delete(f'/api/flashcards/{ids[0]}')
+        client.post('/api/logout')
+        client.post('/api/login', json={'name': 'bob', 'password': 'pw'})
+        deck = client.get('/api/flashcards').get_json()
+        assert [(c['id'], c['character'], c['meaning']) for c in deck] == [(ids[1], '你好', 'bonjour')]
+
+    def test_shared_deck_import(self, authenticated_client, tmp_path):
+        """Test loading a shared deck and importing it into a deck once."""
+        csv_file = tmp_path / 'hsk1.csv'
+        csv_file.write_text('一,yī,un\n二,èr,deux\n三,sān,trois\nincomplet\n', encoding='utf-8')
+        result = app.test_cli_runner().invoke(args=['load-shared-deck', 'HSK 1', str(csv_file)])
+        assert result.exit_code == 0, result.output
+        assert 'HSK 1: 3 cards' in result.output
+
+        authenticated_client.post('/api/flashcards', json={'character': '二', 'pinyin': 'èr', 'meaning': 'deux'})
+        decks = authenticated_client.get('/api/shared-decks').get_json()['decks']
+        assert decks == [{'name': 'HSK 1', 'cardCount': 3}]
+
+        response = authenticated_client.post('/api/shared-decks/HSK 1/import')
+        assert response.get_json() == {'inserted': 2}
+        assert authenticated_client.post('/api/shared-decks/HSK 1/import').get_json() == {'inserted': 0}
+        assert authenticated_client.post('/api/shared-decks/HSK 9/import').status_code == 404
+
+        deck = authenticated_client.get('/api/flashcards').get_json()
+        assert sorted(card['meaning'] for card in deck) == ['deux', 'trois', 'un']
+        assert authenticated_client.get('/api/stats').get_json()['totalCards'] == 3
+        assert self._count('cards') == 3
+
+    def test_migrates_legacy_table_in_place(self, tmp_path):
+        """Test a flashcards table from before the split is converted, ids included."""
+        import sqlite3
+        import app as app_module
+        from app import create_app
+
+        path = str(tmp_path / 'legacy.db')
+        conn = sqlite3.connect(path)
+        conn.executescript('''
+            CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL,
+                                password_hash TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE flashcards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+                character TEXT NOT NULL, pinyin TEXT, zhuyin TEXT, meaning TEXT NOT NULL,
+                level INTEGER DEFAULT 0, last_review TIMESTAMP, next_review TIMESTAMP NOT NULL,
+                correct_count INTEGER DEFAULT 0, incorrect_count INTEGER DEFAULT 0,
+                streak INTEGER DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            INSERT INTO users (name, password_hash) VALUES ('alice', 'x'), ('bob', 'x');
+            INSERT INTO flashcards (user_id, character, pinyin, meaning, level, streak, next_review) VALUES
+                (1, '一', 'yī', 'un', 2, 3, '2024-01-01T00:00:00'),
+                (2, '一', 'yī', 'un', 0, 0, '2024-01-01T00:00:00'),
+                (2, '二', 'èr', 'deux', 1, 1, '2024-01-01T00:00:00'),
+                (2, '三', 'sān', 'trois', 0, 0, '2024-01-01T00:00:00');
+            DELETE FROM flashcards WHERE id = 4;
+        ''')
+        conn.commit()
+        conn.close()
+
+        saved = app_module.DATABASE, app_module.SHARD_COUNT
+        close_db_connections()
+        try:
+            create_app({'SECRET_KEY': 'k', 'DATABASE': path, 'SHARD_COUNT': 0})
+            cursor = get_db().cursor()
+            cursor.execute("SELECT type FROM sqlite_master WHERE name = 'flashcards'")
+            assert cursor.fetchone()[0] == 'view'
+            cursor.execute('SELECT id, user_id, character, level, streak FROM flashcards ORDER BY id')
+            assert [tuple(row) for row in cursor.fetchall()] == [
+                (1, 1, '一', 2, 3), (2, 2, '一', 0, 0), (3, 2, '二', 1, 1)]
+            assert self._count('cards') == 2
+            assert stats.get(cursor, 1)['totalStreak'] == 3
+
+            # The deleted card's id is not reused
+            cursor.execute("INSERT INTO flashcards (user_id, character, pinyin, meaning, next_review) "
+                           "VALUES (1, '四', 'sì', 'quatre', '2024-01-01T00:00:00')")
+            cursor.execute("SELECT id FROM flashcards WHERE character = '四'")
+            assert cursor.fetchone()[0] == 5
+            assert stats.get(cursor, 1)['totalCards'] == 2
+        finally:
+            close_db_connections()
+            app_module.DATABASE, app_module.SHARD_COUNT = saved
+
+
+# ============================================================================
+# CARD SEARCH TESTS
+# ============================================================================
+
+class TestCardSearch:
+    """Test full-text card search."""
+
+    def _search(self, client, query):
+        response = client.get('/api/flashcards/search', query_string={'q': query})
+        assert response.status_code == 200
+        return response.get_json()
+
+    def test_pinyin_ignores_tones_and_spaces(self, authenticated_client):
+        """Test marked, numbered, plain and unspaced pinyin all match."""
+        add_cards(authenticated_client, [('你好', 'nǐ hǎo', 'bonjour'), ('谢谢', 'xiè xie', 'merci')])
+        for query in ('nihao', 'ni hao', 'ni3 hao3', 'nǐ hǎo', 'NI', '你'):
+            cards = self._search(authenticated_client, query)['cards']
+            assert [card['character'] for card in cards] == ['你好'], query
+
+    def test_prefix_ranking_and_pagination(self, authenticated_client):
+        """Test prefix terms and nextOffset paging."""
+        add_cards(authenticated_client, [
+            ('马', 'mǎ', 'cheval'), ('妈', 'mā', 'maman'), ('骂', 'mà', 'gronder'),
+            ('猫', 'māo', 'chat'), ('吗', 'ma', 'particule'),
+        ])
+        assert len(self._search(authenticated_client, 'ma')['cards']) == 5
+        assert [c['meaning'] for c in self._search(authenticated_client, 'chev')['cards']] == ['cheval']
+
+        response = authenticated_client.get('/api/flashcards/search?q=ma&limit=2')
+        page = response.get_json()
+        assert len(page['cards']) == 2 and page['nextOffset'] == 2
+        seen = [card['id'] for card in page['cards']]
+        while page['nextOffset'] is not None:
+            page = authenticated_client.get(
+                f"/api/flashcards/search?q=ma&limit=2&offset={page['nextOffset']}").get_json()
+            seen += [card['id'] for card in page['cards']]
+        assert len(set(seen)) == 5
+
+    def test_results_follow_deck_changes_and_owner(self, client):
+        """Test deleted cards and other users' cards are never returned."""
+        client.post('/api/register', json={'name': 'alice', 'password': 'pw'})
+        add_cards(client, [('你好', 'nǐ hǎo', 'bonjour'), ('您好', 'nín hǎo', 'bonjour poli')])
+        card_id = self._search(client, 'nin')['cards'][0]['id']
+        client.delete(f'/api/flashcards/{card_id}')
+        assert [c['character'] for c in self._search(client, 'bonjour')['cards']] == ['你好']
+        client.post('/api/logout')
+
+        client.post('/api/register', json={'name': 'bob', 'password': 'pw'})
+        assert self._search(client, 'bonjour') == {'cards': [], 'nextOffset': None}
+
+    def test_terms_do_not_match_owner_token(self, authenticated_client):
+        """Test a query like the owner token only finds cards whose text matches."""
+        add_cards(authenticated_client, [('你好', 'nǐ hǎo', 'bonjour'), ('五', 'wǔ', 'cinq')])
+        for query in ('u', 'u1', 'U1'):
+            assert self._search(authenticated_client, query)['cards'] == [], query
+        add_cards(authenticated_client, [('有', 'yǒu', 'avoir')])
+        assert [c['character'] for c in self._search(authenticated_client, 'u')['cards']] == []
+        add_cards(authenticated_client, [('雨', 'yǔ', 'une pluie')])
+        assert [c['character'] for c in self._search(authenticated_client, 'u')['cards']] == ['雨']
+
+    def test_invalid_parameters(self, authenticated_client):
+        """Test a missing query or a bad limit or offset is rejected."""
+        for query in ('', 'q=', 'q=%22%22', 'q=a&offset=-1', 'q=a&limit=x'):
+            response = authenticated_client.get(f'/api/flashcards/search?{query}')
+            assert response.status_code == 400, query
+
+
+# ============================================================================
+# EXPORT TESTS
+# ============================================================================
+
+class TestExport:
+    """Test streamed deck exports."""
+
+    CARDS = [
+        {'character': '你好', 'pinyin': 'nǐ hǎo', 'meaning': 'bonjour, salut'},
+        {'character': '说', 'zhuyin': 'ㄕㄨㄛ', 'meaning': 'dire "parler"'},
+    ]
+
+    def test_csv_quotes_fields_and_reimports(self, authenticated_client):
+        """Test the CSV export quotes commas and quotes and reads back as an import."""
+        import io
+        from app import parse_csv
+
+        add_cards(authenticated_client, self.CARDS)
+        response = authenticated_client.get('/api/flashcards/export')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert 'attachment' in response.headers['Content-Disposition']
+        assert response.get_data(as_text=True) == (
+            '你好,nǐ hǎo,,"bonjour, salut"\n'
+            '说,,ㄕㄨㄛ,"dire ""parler"""\n'
+        )
+        rows = [card for _, card in parse_csv(io.BytesIO(response.data))]
+        assert rows == [('你好', 'nǐ hǎo', '', 'bonjour, salut'), ('说', '', 'ㄕㄨㄛ', 'dire "parler"')]
+
+    def test_tsv_and_anki_formats(self, authenticated_client):
+        """Test the tab-separated formats and the Anki header."""
+        add_cards(authenticated_client, self.CARDS)
+        tsv = authenticated_client.get('/api/flashcards/export?format=tsv').get_data(as_text=True)
+        assert tsv.splitlines()[0] == '你好\tnǐ hǎo\t\tbonjour, salut'
+        anki = authenticated_client.get('/api/flashcards/export?format=apkg-like').get_data(as_text=True)
+        assert anki.splitlines()[:4] == ['#separator:tab', '#html:false',
+                                         '#columns:Character\tPinyin\tZhuyin\tMeaning',
+                                         '你好\tnǐ hǎo\t\tbonjour, salut']
+        assert authenticated_client.get('/api/flashcards/export?format=xls').status_code == 400
+
+    def test_gzip_stream(self, authenticated_client, monkeypatch):
+        """Test the export is gzipped on request and streamed in batches."""
+        import app as app_module
+        monkeypatch.setattr(app_module, 'STREAM_BATCH_SIZE', 1)
+        add_cards(authenticated_client, self.CARDS)
+        response = authenticated_client.get('/api/flashcards/export',
+                                            headers={'Accept-Encoding': 'gzip'})
+        assert response.is_streamed
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data).decode().count('\n') == 2
+
+
+# ============================================================================
+# BATCH DELETE TESTS
+# ============================================================================
+
+class TestBatchDelete:
+    """Test batch deletion and the chunked clear."""
+
+    def test_delete_batch(self, client):
+        """Test owned cards are deleted with tombstones and the others reported."""
+        client.post('/api/register', json={'name': 'alice', 'password': 'pw'})
+        add_cards(client, numbered_cards(1))
+        other = deck_ids(client)
+        client.post('/api/logout')
+        client.post('/api/register', json={'name': 'bob', 'password': 'pw'})
+        add_cards(client, numbered_cards(4))
+        ids = deck_ids(client)
+
+        response = client.post('/api/flashcards/delete-batch',
+                               json={'ids': [ids[0], ids[2], ids[0], other[0], 999]})
+        assert response.status_code == 200
+        assert response.get_json() == {'deleted': 2, 'missing': [other[0], 999]}
+
+        assert [card['id'] for card in client.get('/api/flashcards').get_json()] == [ids[1], ids[3]]
+        assert client.get('/api/stats').get_json()['totalCards'] == 2
+        data = client.get('/api/flashcards/changes?since=0').get_json()
+        assert sorted(data['deleted']) == [ids[0], ids[2]]
+
+    def test_delete_batch_invalid(self, authenticated_client, monkeypatch):
+        """Test malformed and oversized id lists are rejected."""
+        import app as app_module
+        monkeypatch.setattr(app_module, 'DELETE_BATCH_MAX', 2)
+        for body in ({}, {'ids': 'x'}, {'ids': [1, 'a']}, {'ids': [1, 2, 3]}, {'ids': [True]}):
+            response = authenticated_client.post('/api/flashcards/delete-batch', json=body)
+            assert response.status_code == 400, body
+
+    def test_deleting_nothing_keeps_the_revision(self, authenticated_client):
+        """Test deletes matching none of the user's cards leave the ETag alone."""
+        add_cards(authenticated_client, numbered_cards(1))
+        ids = deck_ids(authenticated_client)
+        etag = authenticated_client.get('/api/flashcards').headers['ETag']
+        authenticated_client.delete('/api/flashcards/99999')
+        authenticated_client.post('/api/flashcards/delete-batch', json={'ids': [99999]})
+        response = authenticated_client.get('/api/flashcards')
+        assert response.headers['ETag'] == etag
+        assert [card['id'] for card in response.get_json()] == ids
+
+    def test_clear_in_chunks(self, authenticated_client, monkeypatch):
+        """Test the deck is cleared one committed revision per chunk."""
+        import app as app_module
+        monkeypatch.setattr(app_module, 'PURGE_CHUNK_SIZE', 2)
+        monkeypatch.setattr(app_module, 'PURGE_PAUSE_SECONDS', 0)
+        add_cards(authenticated_client, numbered_cards(5))
+        ids = deck_ids(authenticated_client)
+        rev = int(authenticated_client.get('/api/flashcards').headers['X-Deck-Revision'])
+
+        response = authenticated_client.delete('/api/flashcards/clear')
+        assert response.get_json() == {'success': True, 'deleted': 5}
+
+        response = authenticated_client.get('/api/flashcards')
+        assert response.get_json() == []
+        assert int(response.headers['X-Deck-Revision']) == rev + 3
+        data = authenticated_client.get(f'/api/flashcards/changes?since={rev}').get_json()
+        assert sorted(data['deleted']) == ids
+        assert authenticated_client.get('/api/stats').get_json()['totalCards'] == 0
+
+
+# ============================================================================
+# SCHEMA MIGRATION TESTS
+# ============================================================================
+
+class TestSchemaMigrations:
+    """Test versioned migrations and lazy database setup."""
+
+    @pytest.fixture
+    def fresh(self, tmp_path):
+        """Path of a database that does not exist yet; restores the app's database."""
+        import app as app_module
+        saved = app_module.DATABASE, app_module.SHARD_COUNT
+        close_db_connections()
+        yield str(tmp_path / 'fresh.db')
+        close_db_connections()
+        app_module.DATABASE, app_module.SHARD_COUNT = saved
+
+    def _versions(self, cursor):
+        cursor.execute('SELECT scope, version FROM schema_version ORDER BY scope, version')
+        return [tuple(row) for row in cursor.fetchall()]
+
+    def test_database_is_migrated_on_first_use(self, fresh):
+        """Test creating the app opens no database and the first request migrates it."""
+        from app import create_app, DECK_MIGRATIONS
+
+        created = create_app({'SECRET_KEY': 'k', 'DATABASE': fresh, 'SHARD_COUNT': 0})
+        assert not os.path.exists(fresh)
+
+        client = created.test_client()
+        assert client.post('/api/register', json={'name': 'alice', 'password': 'pw'}).status_code == 200
+        assert self._versions(get_db().cursor()) == (
+            [('decks', step[0]) for step in DECK_MIGRATIONS] + [('users', 1)])
+
+        # Current schema: nothing to apply
+        assert init_db() == {fresh: []}
+
+    def test_new_steps_are_applied_once(self, fresh, monkeypatch):
+        """Test an appended index step is applied by migrate, then skipped."""
+        import app as app_module
+        import migrations
+
+        created = app_module.create_app({'SECRET_KEY': 'k', 'DATABASE': fresh, 'SHARD_COUNT': 0})
+        runner = created.test_cli_runner()
+        assert runner.invoke(args=['migrate']).exit_code == 0
+
+        step = (len(app_module.DECK_MIGRATIONS) + 1, 'idx_user_cards_level',
+                migrations.create_index('idx_user_cards_level', 'user_cards (user_id, level)'))
+        monkeypatch.setattr(app_module, 'DECK_MIGRATIONS', app_module.DECK_MIGRATIONS + [step])
+        result = runner.invoke(args=['migrate'])
+        assert result.exit_code == 0
+        assert f'{fresh}: idx_user_cards_level' in result.output
+        assert '1 migration steps applied' in result.output
+        assert '0 migration steps applied' in runner.invoke(args=['migrate']).output
+
+        cursor = get_db().cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_user_cards_level'")
+        assert cursor.fetchone() is not None
+
+    def test_failed_step_is_rolled_back(self, fresh, monkeypatch):
+        """Test a failing step leaves neither its changes nor its version behind."""
+        import app as app_module
+
+        def broken(cursor):
+            cursor.execute('CREATE TABLE half_done (id INTEGER)')
+            raise ValueError('boom')
+
+        step = (len(app_module.DECK_MIGRATIONS) + 1, 'broken', broken)
+        monkeypatch.setattr(app_module, 'DECK_MIGRATIONS', app_module.DECK_MIGRATIONS + [step])
+        app_module.create_app({'SECRET_KEY': 'k', 'DATABASE': fresh, 'SHARD_COUNT': 0})
+        with pytest.raises(ValueError):
+            init_db()
+
+        cursor = app_module.db_pool.get(fresh).cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'")
+        assert cursor.fetchone() is None
+        assert ('decks', step[0]) not in self._versions(cursor)
+        assert ('decks', step[0] - 1) in self._versions(cursor)
+
+
+# ============================================================================
+# CONNECTION POOL TESTS
+# ============================================================================
+
+class TestConnectionPool:
+    """Test pooled connections are returned and reused across threads."""
+
+    def test_requests_on_new_threads_reuse_connections(self, client):
+        """Test a threaded server (one thread per request) does not open a connection each."""
+        import threading
+        import urllib.request
+        from http.cookiejar import CookieJar
+        from werkzeug.serving import make_server
+        import app as app_module
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+            opener.open(urllib.request.Request(
+                f'{base_url}/api/register', data=json.dumps({'name': 'alice', 'password': 'pw'}).encode(),
+                headers={'Content-Type': 'application/json'}))
+            for _ in range(50):
+                assert opener.open(f'{base_url}/api/stats').status == 200
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert len(app_module.db_pool) <= 4
+
+    def test_idle_connections_are_bounded(self, tmp_path):
+        """Test connections released beyond max_idle are closed."""
+        from db import ConnectionPool
+        pool = ConnectionPool(max_idle=2)
+        path = str(tmp_path / 'pool.db')
+        connections = [pool.get(path) for _ in range(5)]
+        connections[0].execute('CREATE TABLE t (x)')
+        connections[0].execute('INSERT INTO t VALUES (1)')
+        for conn in connections:
+            pool.release(conn)
+        assert len(pool) == 2
+        reused = pool.get(path)
+        assert reused in connections and not reused.in_transaction
+        pool.close_all()
+        assert len(pool) == 0
+
+
 # ============================================================================
 # INTEGRATION TESTS
 # ============================================================================